@@ -85,12 +85,15 @@ def create_blog_post(subject: str):
         logger.error(f"Invalid outline generated: {outline}")
         return None
     
-    sections = {}
-    for section in outline["sections"]:
-        logger.info(f"Processing section: {section}")
-        content = openai_llm.write_section(section=section, topic=selected_topic, style_guide=style_guide)
-        improved_content = anthropic_llm.review_section(section=content, style_guide=style_guide)
-        sections[section] = improved_content
+    # Sections are written and reviewed independently, so each step is packed into as few requests as possible
+    logger.info(f"Processing sections: {outline['sections']}")
+    contents = openai_llm.write_section.batch(
+        [{"section": section, "topic": selected_topic, "style_guide": style_guide} for section in outline["sections"]]
+    )
+    improved_contents = anthropic_llm.review_section.batch(
+        [{"section": content, "style_guide": style_guide} for content in contents]
+    )
+    sections = dict(zip(outline["sections"], improved_contents))
     
     titles = openai_llm.generate_titles(topic=selected_topic)
     
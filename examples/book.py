@@ -5,7 +5,9 @@ import json
 from typing import Dict, Any, List
 from pydantic import BaseModel, Field
 from tenacity import retry, stop_after_attempt, wait_exponential
-from smartllm import SmartLLM
+from smartllm import SmartLLM, tracing
+from smartllm.speculation import Speculator
+from smartllm.artifacts import ArtifactRef, ArtifactStore
 from collections import defaultdict
 
 # Set up logging
@@ -15,6 +17,11 @@ logger = logging.getLogger(__name__)
 openai_llm = SmartLLM(provider_id="openai", model_id="chatgpt-4o-latest")
 anthropic_llm = SmartLLM(provider_id="anthropic", model_id="claude-3-sonnet-20240229")
 
+# Outline and glossary updates start on the pre-review draft and are kept if the rewrite stays close to it
+speculator = Speculator(threshold={"new_chapter": 0.85}, waste_budget=5)
+# Chapter texts are passed between functions as refs to files under book/artifacts, one copy per version
+artifact_store = ArtifactStore("book/artifacts")
+
 class BookStructure(BaseModel):
     title: str = Field(description="Book title")
     chapters: List[Dict[str, Any]] = Field(description="List of chapters with their details", max_length=10)
@@ -51,7 +58,9 @@ def improve_structure(llm_response: BookStructure, structure: Dict[str, Any]) ->
     return llm_response.model_dump()
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-@openai_llm.configure("Write a one-page chapter for '{chapter}' in the book about {topic}, covering the following points: {points}. Follow the style guide: {style_guide}. Consider the global outline: {global_outline}. Reference the previous chapter if applicable: {previous_chapter}. Use terms from the glossary: {terminology_glossary}")
+@openai_llm.configure("Write a one-page chapter for '{chapter}' in the book about {topic}, covering the following points: {points}. Follow the style guide: {style_guide}. Consider the global outline: {global_outline}. Reference the previous chapter if applicable: {previous_chapter}. Use terms from the glossary: {terminology_glossary}",
+                      # Only the style guide is fixed for the whole book; the outline and glossary change after every chapter
+                      prefix_params=["style_guide"], artifacts=artifact_store)
 def write_chapter(llm_response: ChapterContent, chapter: str, topic: str, points: List[str], style_guide: str, global_outline: str, previous_chapter: str, terminology_glossary: Dict[str, str]) -> str:
     logger.debug(f"Writing chapter: {chapter}")
     return llm_response.content
@@ -61,7 +70,8 @@ def review_chapter(llm_response: ChapterReview, chapter: str) -> Dict[str, Any]:
     logger.debug("Reviewing chapter")
     return llm_response.model_dump()
 
-@openai_llm.configure("Rewrite the following chapter based on the review and improvements: {original_chapter}\n\nReview: {review}\nImprovements: {improvements}")
+@openai_llm.configure("Rewrite the following chapter based on the review and improvements: {original_chapter}\n\nReview: {review}\nImprovements: {improvements}",
+                      edit_param="original_chapter", artifacts=artifact_store)
 def rewrite_chapter(llm_response: ChapterContent, original_chapter: str, review: str, improvements: str) -> str:
     logger.debug("Rewriting chapter based on review")
     return llm_response.content
@@ -101,7 +111,8 @@ def update_terminology_glossary(llm_response: TerminologyGlossary, glossary: Dic
     logger.debug("Updating terminology glossary")
     return llm_response.glossary
 
-@openai_llm.configure("Add inter-chapter references to the content based on the global outline: {global_outline}")
+@openai_llm.configure("Add inter-chapter references to the following content based on the global outline: {global_outline}\n\nContent:\n{content}",
+                      edit_param="content", artifacts=artifact_store)
 def add_inter_chapter_references(llm_response: ChapterContent, content: str, global_outline: str) -> str:
     logger.debug("Adding inter-chapter references")
     return llm_response.content
@@ -111,16 +122,18 @@ def perform_final_consistency_check(llm_response: str, chapters: Dict[str, Dict[
     logger.debug("Performing final consistency check")
     return llm_response.strip()
 
-@openai_llm.configure("Compare the following two chapters and rewrite them to reduce overlap and improve flow. Ensure key concepts are preserved while eliminating repetition:\n\nChapter 1:\n{chapter1}\n\nChapter 2:\n{chapter2}")
-def smooth_chapters(llm_response: Dict[str, str], chapter1: str, chapter2: str) -> Dict[str, str]:
+@openai_llm.configure("Compare the following two chapters and rewrite them to reduce overlap and improve flow. Ensure key concepts are preserved while eliminating repetition:\n\nChapter 1:\n{chapter1}\n\nChapter 2:\n{chapter2}",
+                      artifacts=artifact_store)
+def smooth_chapters(llm_response: Dict[str, str], chapter1: str, chapter2: str) -> Dict[str, ArtifactRef]:
     logger.debug("Smoothing chapters to reduce overlap")
-    return llm_response
+    return {name: artifact_store.put(text) for name, text in llm_response.items()}
 
 @openai_llm.configure("Create a detailed content plan for a book about {topic} with the following structure: {structure}. For each chapter, provide a list of specific topics to cover. Then, create a topic distribution showing which chapters each major topic appears in. Ensure topics are well-distributed and avoid unnecessary repetition.")
 def create_content_plan(llm_response: ContentPlan, topic: str, structure: Dict[str, Any]) -> Dict[str, Any]:
     logger.debug(f"Creating content plan for topic: {topic}")
     return llm_response.model_dump()
 
+@tracing.traced
 def create_book(topic: str) -> Dict[str, Any]:
     try:
         logger.debug(f"Creating book on topic: {topic}")
@@ -188,6 +201,19 @@ def create_book(topic: str) -> Dict[str, Any]:
             
             time.sleep(1)
             
+            outline_update = speculator.speculate(
+                openai_llm.update_global_outline,
+                global_outline=global_outline,
+                new_chapter=content,
+                response_format=GlobalOutline
+            )
+            glossary_update = speculator.speculate(
+                openai_llm.update_terminology_glossary,
+                glossary=terminology_glossary,
+                new_chapter=content,
+                response_format=TerminologyGlossary
+            )
+
             review = anthropic_llm.review_chapter(
                 chapter=content,
                 response_format=ChapterReview
@@ -199,8 +225,8 @@ def create_book(topic: str) -> Dict[str, Any]:
                 response_format=ChapterContent
             )
             
-            global_outline = openai_llm.update_global_outline(global_outline=global_outline, new_chapter=rewritten_content, response_format=GlobalOutline)
-            terminology_glossary = openai_llm.update_terminology_glossary(glossary=terminology_glossary, new_chapter=rewritten_content, response_format=TerminologyGlossary)
+            global_outline = outline_update.resolve(new_chapter=rewritten_content)
+            terminology_glossary = glossary_update.resolve(new_chapter=rewritten_content)
             rewritten_content = openai_llm.add_inter_chapter_references(content=rewritten_content, global_outline=global_outline, response_format=ChapterContent)
             
             if previous_chapter:
@@ -238,6 +264,10 @@ def create_book(topic: str) -> Dict[str, Any]:
             terminology_glossary=terminology_glossary
         )
         
+        logger.info(f"Speculation stats: {speculator.stats.as_dict()}")
+        logger.info(f"Edit mode stats: rewrite_chapter={rewrite_chapter.edit_stats.as_dict()}, "
+                    f"add_inter_chapter_references={add_inter_chapter_references.edit_stats.as_dict()}")
+        logger.info(f"Artifacts of this run: {artifact_store.root} (run {artifact_store.run_id})")
         logger.debug("Book creation completed")
         return {
             "structure": improved_structure,
@@ -254,6 +284,8 @@ def create_book(topic: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 if __name__ == "__main__":
+    # Inspect with: python -m smartllm.tracing report book_trace.jsonl
+    tracing.enable(tracing.JSONLExporter("book_trace.jsonl"))
     openai_llm.clear_function_calls()
     anthropic_llm.clear_function_calls()
     book = create_book("Artificial Intelligence Ethics")
@@ -30,11 +30,12 @@ def create_presentation() -> List[Dict[str, str]]:
             logger.warning("Failed to create outline. Returning empty presentation.")
             return []
 
-        slides = []
-        for slide_title in outline:
-            content = llm.generate_slide_content(slide_title=slide_title, response_format=SlideContent)
-            slides.append({"title": slide_title, "content": content})
-        return slides
+        # Slides are independent, so they are packed into as few requests as the token budget allows
+        contents = llm.generate_slide_content.batch(
+            [{"slide_title": slide_title} for slide_title in outline],
+            response_format=SlideContent
+        )
+        return [{"title": title, "content": content} for title, content in zip(outline, contents)]
     except Exception as e:
         logger.error(f"Error in create_presentation: {str(e)}")
         return []
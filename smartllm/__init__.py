@@ -1,2 +1,4 @@
 from .core import SmartLLM
 from .drivers import OpenAIDriver, AnthropicDriver
+from .usage import UsageTracker, BudgetExceededError, track_run
+from .drivers.circuit_breaker import CircuitOpenError, circuit_breakers
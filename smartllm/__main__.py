@@ -0,0 +1,39 @@
+import argparse
+import importlib
+import logging
+from typing import List, Optional
+
+from .serving import serve
+
+logger = logging.getLogger(__name__)
+
+
+def load_target(target: str):
+    """Resolve "module:attribute" to the SmartLLM instance it names."""
+    module_name, _, attribute = target.partition(":")
+    if not attribute:
+        raise ValueError(f"Expected module:attribute, got: {target}")
+    obj = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m smartllm", description="SmartLLM command line")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    server = subparsers.add_parser("serve", help="Expose the configured functions of a SmartLLM instance over HTTP")
+    server.add_argument("target", help="module:attribute of the SmartLLM instance, e.g. examples.book:llm")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8000)
+    server.add_argument("--max-concurrency", type=int, default=8, help="Calls running at once")
+    server.add_argument("--max-queue", type=int, default=64, help="Calls waiting for a slot before returning 429")
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        llm = load_target(args.target)
+        logger.info(f"Serving {len(llm.functions)} functions on {args.host}:{args.port}")
+        serve(llm, host=args.host, port=args.port, max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from .context import get_call_context
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactRef:
+    """A handle to a text in an ArtifactStore.
+
+    Refs are cheap to keep and pass around: the text is only read when the ref is rendered, for example
+    when a prompt is formatted with it or it is serialized inside a structured argument.
+    """
+
+    __slots__ = ("store", "digest", "size")
+
+    def __init__(self, store: "ArtifactStore", digest: str, size: int):
+        self.store = store
+        self.digest = digest
+        self.size = size
+
+    @property
+    def text(self) -> str:
+        return self.store.read(self.digest)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __format__(self, spec: str) -> str:
+        return format(self.text, spec)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __eq__(self, other: Any) -> bool:
+        # Refs only compare with refs; compare `ref.text` with a string
+        if isinstance(other, ArtifactRef):
+            return self.digest == other.digest
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __copy__(self) -> "ArtifactRef":
+        return self
+
+    def __deepcopy__(self, memo) -> "ArtifactRef":
+        # Immutable, and copying would copy the whole store
+        return self
+
+    def __repr__(self) -> str:
+        return f"ArtifactRef({self.digest[:12]}, {self.size} chars)"
+
+
+@dataclass
+class ArtifactRecord:
+    """One input or output of a configured function call, as listed in a run manifest."""
+    timestamp: float
+    function: str
+    kind: str
+    name: str
+    digest: str
+    format: str
+    size: int = 0
+    # Short texts are written into the manifest instead of an object file
+    text: Optional[str] = None
+
+    def load(self, store: "ArtifactStore") -> Any:
+        text = self.text if self.text is not None else store.read(self.digest)
+        return json.loads(text) if self.format == "json" else text
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """Content-addressed store for the texts a workflow passes between configured functions.
+
+    Each distinct text is written once to `root/objects`, under its SHA-256, and read back through a
+    memory map when rendered. Recently used texts are also kept in an LRU of at most `memory_bytes`, so
+    memory use stays flat however many texts a run produces. Texts shorter than `inline_chars` are not
+    worth a file of their own: they stay in memory and are written into the manifest line that records
+    them. Every recorded call is appended to the manifest of the current run (see `track_run`), which
+    `load_run` reads back in a later process.
+    """
+
+    def __init__(self, root: str = ".smartllm/artifacts", memory_bytes: int = 4 * 1024 * 1024,
+                 run_id: Optional[str] = None, inline_chars: int = 256):
+        self.root = root
+        self.memory_bytes = memory_bytes
+        self.inline_chars = inline_chars
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_used = 0
+        self._inline: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "runs"), exist_ok=True)
+
+    def put(self, text: Any) -> ArtifactRef:
+        if isinstance(text, ArtifactRef):
+            return text
+        if not isinstance(text, str):
+            raise TypeError(f"Artifacts are texts, got {type(text).__name__}")
+        digest = _digest(text)
+        if self._is_inline(len(text)):
+            with self._lock:
+                self._inline[digest] = text
+            return ArtifactRef(self, digest, len(text))
+        path = self._path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(text.encode("utf-8"))
+            os.replace(tmp_path, path)
+        self._remember(digest, text)
+        return ArtifactRef(self, digest, len(text))
+
+    def get(self, digest: str, size: Optional[int] = None) -> ArtifactRef:
+        return ArtifactRef(self, digest, size if size is not None else len(self.read(digest)))
+
+    def read(self, digest: str) -> str:
+        with self._lock:
+            text = self._inline.get(digest)
+            if text is not None:
+                return text
+            text = self._memory.get(digest)
+            if text is not None:
+                self._memory.move_to_end(digest)
+                return text
+        path = self._path(digest)
+        if not os.path.exists(path):
+            raise KeyError(f"No artifact {digest} in {self.root}")
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = mapped[:].decode("utf-8")
+        self._remember(digest, text)
+        return text
+
+    def _remember(self, digest: str, text: str):
+        # Approximate size; texts bigger than a quarter of the budget are always read from their file
+        size = len(text)
+        if size > self.memory_bytes // 4:
+            return
+        with self._lock:
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+                return
+            self._memory[digest] = text
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    def record(self, function: str, kind: str, name: str, value: Any) -> Any:
+        """Store a call's input or output and list it in the run manifest. String values come back as refs."""
+        if isinstance(value, (str, ArtifactRef)):
+            ref, fmt = self.put(value), "text"
+        else:
+            if hasattr(value, "model_dump"):
+                value_json = value.model_dump(mode="json")
+            else:
+                value_json = value
+            ref, fmt = self.put(json.dumps(value_json, sort_keys=True, default=str)), "json"
+        inline = ref.text if self._is_inline(len(ref)) else None
+        self._append(ArtifactRecord(time.time(), function, kind, name, ref.digest, fmt, len(ref), inline))
+        return ref if fmt == "text" else value
+
+    def record_call(self, function: str, kwargs: Dict[str, Any], output: Any) -> Any:
+        """Record a configured function's arguments and result; a string result is returned as a ref."""
+        for name, value in kwargs.items():
+            self.record(function, "input", name, value)
+        return self.record(function, "output", "result", output)
+
+    def current_run(self) -> str:
+        run = get_call_context().get("run")
+        return run.run_id if run is not None else self.run_id
+
+    def runs(self) -> List[str]:
+        return sorted(name[:-len(".jsonl")] for name in os.listdir(os.path.join(self.root, "runs"))
+                      if name.endswith(".jsonl"))
+
+    def load_run(self, run_id: Optional[str] = None) -> List[ArtifactRecord]:
+        """The manifest of a run, in call order; `record.load(store)` reads an artifact back."""
+        path = self._manifest_path(run_id or self.run_id)
+        if not os.path.exists(path):
+            raise KeyError(f"No run {run_id} in {self.root}")
+        with open(path) as f:
+            records = [ArtifactRecord(**json.loads(line)) for line in f if line.strip()]
+        with self._lock:
+            # Inline texts have no object file, so `get` and `read` find them here
+            self._inline.update((record.digest, record.text) for record in records if record.text is not None)
+        return records
+
+    def outputs(self, function: str, run_id: Optional[str] = None) -> List[ArtifactRef]:
+        """Refs to the results of every call to `function` in a run."""
+        return [self.get(record.digest, record.size) for record in self.load_run(run_id)
+                if record.function == function and record.kind == "output"]
+
+    def _is_inline(self, size: int) -> bool:
+        return size < self.inline_chars
+
+    def _append(self, record: ArtifactRecord):
+        fields = asdict(record)
+        if fields["text"] is None:
+            del fields["text"]
+        line = json.dumps(fields) + "\n"
+        with self._lock, open(self._manifest_path(self.current_run()), "a") as f:
+            f.write(line)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest)
+
+    def _manifest_path(self, run_id: str) -> str:
+        return os.path.join(self.root, "runs", f"{run_id}.jsonl")
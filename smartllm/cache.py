@@ -0,0 +1,236 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import weakref
+import zlib
+from typing import Any, Optional, Type, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+_ERROR_PREFIXES = ("Error", "Bad Request Error")
+
+
+class HashingEmbedder:
+    """Embeds text locally by hashing word unigrams and bigrams into a fixed-size vector."""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            # Use the top bit as sign so that collisions tend to cancel out
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class VectorIndex:
+    """Bounded cosine-similarity index with LRU eviction, optionally persisted to a memory-mapped file."""
+
+    def __init__(self, dim: int, capacity: int = 1024, path: Optional[str] = None):
+        if capacity <= 0:
+            raise ValueError("Index capacity must be positive")
+        self.dim = dim
+        self.capacity = capacity
+        self.path = path
+        self.values: list = [None] * capacity
+        self.scopes: list = [None] * capacity
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+
+        if path:
+            meta = self._load_meta()
+            mode = "r+" if meta is not None and os.path.exists(path) else "w+"
+            self.vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+            if meta is not None:
+                self._restore(meta)
+            logger.debug(f"VectorIndex mapped to {path} ({int(self.valid.sum())} entries)")
+        else:
+            self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return int(self.valid.sum())
+
+    def search(self, vector: np.ndarray, scope: str = ""):
+        """Return (slot, score) of the most similar entry in `scope`, or (None, 0.0) if there is none."""
+        candidates = self.valid & np.fromiter((s == scope for s in self.scopes), dtype=bool, count=self.capacity)
+        if not candidates.any():
+            return None, 0.0
+        scores = self.vectors @ vector
+        scores[~candidates] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def get(self, slot: int) -> Any:
+        self._clock += 1
+        self.last_used[slot] = self._clock
+        return self.values[slot]
+
+    def add(self, vector: np.ndarray, value: Any, scope: str = "") -> int:
+        free = np.flatnonzero(~self.valid)
+        if free.size:
+            slot = int(free[0])
+        else:
+            slot = int(np.argmin(self.last_used))
+            logger.debug(f"VectorIndex full, evicting slot {slot}")
+        self._clock += 1
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.scopes[slot] = scope
+        self.valid[slot] = True
+        self.last_used[slot] = self._clock
+        return slot
+
+    def clear(self):
+        self.valid[:] = False
+        self.values = [None] * self.capacity
+        self.scopes = [None] * self.capacity
+
+    def flush(self):
+        if not self.path:
+            return
+        self.vectors.flush()
+        meta = {
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "clock": self._clock,
+            "entries": [
+                {"slot": int(slot), "last_used": int(self.last_used[slot]), "scope": self.scopes[slot],
+                 "value": self.values[slot]}
+                for slot in np.flatnonzero(self.valid)
+            ],
+        }
+        tmp_path = f"{self.path}.meta.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, f"{self.path}.meta.json")
+
+    def _load_meta(self) -> Optional[dict]:
+        meta_path = f"{self.path}.meta.json"
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("capacity") != self.capacity:
+            logger.warning(f"Ignoring cache at {self.path}: shape does not match dim={self.dim}, capacity={self.capacity}")
+            return None
+        return meta
+
+    def _restore(self, meta: dict):
+        self._clock = meta["clock"]
+        for entry in meta["entries"]:
+            slot = entry["slot"]
+            self.values[slot] = entry["value"]
+            self.scopes[slot] = entry.get("scope", "")
+            self.valid[slot] = True
+            self.last_used[slot] = entry["last_used"]
+
+
+class SemanticCache:
+    """Returns cached results for prompts that are near-duplicates of earlier ones.
+
+    Entries only match within the same scope. Configured functions use their prompt template as the scope
+    and embed just the argument values, so the shared template text cannot make different topics look alike.
+
+    A persisted cache writes its entries to disk every `flush_every` stores, on `flush()` or `close()`, and
+    at interpreter exit. Results that cannot be written as JSON are not cached when `path` is set.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, embedder: Optional[HashingEmbedder] = None,
+                 path: Optional[str] = None, flush_every: int = 100):
+        self.threshold = threshold
+        self.embedder = embedder or HashingEmbedder()
+        self.index = VectorIndex(self.embedder.dim, capacity=max_entries, path=path)
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self._unflushed = 0
+        self._lock = threading.Lock()
+        if path:
+            atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def lookup(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None, scope: str = "") -> Any:
+        vector = self.embedder.embed(prompt)
+        with self._lock:
+            slot, score = self.index.search(vector, scope)
+            if slot is None or score < self.threshold:
+                self.misses += 1
+                return None
+            value = self.index.get(slot)
+            self.hits += 1
+        logger.debug(f"Semantic cache hit (similarity={score:.3f})")
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel) and isinstance(value, dict):
+            try:
+                return response_format.model_validate(value)
+            except Exception as e:
+                logger.warning(f"Cached value does not match {response_format.__name__}: {e}")
+                return None
+        return value
+
+    def store(self, prompt: str, result: Any, response_format: Union[Type[BaseModel], str, None] = None,
+              scope: str = ""):
+        if result is None:
+            return
+        if isinstance(result, BaseModel):
+            result = result.model_dump(mode="json")
+        elif isinstance(result, str) and (result.startswith(_ERROR_PREFIXES) or (
+                isinstance(response_format, type) and issubclass(response_format, BaseModel))):
+            # Drivers report failures as strings, never cache those
+            return
+        if self.index.path and not _json_serializable(result):
+            logger.debug(f"Not caching a {type(result).__name__} result, it cannot be persisted as JSON")
+            return
+        vector = self.embedder.embed(prompt)
+        with self._lock:
+            self.index.add(vector, result, scope)
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Write any pending entries to disk."""
+        self.flush()
+
+    def _flush(self):
+        if self._unflushed:
+            self.index.flush()
+            self._unflushed = 0
+
+    def clear(self):
+        with self._lock:
+            self.index.clear()
+            self._unflushed += 1
+            self.hits = 0
+            self.misses = 0
+
+
+def _json_serializable(value: Any) -> bool:
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _flush_at_exit(cache_ref: "weakref.ref[SemanticCache]"):
+    cache = cache_ref()
+    if cache is not None:
+        cache.flush()
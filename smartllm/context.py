@@ -0,0 +1,24 @@
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict
+
+_call_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("smartllm_call_context", default={})
+
+
+class StreamCancelled(Exception):
+    """Raised by an `on_delta` callback once the consumer of a streaming call has gone away."""
+
+
+def get_call_context() -> Dict[str, Any]:
+    """Return the attributes (function, caller, run, ...) of the LLM call currently in progress."""
+    return _call_context.get()
+
+
+@contextmanager
+def call_context(**fields: Any):
+    """Layer attributes onto the current call context for the duration of the block."""
+    token = _call_context.set({**_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
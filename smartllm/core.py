@@ -1,50 +1,149 @@
 import functools
 import inspect
 import logging
+import time
 from pydantic import BaseModel
-from typing import Callable, Optional, Dict, List, Union, Type, Any
+from typing import Callable, Optional, Dict, List, Tuple, Union, Type, Any
 from .drivers.base import LLMDriver
 from .driver_factory import DriverFactory
 from .visualization import graph
 from .drivers import OpenAIDriver, AnthropicDriver
+from .cache import SemanticCache
+from .serialization import ArgumentSerializer
+from .context import call_context
+from .usage import UsageTracker
+from .middleware import LLMRequest, Middleware, MiddlewarePipeline, as_middleware
+from . import tracing
+from .drivers.base import Usage
+from .packing import PackPlanner, build_packed_prompt, options_key, split_packed_result
+from .editing import EditMode
+from .session import Session, current_session, record_exchange
+from .tools import ToolSet
+from .artifacts import ArtifactStore
 
 logger = logging.getLogger(__name__)
 
+
+def _annotate_span_usage(usage: Usage):
+    span = tracing.current_span()
+    if span is not None:
+        span.add_to_attribute("input_tokens", usage.input_tokens)
+        span.add_to_attribute("output_tokens", usage.output_tokens)
+        span.add_to_attribute("cached_tokens", usage.cached_tokens)
+        span.add_to_attribute("cache_write_tokens", usage.cache_write_tokens)
+
+
+def _response_model(func: Callable) -> Optional[Type[BaseModel]]:
+    """The Pydantic model a configured function declares for its llm_response parameter, if any."""
+    parameters = list(inspect.signature(func).parameters.values())
+    annotation = parameters[0].annotation if parameters else None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    return None
+
+
+def _driver_kwargs(request: LLMRequest) -> Dict[str, Any]:
+    """Keyword arguments for driver.generate: generation options and the request-level fields.
+
+    The prompt arguments in `request.kwargs` are already formatted into the prompt and never reach the
+    driver, so a parameter named like a driver keyword (`messages`, `prefix`, `tools`, ...) cannot collide.
+    """
+    kwargs = dict(request.options)
+    if request.prefix:
+        kwargs["prefix"] = request.prefix
+    if request.messages:
+        kwargs["messages"] = request.messages
+    if request.tools is not None:
+        kwargs["tools"] = request.tools
+    return kwargs
+
+
+def _extract_prefix(rendered: Dict[str, Any], prefix_params: List[str]) -> Optional[str]:
+    """Move the stable arguments out of the prompt into a prefix block, leaving a reference in their place."""
+    sections = []
+    for name in prefix_params:
+        if name in rendered:
+            sections.append(f"## {name}\n{rendered[name]}")
+            rendered[name] = f"(see {name} above)"
+    return "\n\n".join(sections) or None
+
+
+def _cache_text(rendered: Dict[str, Any]) -> str:
+    return "\n".join(f"{name}: {rendered[name]}" for name in sorted(rendered))
+
+
+def _annotate_function_span(span: Optional[tracing.Span], kwargs: dict, result: Any, cache_hit: bool):
+    # Digests let the trace report link each call to the calls whose outputs it consumed
+    if span is not None:
+        span.set_attribute("cache_hit", cache_hit)
+        span.set_attribute("input_digests", [tracing.digest(v) for v in kwargs.values()])
+        span.set_attribute("output_digests", tracing.output_digests(result))
+
+
 class SmartLLM:
-    def __init__(self, provider_id: str, model_id: str):
+    def __init__(self, provider_id: str, model_id: str, **driver_options):
         logger.debug(f"Initializing SmartLLM with provider_id: {provider_id}, model_id: {model_id}")
-        self.driver = DriverFactory.create(provider_id, model_id)
+        self.provider_id = provider_id
+        self.model_id = model_id
+        self.driver = DriverFactory.create(provider_id, model_id, **driver_options)
+        self.middlewares: List[Middleware] = []
         self.functions: Dict[str, Callable] = {}
         self.function_calls: Dict[str, List[str]] = {}
+        self.usage = UsageTracker()
+        self.tools = ToolSet()
+        # Looked up per call, so the tracker can be replaced, e.g. with one that keeps more records
+        self.driver.add_usage_listener(lambda usage: self.usage.record(usage))
+        self.driver.add_usage_listener(_annotate_span_usage)
         
         logger.debug(f"SmartLLM instance created with {provider_id} provider and {model_id} model")
 
-    def configure(self, prompt: str, **kwargs):
+    def configure(self, prompt: str, semantic_cache: Union[bool, float, SemanticCache, None] = None,
+                  serialize: Union[str, Dict[str, str], ArgumentSerializer, None] = "json",
+                  packing: Optional[PackPlanner] = None, prefix_params: Optional[List[str]] = None,
+                  structured_output: Optional[str] = None, validators: Optional[List[Callable]] = None,
+                  edit_param: Optional[str] = None, artifacts: Optional[ArtifactStore] = None, **kwargs):
         logger.debug(f"Configuring function with prompt: {prompt}")
+        cache = self._make_semantic_cache(semantic_cache)
+        serializer = ArgumentSerializer.from_setting(serialize)
+        planner = packing or PackPlanner()
+        editor = EditMode(edit_param) if edit_param else None
+        # Remaining keyword arguments are generation options such as temperature, sent with every call
+        driver_options = dict(kwargs)
+        if structured_output:
+            driver_options["structured_output"] = structured_output
+        if validators:
+            # Checked by drivers that can retry, such as the cascade driver; ignored by the others
+            driver_options["validators"] = list(validators)
         def decorator(func: Callable):
-            @functools.wraps(func)
-            def wrapper(*args, **kwargs):
-                # Get the caller's name automatically
-                caller = inspect.currentframe().f_back.f_code.co_name
-                response_format = kwargs.pop('response_format', None)
+            if edit_param and edit_param not in inspect.signature(func).parameters:
+                raise ValueError(f"edit_param {edit_param} is not a parameter of {func.__name__}")
+            # Calls without an explicit response_format use the model llm_response is annotated with
+            default_format = _response_model(func)
+
+            def prepare(caller: str, kwargs: dict) -> LLMRequest:
+                response_format = kwargs.pop('response_format', None) or default_format
                 logger.debug(f"Caller: {caller}, Response format: {response_format}")
-                
-                # Format the prompt
-                formatted_prompt = prompt.format(**kwargs)
-                logger.debug(f"Formatted prompt: {formatted_prompt}")
-                
-                # Generate the response
-                
-                result = self.driver.generate(formatted_prompt, response_format=response_format, **kwargs)
-                logger.debug(f"Generated result: {result}")
-                
+
+                # Format the prompt, rendering structured arguments compactly
+                rendered = serializer.render_all(kwargs)
+                # The semantic cache compares argument values only, within this function's template
+                metadata = {"cache_key": _cache_text(rendered)} if cache else {}
+                prefix = _extract_prefix(rendered, prefix_params) if prefix_params else None
+                formatted_prompt = prompt.format(**rendered)
+                logger.debug("Formatted prompt: %s", formatted_prompt)
+                return LLMRequest(formatted_prompt, response_format, kwargs, function=func.__name__, caller=caller,
+                                  model=self.model_id, metadata=metadata, prefix=prefix, options=driver_options)
+
+            def finish(request: LLMRequest, result: Any, args: tuple, kwargs: dict) -> Any:
+                caller, response_format = request.caller, request.response_format
+                logger.debug("Generated result: %s", result)
+
                 # Record the function call
                 if caller not in self.function_calls:
                     self.function_calls[caller] = []
                 self.function_calls[caller].append(func.__name__)
                 logger.debug(f"Recorded function call: {caller} -> {func.__name__}")
-                logger.debug(f"Function {func.__name__} called by {caller}")
-                
+
                 # If result is a string but we expected a Pydantic model, try to create an empty instance
                 if isinstance(result, str) and response_format and issubclass(response_format, BaseModel):
                     logger.debug("Attempting to create empty Pydantic model instance")
@@ -53,17 +152,127 @@ class SmartLLM:
                         logger.debug("Successfully created empty Pydantic model instance")
                     except:
                         logger.warning("Failed to create empty Pydantic model instance, using string result")
-                
+
                 # Call the original function with the LLM result
                 logger.debug(f"Calling original function: {func.__name__}")
-                return func(result, *args, **kwargs)
-            
+                output = func(result, *args, **kwargs)
+                if artifacts is not None:
+                    # A string result is handed back as a ref to the stored text
+                    inputs = dict(zip(list(inspect.signature(func).parameters)[1:], args), **kwargs)
+                    output = artifacts.record_call(func.__name__, inputs, output)
+                return output
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                # Get the caller's name automatically, unless it was passed on explicitly
+                caller = kwargs.pop('_caller', None) or inspect.currentframe().f_back.f_code.co_name
+                with tracing.span(func.__name__, kind="function", caller=caller) as span:
+                    request = prepare(caller, kwargs)
+
+                    # Generate the response, unless a near-duplicate prompt was already answered
+                    # Inside a session the answer also depends on the history, so the cache is bypassed
+                    use_cache = cache if cache and current_session() is None else None
+                    result = use_cache.lookup(request.metadata["cache_key"], request.response_format, prompt) if use_cache else None
+                    cache_hit = result is not None
+                    if result is None:
+                        result = self._call_with_edits(request, editor) if editor else self._call_driver(request)
+                        if use_cache:
+                            use_cache.store(request.metadata["cache_key"], result, request.response_format, prompt)
+                    # One exchange per function call: the prompt as formatted and the final result
+                    record_exchange(request.prompt, result)
+                    output = finish(request, result, args, kwargs)
+                    _annotate_function_span(span, kwargs, output, cache_hit)
+                    return output
+
+            async def acall(*args, **kwargs):
+                caller = kwargs.pop('_caller', None) or inspect.currentframe().f_back.f_code.co_name
+                with tracing.span(func.__name__, kind="function", caller=caller) as span:
+                    request = prepare(caller, kwargs)
+                    # Inside a session the answer also depends on the history, so the cache is bypassed
+                    use_cache = cache if cache and current_session() is None else None
+                    result = use_cache.lookup(request.metadata["cache_key"], request.response_format, prompt) if use_cache else None
+                    cache_hit = result is not None
+                    if result is None:
+                        result = await self._acall_with_edits(request, editor) if editor else await self._acall_driver(request)
+                        if use_cache:
+                            use_cache.store(request.metadata["cache_key"], result, request.response_format, prompt)
+                    record_exchange(request.prompt, result)
+                    output = finish(request, result, args, kwargs)
+                    _annotate_function_span(span, kwargs, output, cache_hit)
+                    return output
+
+            def batch(items: List[Dict[str, Any]], response_format: Optional[Type[BaseModel]] = None) -> List[Any]:
+                """Call the function once per item, packing independent items into as few requests as fit the token budget."""
+                caller = inspect.currentframe().f_back.f_code.co_name
+                response_format = response_format or default_format
+                if not (isinstance(response_format, type) and issubclass(response_format, BaseModel)):
+                    logger.debug(f"{func.__name__}.batch needs a Pydantic response format to pack, calling items one by one")
+                    return [wrapper(_caller=caller, response_format=response_format, **item) for item in items]
+                if editor or current_session() is not None:
+                    # Edit requests need the item's own text, and session calls each need the history before them
+                    logger.debug(f"{func.__name__}.batch runs edit and session calls one by one")
+                    return [wrapper(_caller=caller, response_format=response_format, **item) for item in items]
+
+                with tracing.span(func.__name__, kind="function", caller=caller, batch_size=len(items)) as span:
+                    requests = [prepare(caller, {**item, 'response_format': response_format}) for item in items]
+                    results: List[Any] = [cache.lookup(r.metadata["cache_key"], response_format, prompt) if cache else None for r in requests]
+                    pending = [i for i, result in enumerate(results) if result is None]
+
+                    # Only items sharing the same cacheable prefix and generation options can go in one request
+                    groups: Dict[Tuple[Optional[str], str], List[int]] = {}
+                    for i in pending:
+                        groups.setdefault((requests[i].prefix, options_key(requests[i].options)), []).append(i)
+                    for (prefix, _), group in groups.items():
+                        for pack in planner.plan([requests[i].prompt for i in group], prefix):
+                            indices = [group[j] for j in pack]
+                            if len(indices) < 2:
+                                continue
+                            # Request plain JSON so one malformed item does not fail validation of the whole pack;
+                            # validators check a single result, not a pack
+                            options = {k: v for k, v in requests[indices[0]].options.items() if k != "validators"}
+                            packed_request = LLMRequest(build_packed_prompt([requests[i].prompt for i in indices], response_format),
+                                                        "json", {}, function=func.__name__, caller=caller, model=self.model_id,
+                                                        prefix=prefix, options=options)
+                            parsed = split_packed_result(self._call_driver(packed_request), response_format, len(indices))
+                            planner.observe(list(parsed.values()))
+                            logger.debug(f"Packed {len(indices)} calls to {func.__name__}, {len(indices) - len(parsed)} to re-issue")
+                            for j, result in parsed.items():
+                                results[indices[j]] = result
+
+                    # Items that were not packed or came back invalid go out on their own
+                    for i in pending:
+                        if results[i] is None:
+                            results[i] = self._call_driver(requests[i])
+                        if cache:
+                            cache.store(requests[i].metadata["cache_key"], results[i], response_format, prompt)
+
+                    outputs = [finish(request, result, (), request.kwargs) for request, result in zip(requests, results)]
+                    _annotate_function_span(span, {f"{i}.{k}": v for i, r in enumerate(requests) for k, v in r.kwargs.items()},
+                                            outputs, cache_hit=not pending)
+                    return outputs
+
+            wrapper.acall = acall
+            wrapper.batch = batch
+            wrapper.llm = self
+            wrapper.semantic_cache = cache
+            wrapper.edit_stats = editor.stats if editor else None
             self.functions[func.__name__] = wrapper
             logger.debug(f"Added function to SmartLLM: {func.__name__}")
             logger.debug(f"Function {func.__name__} configured with SmartLLM")
             return wrapper
         return decorator
 
+    def _make_semantic_cache(self, semantic_cache: Union[bool, float, SemanticCache, None]) -> Optional[SemanticCache]:
+        if semantic_cache is None or semantic_cache is False:
+            return None
+        if isinstance(semantic_cache, SemanticCache):
+            return semantic_cache
+        if semantic_cache is True:
+            return SemanticCache()
+        if isinstance(semantic_cache, (int, float)):
+            return SemanticCache(threshold=float(semantic_cache))
+        raise ValueError(f"Invalid semantic_cache setting: {semantic_cache!r}")
+
     def __getattr__(self, name: str) -> Callable:
         logger.debug(f"Attempting to access attribute: {name}")
         if name in self.functions:
@@ -74,18 +283,118 @@ class SmartLLM:
         raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
 
     def generate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None, **kwargs) -> Union[str, dict]:
+        caller = kwargs.get('_caller') or inspect.currentframe().f_back.f_code.co_name
+        request = self._generate_request(prompt, response_format, caller, kwargs)
+        result = self._call_driver(request)
+        record_exchange(request.prompt, result)
+        return result
+
+    async def agenerate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None, **kwargs) -> Union[str, dict]:
+        caller = kwargs.get('_caller') or inspect.currentframe().f_back.f_code.co_name
+        request = self._generate_request(prompt, response_format, caller, kwargs)
+        result = await self._acall_driver(request)
+        record_exchange(request.prompt, result)
+        return result
+
+    def _generate_request(self, prompt: str, response_format: Union[Type[BaseModel], str, None], caller: str,
+                          kwargs: dict) -> LLMRequest:
         if not prompt:
             raise ValueError("Empty prompt provided")
-        
-        logger.debug(f"Generating response for prompt: {prompt}")
+
+        logger.debug("Generating response for prompt: %s", prompt)
         if not prompt.strip():
             logger.error("Empty prompt provided")
             raise ValueError("Prompt cannot be empty")
-        # Remove '_caller' from kwargs before passing to driver.generate
-        generate_kwargs = {k: v for k, v in kwargs.items() if k != '_caller'}
-        logger.debug(f"Calling driver.generate with kwargs: {generate_kwargs}")
-        logger.debug(f"Generating response for prompt: {prompt[:50]}...")  # Log first 50 chars of prompt
-        return self.driver.generate(prompt, response_format=response_format, **generate_kwargs)
+        # The request-level fields are carried on their own; the rest are generation options
+        options = {k: v for k, v in kwargs.items() if k not in ('_caller', 'prefix', 'tools', 'messages')}
+        logger.debug(f"Calling driver.generate with options: {options}")
+        return LLMRequest(prompt, response_format, {}, function="generate", caller=caller, model=self.model_id,
+                          prefix=kwargs.get('prefix'), options=options, tools=kwargs.get('tools'),
+                          messages=kwargs.get('messages'))
+
+    def tool(self, func: Optional[Callable] = None, *, name: Optional[str] = None, description: Optional[str] = None,
+             timeout: float = 30.0, cache: bool = True):
+        """Register a function the model may call during any request made by this instance.
+
+        The parameters schema comes from the signature and the description from the docstring.
+        """
+        def decorator(fn: Callable) -> Callable:
+            fn.tool = self.tools.register(fn, name=name, description=description, timeout=timeout, cache=cache)
+            return fn
+        return decorator(func) if func is not None else decorator
+
+    def session(self, name: Optional[str] = None, **options) -> Session:
+        """Start a conversation: calls made inside `with session:` share its message history."""
+        return Session(self, name=name, **options)
+
+    def use(self, middleware: Union[Middleware, Callable]) -> "SmartLLM":
+        """Append a middleware stage around every driver call made by this instance."""
+        self.middlewares.append(as_middleware(middleware))
+        return self
+
+    def _middleware_chain(self) -> List[Middleware]:
+        if DriverFactory.middlewares:
+            return DriverFactory.middlewares + self.middlewares
+        return self.middlewares
+
+    def _call_with_edits(self, request: LLMRequest, editor: EditMode) -> Any:
+        """Ask for edits to the function's large text argument, falling back to a full rewrite if they do not apply."""
+        edit_request = editor.edit_request(request)
+        if edit_request is not None:
+            result = editor.apply(request, self._call_driver(edit_request))
+            if result is not None:
+                return result
+        return self._call_driver(request)
+
+    async def _acall_with_edits(self, request: LLMRequest, editor: EditMode) -> Any:
+        edit_request = editor.edit_request(request)
+        if edit_request is not None:
+            result = editor.apply(request, await self._acall_driver(edit_request))
+            if result is not None:
+                return result
+        return await self._acall_driver(request)
+
+    def _call_driver(self, request: LLMRequest) -> Any:
+        session = current_session()
+        with call_context(function=request.function, caller=request.caller):
+            self.usage.check_budget()
+            if session is not None:
+                request.messages = session.messages()
+            if request.tools is None and self.tools:
+                request.tools = self.tools
+            chain = self._middleware_chain()
+            if not chain:
+                result = self._driver_terminal(request)
+            else:
+                result = MiddlewarePipeline(chain).run(request, self._driver_terminal)
+        return result
+
+    async def _acall_driver(self, request: LLMRequest) -> Any:
+        session = current_session()
+        with call_context(function=request.function, caller=request.caller):
+            self.usage.check_budget()
+            if session is not None:
+                request.messages = session.messages()
+            if request.tools is None and self.tools:
+                request.tools = self.tools
+            chain = self._middleware_chain()
+            if not chain:
+                result = await self._adriver_terminal(request)
+            else:
+                result = await MiddlewarePipeline(chain).arun(request, self._adriver_terminal)
+        return result
+
+    def _driver_terminal(self, request: LLMRequest) -> Any:
+        with tracing.span("llm.request", kind="client", provider=self.provider_id, model=request.model) as span:
+            if span is not None:
+                span.set_attribute("queue_wait", time.perf_counter() - request.created_at)
+            return self.driver.generate(request.prompt, response_format=request.response_format, **_driver_kwargs(request))
+
+    async def _adriver_terminal(self, request: LLMRequest) -> Any:
+        with tracing.span("llm.request", kind="client", provider=self.provider_id, model=request.model) as span:
+            if span is not None:
+                span.set_attribute("queue_wait", time.perf_counter() - request.created_at)
+            return await self.driver.agenerate(request.prompt, response_format=request.response_format, **_driver_kwargs(request))
 
     def generate_flowchart(self, output_file: str = 'function_flowchart.png'):
         logger.debug(f"Generating flowchart, output file: {output_file}")
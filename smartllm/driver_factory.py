@@ -1,13 +1,18 @@
-from typing import Dict, Type
+from typing import Callable, Dict, List, Type, Union
 from .drivers.base import LLMDriver
 from .drivers import OpenAIDriver
 from .drivers import AnthropicDriver
+from .drivers import CascadeDriver
+from .middleware import Middleware, as_middleware
 
 class DriverFactory:
     _drivers: Dict[str, Type[LLMDriver]] = {
         "openai": OpenAIDriver,
-        "anthropic": AnthropicDriver
+        "anthropic": AnthropicDriver,
+        "cascade": CascadeDriver,
     }
+    # Applied to every SmartLLM instance, ahead of its own middlewares
+    middlewares: List[Middleware] = []
 
     @classmethod
     def create(cls, provider_id: str, model_id: str, *args, **kwargs) -> LLMDriver:
@@ -19,3 +24,11 @@ class DriverFactory:
     @classmethod
     def register_driver(cls, name: str, driver_class: Type[LLMDriver]):
         cls._drivers[name.lower()] = driver_class
+
+    @classmethod
+    def use(cls, middleware: Union[Middleware, Callable]):
+        cls.middlewares.append(as_middleware(middleware))
+
+    @classmethod
+    def clear_middlewares(cls):
+        cls.middlewares.clear()
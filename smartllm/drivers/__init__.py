@@ -1,3 +1,5 @@
 from .base import LLMDriver
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, circuit_breakers
 from .openai_driver import OpenAIDriver
 from .anthropic_driver import AnthropicDriver
+from .cascade_driver import CascadeDriver
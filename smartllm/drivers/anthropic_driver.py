@@ -1,52 +1,76 @@
+import functools
 import json
 import logging
-from typing import Union, Type, Any
+from typing import Callable, Union, Type, Any, List, Optional
 from pydantic import BaseModel
 from anthropic import Anthropic
-from .base import LLMDriver
+from .base import LLMDriver, Usage, STRUCTURED_OUTPUT_MODES
+from .circuit_breaker import CircuitBreaker
+from .. import tracing
+from ..context import get_call_context
+from ..schema import anthropic_tool
+from ..tools import ToolCall, ToolSet
 
 logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=None)
+def _schema_instruction(response_format: Type[BaseModel]) -> str:
+    schema = json.dumps(response_format.model_json_schema(), separators=(",", ":"))
+    return ("Provide your response as a valid JSON object that matches this JSON schema:\n"
+            f"{schema}\n\nDo not include the schema in your response, only the data.")
+
+
 class AnthropicDriver(LLMDriver):
-    def __init__(self, model: str = "claude-3-sonnet-20240229"):
+    def __init__(self, model: str = "claude-3-sonnet-20240229", structured_output: str = "prompt",
+                 circuit_breaker: Union[bool, CircuitBreaker, None] = True):
+        if structured_output not in STRUCTURED_OUTPUT_MODES:
+            raise ValueError(f"Unknown structured output mode: {structured_output}")
         self.model = model
+        self.structured_output = structured_output
         self.client = Anthropic()
+        self._use_circuit_breaker("anthropic", model, circuit_breaker)
         logger.debug(f"AnthropicDriver initialized with model: {self.model}")
 
-    def generate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None, **kwargs) -> Union[str, dict]:
+    def generate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None,
+                 prefix: Optional[str] = None, structured_output: Optional[str] = None,
+                 messages: Optional[List[dict]] = None, tools: Optional[ToolSet] = None, **kwargs) -> Any:
         logger.info(f"Anthropic LLM Call: model={self.model}")
-        logger.debug(f"Prompt: {prompt}")
-        logger.debug(f"Additional kwargs: {kwargs}")
+        logger.debug("Prompt: %s", prompt)
+        logger.debug("Additional kwargs: %s", kwargs)
+        # Earlier turns of the conversation, if any, go ahead of the current prompt
+        history = list(messages or [])
+
+        is_model = isinstance(response_format, type) and issubclass(response_format, BaseModel)
+        if is_model and (structured_output or self.structured_output) == "native":
+            return self._generate_native(prompt, response_format, prefix, history, tools)
 
-        if response_format and issubclass(response_format, BaseModel):
+        if is_model:
             logger.debug("Using Pydantic model for response format")
-            json_structure = response_format.model_json_schema()
-            formatted_prompt = f"{prompt}\n\nPlease provide your response as a valid JSON object that matches this structure:\n{json.dumps(json_structure, indent=2)}\n\nDo not include the schema in your response, only the data."
+            # The schema is stable per response format, so it lives in a cached system block rather than the prompt
+            system = self._build_system(prefix, _schema_instruction(response_format))
+            messages = history + [{"role": "user", "content": f"{prompt}\n\nRespond only with the JSON object described above."}]
+            if not tools:
+                # Tool rounds append turns after the prompt, which a prefilled reply would break
+                messages.append({"role": "assistant", "content": "Here is the JSON response:"})
+            response = self._create(system, messages, toolset=tools)
+            message = response.content[0].text
             
-            logger.debug(f"Formatted prompt: {formatted_prompt}")
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                messages=[
-                    {"role": "user", "content": formatted_prompt},
-                    {"role": "assistant", "content": "Here is the JSON response:"}
-                ]
-            ).content[0].text
-            
-            logger.debug(f"Raw response from Anthropic: {message}")
+            logger.debug("Raw response from Anthropic: %s", message)
 
             try:
-                # Extract JSON from the message
-                json_start = message.find('{')
-                json_end = message.rfind('}') + 1
-                if json_start == -1 or json_end == 0:
-                    raise ValueError("No valid JSON found in the response")
-                json_str = message[json_start:json_end]
-                
-                # Parse the JSON response, allowing newlines in strings
-                response_dict = json.loads(json_str, strict=False)
-                
-                logger.debug(f"Parsed JSON response: {response_dict}")
+                with tracing.timed("parse_time"):
+                    # Extract JSON from the message
+                    json_start = message.find('{')
+                    json_end = message.rfind('}') + 1
+                    if json_start == -1 or json_end == 0:
+                        raise ValueError("No valid JSON found in the response")
+                    json_str = message[json_start:json_end]
+
+                    # Parse the JSON response, allowing newlines in strings
+                    response_dict = json.loads(json_str, strict=False)
+
+                logger.debug("Parsed JSON response: %s", response_dict)
                 # Return the parsed JSON dictionary
                 return response_dict
             except json.JSONDecodeError as e:
@@ -60,14 +84,126 @@ class AnthropicDriver(LLMDriver):
                 return {"content": message}
         else:
             logger.debug("No specific response format requested")
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                messages=[{"role": "user", "content": prompt}]
-            ).content[0].text
-            logger.debug(f"Generated response: {message}")
+            on_delta = get_call_context().get("on_delta")
+            # Tool rounds need the complete reply, so calls with tools are not streamed
+            if on_delta is not None and not tools:
+                return self._stream(self._build_system(prefix), history + [{"role": "user", "content": prompt}], on_delta)
+            response = self._create(self._build_system(prefix), history + [{"role": "user", "content": prompt}],
+                                    toolset=tools)
+            message = response.content[0].text
+            logger.debug("Generated response: %s", message)
             return message
 
+    def _generate_native(self, prompt: str, response_format: Type[BaseModel], prefix: Optional[str] = None,
+                         history: Optional[List[dict]] = None, tools: Optional[ToolSet] = None):
+        """Force a call to a tool whose input schema is the response format, so the reply arrives already shaped."""
+        tool = anthropic_tool(response_format)
+        response = self._create(
+            self._build_system(prefix),
+            (history or []) + [{"role": "user", "content": prompt}],
+            tools=[tool],
+            tool_choice={"type": "tool", "name": tool["name"]},
+            toolset=tools
+        )
+        tool_input = next((block.input for block in response.content
+                           if getattr(block, "type", None) == "tool_use" and (not tools or block.name == tool["name"])),
+                          None)
+        if tool_input is None:
+            logger.error(f"Anthropic response has no {tool['name']} tool call")
+            return f"Error: no structured response returned for {response_format.__name__}"
+        try:
+            with tracing.timed("parse_time"):
+                return response_format.model_validate(tool_input)
+        except Exception as e:
+            logger.error(f"Structured response does not match {response_format.__name__}: {e}")
+            return f"Error in structured generation: {str(e)}"
+
+    def _build_system(self, prefix: Optional[str] = None, instructions: Optional[str] = None) -> List[dict]:
+        """System blocks holding the stable part of a request, each ending in a prompt-cache breakpoint.
+
+        The instructions only depend on the response format, so they go first and stay cached when the
+        prefix changes; the prefix carries per-call arguments and changes more often.
+        """
+        blocks = []
+        if instructions:
+            blocks.append({"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}})
+        if prefix:
+            blocks.append({"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}})
+        return blocks
+
+    def _create(self, system: List[dict], messages: List[dict], toolset: Optional[ToolSet] = None, **extra):
+        """One Messages API call. With a toolset, runs the tool calls the model asks for and continues until it answers."""
+        forced = extra.get("tool_choice")
+        for turn in range(toolset.max_rounds + 1 if toolset else 1):
+            request = {"model": self.model, "max_tokens": 1024, "messages": messages, **extra}
+            if system:
+                request["system"] = system
+            if toolset:
+                request["tools"] = toolset.anthropic_tools() + extra.get("tools", [])
+                if turn == toolset.max_rounds:
+                    logger.warning(f"Reached {toolset.max_rounds} tool rounds, asking {self.model} for a final answer")
+                    request["tool_choice"] = forced or {"type": "none"}
+                elif forced:
+                    # Let the model call helper tools before the forced response tool
+                    request["tool_choice"] = {"type": "any"}
+            with self._guarded(), tracing.timed("network_time"):
+                response = self.client.messages.create(**request)
+            self._record_usage(response)
+            if not toolset:
+                return response
+            tool_uses = [block for block in response.content if getattr(block, "type", None) == "tool_use"]
+            calls = [ToolCall(block.id, block.name, block.input) for block in tool_uses if block.name in toolset]
+            # Done once the model answers in text or calls a tool that is not one of ours, such as the response tool
+            if not calls or len(calls) < len(tool_uses):
+                return response
+            results = toolset.run(calls)
+            messages = messages + [
+                {"role": "assistant", "content": response.content},
+                {"role": "user", "content": [{"type": "tool_result", "tool_use_id": result.call_id,
+                                              "content": result.content, "is_error": result.is_error}
+                                             for result in results]},
+            ]
+        return response
+
+    def _stream(self, system: List[dict], messages: List[dict], on_delta: Callable[[str], None]) -> str:
+        """Stream a plain-text reply, passing each text delta to `on_delta` as it arrives."""
+        request = {"model": self.model, "max_tokens": 1024, "messages": messages, "stream": True}
+        if system:
+            request["system"] = system
+        parts, usage, output_tokens = [], None, 0
+        with self._guarded(), tracing.timed("network_time"):
+            stream = self.client.messages.create(**request)
+            try:
+                for event in stream:
+                    if event.type == "message_start":
+                        usage = event.message.usage
+                    elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                        parts.append(event.delta.text)
+                        on_delta(event.delta.text)
+                    elif event.type == "message_delta":
+                        output_tokens = event.usage.output_tokens or 0
+            finally:
+                # Closes the HTTP response when on_delta stops the call early
+                stream.close()
+        if usage is not None:
+            self._record_usage(usage=usage, output_tokens=output_tokens)
+        return "".join(parts)
+
+    def _record_usage(self, response=None, usage=None, output_tokens: Optional[int] = None):
+        usage = usage or getattr(response, "usage", None)
+        if usage is None:
+            return
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        # Anthropic reports cache reads and writes separately from input_tokens
+        self._report_usage(Usage(
+            model=self.model,
+            input_tokens=(usage.input_tokens or 0) + cache_read + cache_write,
+            output_tokens=output_tokens if output_tokens is not None else usage.output_tokens or 0,
+            cached_tokens=cache_read,
+            cache_write_tokens=cache_write,
+        ))
+
     def _adapt_content(self, content: dict, response_format: Type[BaseModel]) -> dict:
         adapted_content = {}
         for field_name in response_format.model_fields:
@@ -1,6 +1,54 @@
+import asyncio
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from .circuit_breaker import CircuitBreaker, circuit_breakers
+
+
+# "prompt" describes the response format in the prompt; "native" uses the provider's schema-constrained output
+STRUCTURED_OUTPUT_MODES = ("prompt", "native")
+
+
+@dataclass
+class Usage:
+    """Token counts reported by a provider for a single request."""
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+
 
 class LLMDriver(ABC):
+    # Drivers that call a provider API set this from their `circuit_breaker` option
+    circuit_breaker: Optional[CircuitBreaker] = None
+
     @abstractmethod
     def generate(self, prompt: str, **kwargs) -> str:
         pass
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        # Drivers without a native async client run the sync call on a worker thread
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    def _use_circuit_breaker(self, provider: str, model: str, setting: Union[bool, CircuitBreaker, None]):
+        """True shares the registry's breaker for this provider and model; False or None disables it."""
+        if isinstance(setting, CircuitBreaker):
+            self.circuit_breaker = setting
+        elif setting:
+            self.circuit_breaker = circuit_breakers.get(provider, model)
+
+    def _guarded(self):
+        """Wrap a provider call so the circuit breaker can reject it up front and learn from its outcome."""
+        return self.circuit_breaker.guard() if self.circuit_breaker is not None else nullcontext()
+
+    def add_usage_listener(self, listener: Callable[[Usage], None]):
+        if "_usage_listeners" not in self.__dict__:
+            self._usage_listeners = []
+        self._usage_listeners.append(listener)
+
+    def _report_usage(self, usage: Usage):
+        for listener in self.__dict__.get("_usage_listeners", ()):
+            listener(usage)
@@ -0,0 +1,134 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+from pydantic import BaseModel
+
+from .base import LLMDriver
+from ..context import StreamCancelled, get_call_context
+
+logger = logging.getLogger(__name__)
+
+_ERROR_PREFIXES = ("Error", "Bad Request Error")
+
+Validator = Callable[[Any], Any]
+
+
+class CascadeDriver(LLMDriver):
+    """Tries an ordered list of models, cheapest first, escalating only when a result fails validation.
+
+    `model_id` lists the tiers as "provider:model" pairs separated by commas, e.g.
+    "openai:gpt-4o-mini,openai:chatgpt-4o-latest". A result passes when it matches the Pydantic
+    response format and every validator accepts it (returns anything but False without raising).
+
+    Escalation statistics are kept per configured function: once a tier has failed a function more
+    often than `min_success_rate` allows, later calls start at the next tier. Every `reprobe_every`
+    calls a function starts from the cheapest tier again, in case it has become good enough. Counts are
+    halved whenever a tier reaches `window` attempts, so recent results outweigh old ones.
+    """
+
+    def __init__(self, model_id: str, validators: Sequence[Validator] = (), min_samples: int = 5,
+                 min_success_rate: float = 0.6, reprobe_every: int = 20, window: int = 50, **driver_options):
+        # Imported here because the factory itself imports this module
+        from ..driver_factory import DriverFactory
+
+        self.model_id = model_id
+        self.tiers: List[Tuple[str, LLMDriver]] = []
+        for spec in model_id.split(","):
+            provider_id, _, tier_model = spec.strip().partition(":")
+            if not tier_model:
+                raise ValueError(f"Cascade tier must be 'provider:model', got: {spec!r}")
+            driver = DriverFactory.create(provider_id, tier_model, **driver_options)
+            driver.add_usage_listener(self._report_usage)
+            self.tiers.append((tier_model, driver))
+        if not self.tiers:
+            raise ValueError("Cascade needs at least one tier")
+        self.validators = list(validators)
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.reprobe_every = reprobe_every
+        self.window = window
+        self._attempts: Dict[Optional[str], List[int]] = defaultdict(lambda: [0] * len(self.tiers))
+        self._successes: Dict[Optional[str], List[int]] = defaultdict(lambda: [0] * len(self.tiers))
+        self._calls: Dict[Optional[str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None,
+                 validators: Sequence[Validator] = (), **kwargs) -> Any:
+        function = get_call_context().get("function")
+        checks = self.validators + list(validators)
+        start = self.start_tier(function)
+        with self._lock:
+            self._calls[function] += 1
+
+        result = None
+        for tier in range(start, len(self.tiers)):
+            model, driver = self.tiers[tier]
+            try:
+                result = driver.generate(prompt, response_format=response_format, **kwargs)
+                accepted, result, reason = self._check(result, response_format, checks)
+            except StreamCancelled:
+                # Nobody is reading the answer, so there is no point escalating
+                raise
+            except Exception as e:
+                if tier + 1 == len(self.tiers):
+                    self._record(function, tier, False)
+                    raise
+                accepted, reason = False, f"{type(e).__name__}: {e}"
+            self._record(function, tier, accepted)
+            if accepted:
+                logger.debug(f"Cascade: {function} answered by tier {tier} ({model})")
+                return result
+            if tier + 1 < len(self.tiers):
+                logger.info(f"Cascade: escalating {function} from {model} to {self.tiers[tier + 1][0]}: {reason}")
+        logger.warning(f"Cascade: no tier produced a valid result for {function}")
+        return result
+
+    def start_tier(self, function: Optional[str]) -> int:
+        with self._lock:
+            if self.reprobe_every and self._calls[function] % self.reprobe_every == self.reprobe_every - 1:
+                return 0
+            attempts, successes = self._attempts[function], self._successes[function]
+            for tier in range(len(self.tiers) - 1):
+                if attempts[tier] < self.min_samples or successes[tier] / attempts[tier] >= self.min_success_rate:
+                    return tier
+            return len(self.tiers) - 1
+
+    def stats(self, function: Optional[str] = None) -> Dict[str, Any]:
+        """Attempts and success rate per tier for one configured function."""
+        with self._lock:
+            attempts, successes = self._attempts[function], self._successes[function]
+            tiers = [
+                {"model": model, "attempts": attempts[i], "successes": successes[i],
+                 "success_rate": successes[i] / attempts[i] if attempts[i] else None}
+                for i, (model, _) in enumerate(self.tiers)
+            ]
+        return {"function": function, "start_tier": self.start_tier(function), "tiers": tiers}
+
+    def _check(self, result: Any, response_format: Any, checks: List[Validator]) -> Tuple[bool, Any, str]:
+        if isinstance(result, str) and result.startswith(_ERROR_PREFIXES):
+            return False, result, result
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            if not isinstance(result, response_format):
+                try:
+                    result = response_format.model_validate(result)
+                except Exception as e:
+                    return False, result, f"does not match {response_format.__name__}: {e}"
+        for check in checks:
+            try:
+                if check(result) is False:
+                    return False, result, f"rejected by {getattr(check, '__name__', check)}"
+            except Exception as e:
+                return False, result, f"rejected by {getattr(check, '__name__', check)}: {e}"
+        return True, result, ""
+
+    def _record(self, function: Optional[str], tier: int, accepted: bool):
+        with self._lock:
+            attempts, successes = self._attempts[function], self._successes[function]
+            if self.window and attempts[tier] >= self.window:
+                attempts[tier] //= 2
+                successes[tier] //= 2
+            attempts[tier] += 1
+            if accepted:
+                successes[tier] += 1
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import anthropic
+import openai
+
+from ..context import StreamCancelled
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_at: float):
+        self.name = name
+        self.retry_at = retry_at
+        super().__init__(f"Circuit for {name} is open, retry in {max(0.0, retry_at - time.time()):.1f}s")
+
+
+# Raised when a provider cannot be reached or does not answer in time; the SDK timeout errors subclass these
+TRANSPORT_ERRORS = (ConnectionError, TimeoutError, openai.APIConnectionError, anthropic.APIConnectionError)
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Transport errors, timeouts, 429s and 5xx count against a provider.
+
+    Other client errors, and errors raised by our own code inside the guarded block (callbacks,
+    response parsing), say nothing about the provider's health.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+class CircuitBreaker:
+    """Tracks a rolling window of calls to one provider model and fails fast while it is unhealthy.
+
+    The circuit opens when, over at least `min_calls` calls in the last `window` seconds, the share of
+    failed calls reaches `failure_rate`, or the share of calls slower than `slow_call_seconds` reaches
+    `slow_rate`. After `open_seconds` it lets up to `half_open_calls` probe calls through at a time;
+    `close_after` successful probes close it again and any failed probe re-opens it.
+    """
+
+    def __init__(self, name: str, window: float = 60.0, min_calls: int = 10, failure_rate: float = 0.5,
+                 slow_call_seconds: Optional[float] = 60.0, slow_rate: float = 0.8, open_seconds: float = 30.0,
+                 half_open_calls: int = 1, close_after: int = 2):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.close_after = close_after
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self.rejected = 0
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def guard(self):
+        """Admit the enclosed provider call, or raise CircuitOpenError, and record how it went."""
+        probe = self._admit()
+        started = time.perf_counter()
+        try:
+            yield
+        except StreamCancelled:
+            # The caller stopped reading: says nothing about the provider, but frees the probe slot
+            self._abandon(probe)
+            raise
+        except Exception as e:
+            self._record(not is_provider_failure(e), time.perf_counter() - started, probe)
+            raise
+        except BaseException:
+            # KeyboardInterrupt or SystemExit on the calling thread. Cancelling an async call never lands
+            # here: agenerate runs this block on a worker thread, which finishes and records the outcome.
+            self._abandon(probe)
+            raise
+        self._record(True, time.perf_counter() - started, probe)
+
+    def _abandon(self, probe: bool):
+        if probe:
+            with self._lock:
+                self._probes_in_flight -= 1
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and time.time() - self.opened_at >= self.open_seconds:
+                logger.info(f"Circuit for {self.name} half-open, probing recovery")
+                self.state, self._probe_successes = HALF_OPEN, 0
+            if self.state == HALF_OPEN and self._probes_in_flight < self.half_open_calls:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.opened_at + self.open_seconds)
+
+    def _record(self, ok: bool, latency: float, probe: bool):
+        now = time.time()
+        slow = self.slow_call_seconds is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+            if probe:
+                self._probes_in_flight -= 1
+                if not ok or slow:
+                    self._open(now, "probe failed")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.close_after and self.state == HALF_OPEN:
+                        logger.info(f"Circuit for {self.name} closed")
+                        self.state, self.opened_at = CLOSED, None
+                        self._calls.clear()
+                return
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate:
+                    self._open(now, f"failure rate {failure_rate:.0%}")
+                elif slow_rate >= self.slow_rate:
+                    self._open(now, f"slow call rate {slow_rate:.0%}")
+
+    def _open(self, now: float, reason: str):
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+        self.state, self.opened_at = OPEN, now
+        self.trips += 1
+
+    def _prune(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _rates(self) -> Tuple[float, float]:
+        if not self._calls:
+            return 0.0, 0.0
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, latency in self._calls
+                   if self.slow_call_seconds is not None and latency >= self.slow_call_seconds)
+        return failures / len(self._calls), slow / len(self._calls)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state and window statistics, for dashboards."""
+        with self._lock:
+            self._prune(time.time())
+            failure_rate, slow_rate = self._rates()
+            latencies = sorted(latency for _, _, latency in self._calls)
+            return {
+                "name": self.name,
+                "state": self.state,
+                "calls": len(self._calls),
+                "failure_rate": failure_rate,
+                "slow_rate": slow_rate,
+                "p50_latency": latencies[len(latencies) // 2] if latencies else None,
+                "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else None,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_at": self.opened_at + self.open_seconds if self.state != CLOSED else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.state, self.opened_at = CLOSED, None
+            self._calls.clear()
+            self._probes_in_flight = self._probe_successes = 0
+
+
+class CircuitBreakerRegistry:
+    """One breaker per provider and model, shared by every driver instance that talks to it."""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        name = f"{provider}:{model}"
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, **self.defaults)
+            return self._breakers[name]
+
+    def configure(self, **settings):
+        """Change breaker settings, for existing breakers and those created later."""
+        with self._lock:
+            self.defaults.update(settings)
+            for breaker in self._breakers.values():
+                for key, value in settings.items():
+                    setattr(breaker, key, value)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+
+circuit_breakers = CircuitBreakerRegistry()
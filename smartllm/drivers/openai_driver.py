@@ -1,15 +1,32 @@
 import openai
 import json
+import logging
 from pydantic import BaseModel
-from typing import Optional, Type, Union, Any, get_args, get_origin
-from .base import LLMDriver
+from typing import Callable, Dict, List, Optional, Type, Union, Any, get_args, get_origin
+from .base import LLMDriver, Usage, STRUCTURED_OUTPUT_MODES
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .. import tracing
+from ..context import StreamCancelled, get_call_context
+from ..schema import openai_response_format
+from ..tools import ToolCall, ToolSet
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a helpful assistant. Please provide your response in JSON format."
 
 class OpenAIDriver(LLMDriver):
-    def __init__(self, model_id: str):
+    def __init__(self, model_id: str, structured_output: str = "prompt",
+                 circuit_breaker: Union[bool, CircuitBreaker, None] = True):
+        if structured_output not in STRUCTURED_OUTPUT_MODES:
+            raise ValueError(f"Unknown structured output mode: {structured_output}")
         self.model_id = model_id
+        self.structured_output = structured_output
         self.client = openai.OpenAI()
+        self._use_circuit_breaker("openai", model_id, circuit_breaker)
 
-    def generate(self, prompt: str, response_format: Optional[Union[Type[BaseModel], str]] = None, **kwargs) -> Any:
+    def generate(self, prompt: str, response_format: Optional[Union[Type[BaseModel], str]] = None,
+                 prefix: Optional[str] = None, structured_output: Optional[str] = None,
+                 messages: Optional[List[Dict[str, str]]] = None, tools: Optional[ToolSet] = None, **kwargs) -> Any:
         if not prompt.strip():
             raise ValueError("Prompt cannot be empty")
         try:
@@ -18,27 +35,33 @@ class OpenAIDriver(LLMDriver):
                 'temperature', 'max_tokens', 'top_p', 'frequency_penalty',
                 'presence_penalty', 'stop', 'n', 'stream', 'logit_bias'
             ]}
+            if tools:
+                valid_kwargs["tools"] = tools
+
+            if (structured_output or self.structured_output) == "native" and \
+                    isinstance(response_format, type) and issubclass(response_format, BaseModel):
+                # The schema travels as the response format, so the prompt needs no format instructions
+                return self._generate_native(self._build_messages(prompt, prefix, messages), response_format, **valid_kwargs)
 
             # Append JSON format instruction to the prompt
             json_instruction = self._get_json_instruction(response_format)
             full_prompt = f"{prompt}\n\n{json_instruction}"
 
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant. Please provide your response in JSON format."},
-                {"role": "user", "content": full_prompt}
-            ]
+            messages = self._build_messages(full_prompt, prefix, messages)
 
             if isinstance(response_format, type) and issubclass(response_format, BaseModel):
                 return self._generate_structured(messages, response_format, **valid_kwargs)
             elif response_format == "json":
                 return self._generate_json(messages, **valid_kwargs)
             else:
-                response = self.client.chat.completions.create(
-                    model=self.model_id,
-                    messages=messages,
-                    **valid_kwargs
-                )
+                on_delta = get_call_context().get("on_delta")
+                # Tool rounds need the complete reply, so calls with tools are not streamed
+                if on_delta is not None and not tools:
+                    return self._generate_stream(messages, on_delta, **valid_kwargs)
+                response = self._create(messages, **valid_kwargs)
                 return response.choices[0].message.content.strip()
+        except (CircuitOpenError, StreamCancelled):
+            raise
         except openai.BadRequestError as e:
             error_message = f"Bad Request Error: {str(e)}"
             print(error_message)  # Print for debugging
@@ -48,6 +71,97 @@ class OpenAIDriver(LLMDriver):
             print(error_message)  # Print for debugging
             return error_message
 
+    def _build_messages(self, prompt: str, prefix: Optional[str] = None,
+                        history: Optional[List[Dict[str, str]]] = None) -> list:
+        # Stable content goes first so repeated calls share a prefix that OpenAI caches automatically
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if prefix:
+            messages.append({"role": "system", "content": prefix})
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _create(self, messages: list, tools: Optional[ToolSet] = None, **kwargs):
+        """One chat completion. With tools, runs the tool calls the model asks for and continues until it answers."""
+        for turn in range(tools.max_rounds + 1 if tools else 1):
+            if tools:
+                kwargs["tools"] = tools.openai_tools()
+                if turn == tools.max_rounds:
+                    logger.warning(f"Reached {tools.max_rounds} tool rounds, asking {self.model_id} for a final answer")
+                    kwargs["tool_choice"] = "none"
+            with self._guarded(), tracing.timed("network_time"):
+                response = self.client.chat.completions.create(
+                    model=self.model_id,
+                    messages=messages,
+                    **kwargs
+                )
+            self._record_usage(response)
+            message = response.choices[0].message
+            tool_calls = getattr(message, "tool_calls", None) if tools else None
+            if not tool_calls:
+                return response
+            calls = [ToolCall(call.id, call.function.name, call.function.arguments) for call in tool_calls]
+            messages = messages + [{
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": [{"id": call.id, "type": "function",
+                                "function": {"name": call.name, "arguments": call.arguments}} for call in calls],
+            }]
+            messages += [{"role": "tool", "tool_call_id": result.call_id, "content": result.content}
+                         for result in tools.run(calls)]
+        return response
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self._report_usage(Usage(
+            model=self.model_id,
+            input_tokens=usage.prompt_tokens or 0,
+            output_tokens=usage.completion_tokens or 0,
+            cached_tokens=getattr(details, "cached_tokens", None) or 0,
+        ))
+
+    def _generate_stream(self, messages, on_delta: Callable[[str], None], **kwargs) -> str:
+        """Stream a plain-text completion, passing each text delta to `on_delta` as it arrives."""
+        kwargs.pop("stream", None)
+        parts = []
+        with self._guarded(), tracing.timed("network_time"):
+            stream = self.client.chat.completions.create(
+                model=self.model_id,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            try:
+                for chunk in stream:
+                    # The final chunk carries usage and no choices
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        on_delta(chunk.choices[0].delta.content)
+                    self._record_usage(chunk)
+            finally:
+                # Closes the HTTP response when on_delta stops the call early
+                stream.close()
+        return "".join(parts).strip()
+
+    def _generate_native(self, messages, response_format: Type[BaseModel], **kwargs):
+        try:
+            response = self._create(messages, response_format=openai_response_format(response_format), **kwargs)
+            message = response.choices[0].message
+            if getattr(message, "refusal", None):
+                return f"Error: model refused to answer. {message.refusal}"
+            with tracing.timed("parse_time"):
+                return response_format.model_validate_json(message.content)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            error_message = f"Error in structured generation: {str(e)}"
+            print(error_message)  # Print for debugging
+            return error_message
+
     def _get_json_instruction(self, response_format: Optional[Union[Type[BaseModel], str]]) -> str:
         if isinstance(response_format, type) and issubclass(response_format, BaseModel):
             fields = response_format.model_fields
@@ -72,26 +186,24 @@ class OpenAIDriver(LLMDriver):
 
     def _generate_structured(self, messages, response_format: Type[BaseModel], **kwargs):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                response_format={"type": "json_object"},
-                **kwargs
-            )
+            response = self._create(messages, response_format={"type": "json_object"}, **kwargs)
             content = response.choices[0].message.content.strip()
-            parsed_content = json.loads(content)
-            
-            # Check if the parsed content matches the expected structure
-            if set(parsed_content.keys()) != set(response_format.model_fields.keys()):
-                # If not, try to adapt the content to match the expected structure
-                adapted_content = self._adapt_content(parsed_content, response_format)
-                return response_format(**adapted_content)
-            
-            return response_format(**parsed_content)
+            with tracing.timed("parse_time"):
+                parsed_content = json.loads(content)
+
+                # Check if the parsed content matches the expected structure
+                if set(parsed_content.keys()) != set(response_format.model_fields.keys()):
+                    # If not, try to adapt the content to match the expected structure
+                    adapted_content = self._adapt_content(parsed_content, response_format)
+                    return response_format(**adapted_content)
+
+                return response_format(**parsed_content)
         except json.JSONDecodeError as e:
             error_message = f"Error: Unable to parse JSON response. {str(e)}"
             print(error_message)  # Print for debugging
             return error_message
+        except CircuitOpenError:
+            raise
         except Exception as e:
             error_message = f"Error in structured generation: {str(e)}"
             print(error_message)  # Print for debugging
@@ -112,18 +224,16 @@ class OpenAIDriver(LLMDriver):
 
     def _generate_json(self, messages, **kwargs):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                response_format={"type": "json_object"},
-                **kwargs
-            )
+            response = self._create(messages, response_format={"type": "json_object"}, **kwargs)
             content = response.choices[0].message.content.strip()
-            return json.loads(content)
+            with tracing.timed("parse_time"):
+                return json.loads(content)
         except json.JSONDecodeError as e:
             error_message = f"Error: Unable to parse JSON response. {str(e)}"
             print(error_message)  # Print for debugging
             return error_message
+        except CircuitOpenError:
+            raise
         except Exception as e:
             error_message = f"Error in JSON generation: {str(e)}"
             print(error_message)  # Print for debugging
@@ -0,0 +1,125 @@
+import dataclasses
+import json
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, Field
+
+from . import tracing
+from .artifacts import ArtifactRef
+from .middleware import LLMRequest
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+EDIT_INSTRUCTION = (
+    "Do not reproduce the whole of `{param}`. Return only the changes as a list of edits: `search` is an exact "
+    "excerpt of the current `{param}` text, long enough to occur only once, and `replace` is what it becomes. "
+    "Return an empty list if nothing needs to change."
+)
+
+
+class Edit(BaseModel):
+    search: str = Field(description="Exact, unique excerpt of the current text")
+    replace: str = Field(description="Replacement for the excerpt")
+
+
+class EditList(BaseModel):
+    edits: List[Edit] = Field(description="Edits to apply in order")
+
+
+class EditError(ValueError):
+    """An edit whose anchor text is missing or ambiguous."""
+
+
+def apply_edits(text: str, edits: List[Edit]) -> str:
+    """Apply search/replace edits in order; every anchor must match exactly once."""
+    for edit in edits:
+        if not edit.search:
+            raise EditError("Edit has an empty search text")
+        count = text.count(edit.search)
+        if count != 1:
+            problem = "not found" if count == 0 else f"found {count} times"
+            raise EditError(f"Edit anchor {edit.search[:60]!r} {problem}")
+        text = text.replace(edit.search, edit.replace, 1)
+    return text
+
+
+def _text_field(response_format: Any) -> Optional[str]:
+    """The field holding the text when the response format is a model with a single string field."""
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        fields = response_format.model_fields
+        if len(fields) == 1:
+            name, field = next(iter(fields.items()))
+            if field.annotation is str:
+                return name
+    return None
+
+
+@dataclass
+class EditStats:
+    calls: int = 0
+    applied: int = 0
+    fallbacks: int = 0
+    output_tokens_saved: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class EditMode:
+    """Asks for edits to one large text argument instead of a full rewrite, and applies them locally.
+
+    Works when the response is the edited text itself: a plain string, or a model with a single string
+    field such as ChapterContent. If the model's edits do not apply cleanly, `apply` returns None and
+    the caller falls back to the full-rewrite request. `output_tokens_saved` compares the estimated
+    size of the rewritten text with the edits actually returned, net of the tokens spent on fallbacks.
+    """
+
+    def __init__(self, param: str):
+        self.param = param
+        self.stats = EditStats()
+        self._lock = threading.Lock()
+
+    def edit_request(self, request: LLMRequest) -> Optional[LLMRequest]:
+        text = request.kwargs.get(self.param)
+        if not isinstance(text, (str, ArtifactRef)):
+            logger.debug(f"Edit mode needs a string for {self.param}, requesting a full rewrite")
+            return None
+        if request.response_format not in (None, str) and _text_field(request.response_format) is None:
+            logger.debug(f"Edit mode cannot produce {request.response_format}, requesting a full rewrite")
+            return None
+        prompt = f"{request.prompt}\n\n{EDIT_INSTRUCTION.format(param=self.param)}"
+        # Validators are written for the final response, not for the list of edits
+        options = {k: v for k, v in request.options.items() if k != "validators"}
+        return dataclasses.replace(request, prompt=prompt, response_format=EditList, options=options,
+                                   metadata={"edit_mode": True})
+
+    def apply(self, request: LLMRequest, result: Any) -> Optional[Any]:
+        """The edited text in the request's response format, or None if the edits could not be applied."""
+        text = str(request.kwargs[self.param])
+        try:
+            edits = result if isinstance(result, EditList) else EditList.model_validate(result)
+            edited = apply_edits(text, edits.edits)
+            applied = True
+        except Exception as e:
+            logger.info(f"Edits to {self.param} in {request.function} did not apply, falling back to a full rewrite: {e}")
+            edits, applied = None, False
+
+        edit_tokens = estimate_tokens(json.dumps(result.model_dump() if isinstance(result, BaseModel) else result, default=str))
+        with self._lock:
+            self.stats.calls += 1
+            if applied:
+                self.stats.applied += 1
+                self.stats.output_tokens_saved += estimate_tokens(edited) - edit_tokens
+            else:
+                self.stats.fallbacks += 1
+                self.stats.output_tokens_saved -= edit_tokens
+        tracing.set_attribute("edit_applied", applied)
+        if not applied:
+            return None
+        logger.debug(f"Applied {len(edits.edits)} edits to {self.param} in {request.function}")
+        field = _text_field(request.response_format)
+        return request.response_format(**{field: edited}) if field else edited
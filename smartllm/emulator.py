@@ -0,0 +1,516 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+          "et dolore magna aliqua").split()
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+@dataclass
+class LatencyProfile:
+    """Time to first token in seconds: "constant", "uniform" (mean ± spread), "lognormal" or "exponential"."""
+    distribution: str = "lognormal"
+    mean: float = 0.3
+    spread: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.mean
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.mean - self.spread, self.mean + self.spread))
+        if self.distribution == "exponential":
+            return rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        if self.distribution == "lognormal":
+            # Parameterised so the distribution's mean is `mean`; `spread` is sigma of the underlying normal
+            return rng.lognormvariate(np.log(self.mean) - self.spread ** 2 / 2, self.spread) if self.mean > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution: {self.distribution}")
+
+
+@dataclass
+class EmulatorProfile:
+    """How the emulated provider behaves: latency, generation speed, injected failures and rate limits."""
+    latency: LatencyProfile = field(default_factory=LatencyProfile)
+    tokens_per_second: float = 100.0
+    output_tokens: int = 50
+    error_429_rate: float = 0.0
+    error_5xx_rate: float = 0.0
+    requests_per_minute: Optional[int] = None
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+
+
+@dataclass
+class EmulatorStats:
+    requests: int = 0
+    streamed: int = 0
+    injected_429: int = 0
+    injected_5xx: int = 0
+    rate_limited: int = 0
+    output_tokens: int = 0
+
+
+def sample_from_schema(schema: Dict[str, Any], root: Optional[Dict[str, Any]] = None, rng: Optional[random.Random] = None) -> Any:
+    """A value matching a JSON schema, so structured-output requests get parseable replies."""
+    root = root or schema
+    rng = rng or random.Random(0)
+    if "$ref" in schema:
+        name = schema["$ref"].split("/")[-1]
+        return sample_from_schema(root.get("$defs", {}).get(name, {}), root, rng)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return sample_from_schema(options[0], root, rng)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if kind == "object":
+        return {name: sample_from_schema(prop, root, rng) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_from_schema(schema.get("items", {}), root, rng) for _ in range(3)]
+    if kind == "integer":
+        return rng.randint(1, 10)
+    if kind == "number":
+        return round(rng.uniform(0, 10), 2)
+    if kind == "boolean":
+        return True
+    return " ".join(rng.choice(_WORDS) for _ in range(4))
+
+
+class _InvalidRequest(Exception):
+    """A request the emulated provider would reject with 400."""
+
+
+class _RateLimiter:
+    """Fixed one-minute window, reported the way the providers do in rate-limit headers."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.window_start = time.monotonic()
+        self.count = 0
+
+    def acquire(self) -> Tuple[bool, int, float]:
+        now = time.monotonic()
+        if now - self.window_start >= 60:
+            self.window_start, self.count = now, 0
+        reset = 60 - (now - self.window_start)
+        if self.limit is None:
+            return True, 1_000_000, reset
+        if self.count >= self.limit:
+            return False, 0, reset
+        self.count += 1
+        return True, self.limit - self.count, reset
+
+
+class ProviderEmulator:
+    """Local HTTP server speaking the OpenAI chat-completions and Anthropic messages APIs.
+
+    Point the SDK clients at it with OPENAI_BASE_URL=`openai_base_url` and ANTHROPIC_BASE_URL=`anthropic_base_url`
+    to exercise the real drivers, connection pools and retries without calling a provider.
+    """
+
+    def __init__(self, profile: Optional[EmulatorProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        self.profile = profile or EmulatorProfile()
+        self.host = host
+        self.port = port
+        self.stats = EmulatorStats()
+        self._rng = random.Random(self.profile.seed)
+        self._limiter = _RateLimiter(self.profile.requests_per_minute)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def anthropic_base_url(self) -> str:
+        return self.base_url
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Provider emulator listening on {self.base_url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise outlive the server
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    @contextmanager
+    def running(self):
+        """Run the server on a background event loop for the duration of the block."""
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="smartllm-emulator", daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            # Keep-alive: serve requests on the connection until the client closes it
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode(errors="replace").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode(errors="replace").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                if len(parts) != 3 or not length.isdigit():
+                    # The rest of the stream cannot be framed, so answer and drop the connection
+                    await self._send_json(writer, 400, {"error": {"message": "Malformed HTTP request"}},
+                                          [("connection", "close")])
+                    break
+                method, path, _ = parts
+                body = await reader.readexactly(int(length))
+                await self._dispatch(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        if method != "POST" or path not in ("/v1/chat/completions", "/v1/messages"):
+            await self._send_json(writer, 404, {"error": {"message": f"No route for {method} {path}"}})
+            return
+        api = "openai" if path == "/v1/chat/completions" else "anthropic"
+        self.stats.requests += 1
+        try:
+            request = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            request = None
+        if not isinstance(request, dict):
+            await self._send_json(writer, 400, _error(api, "invalid_request_error", "Body is not a JSON object"))
+            return
+
+        allowed, remaining, reset = self._limiter.acquire()
+        headers = _rate_limit_headers(api, self._limiter.limit or 1_000_000, remaining, reset)
+        if not allowed or self._rng.random() < self.profile.error_429_rate:
+            if allowed:
+                self.stats.injected_429 += 1
+            else:
+                self.stats.rate_limited += 1
+            headers.append(("retry-after", f"{self.profile.retry_after:g}"))
+            await self._send_json(writer, 429, _error(api, "rate_limit_error", "Rate limit exceeded"), headers)
+            return
+        if self._rng.random() < self.profile.error_5xx_rate:
+            self.stats.injected_5xx += 1
+            status = self._rng.choice((500, 502, 503))
+            await self._send_json(writer, status, _error(api, "api_error", "Emulated server error"), headers)
+            return
+
+        try:
+            content, structured = self._reply_content(api, request)
+        except _InvalidRequest as e:
+            await self._send_json(writer, 400, _error(api, "invalid_request_error", str(e)), headers)
+            return
+        input_tokens = estimate_tokens(json.dumps(request.get("messages", [])) + json.dumps(request.get("system", "")))
+        output_tokens = self.profile.output_tokens if not structured else estimate_tokens(json.dumps(content))
+        self.stats.output_tokens += output_tokens
+        await asyncio.sleep(self.profile.latency.sample(self._rng))
+        if request.get("stream"):
+            self.stats.streamed += 1
+            await self._stream(writer, api, request, content, input_tokens, output_tokens, headers)
+            return
+        if self.profile.tokens_per_second:
+            await asyncio.sleep(output_tokens / self.profile.tokens_per_second)
+        if api == "openai":
+            payload = _openai_completion(request, content, input_tokens, output_tokens)
+        else:
+            payload = _anthropic_message(request, content, structured, input_tokens, output_tokens)
+        await self._send_json(writer, 200, payload, headers)
+
+    def _reply_content(self, api: str, request: Dict[str, Any]) -> Tuple[Any, bool]:
+        """Text for plain requests, or a schema-conforming object for structured ones."""
+        if api == "openai":
+            response_format = request.get("response_format") or {}
+            if response_format.get("type") == "json_schema":
+                schema = (response_format.get("json_schema") or {}).get("schema")
+                if not isinstance(schema, dict):
+                    raise _InvalidRequest("response_format.json_schema.schema is required")
+                return json.dumps(sample_from_schema(schema, rng=self._rng)), False
+            if response_format.get("type") == "json_object":
+                return json.dumps({"content": self._text()}), False
+            return self._text(), False
+        tool_choice = request.get("tool_choice") or {}
+        if tool_choice.get("type") == "tool":
+            tool = next((t for t in request.get("tools") or [] if t.get("name") == tool_choice.get("name")), None)
+            if tool is None or not isinstance(tool.get("input_schema"), dict):
+                raise _InvalidRequest(f"tool_choice names {tool_choice.get('name')!r}, but no tool with that name "
+                                      f"and an input_schema was given")
+            return {"name": tool["name"], "input": sample_from_schema(tool["input_schema"], rng=self._rng)}, True
+        return self._text(), False
+
+    def _text(self) -> str:
+        return " ".join(self._rng.choice(_WORDS) for _ in range(self.profile.output_tokens))
+
+    async def _stream(self, writer, api: str, request: Dict[str, Any], content: Any, input_tokens: int,
+                      output_tokens: int, headers: List[Tuple[str, str]]):
+        await self._send_head(writer, 200, "text/event-stream", headers + [("transfer-encoding", "chunked")])
+        pieces = content.split(" ") if isinstance(content, str) else [json.dumps(content)]
+        delay = output_tokens / self.profile.tokens_per_second / len(pieces) if self.profile.tokens_per_second else 0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}" if api == "openai" else f"msg_{uuid.uuid4().hex[:24]}"
+
+        async def event(data: Dict[str, Any], name: Optional[str] = None):
+            prefix = f"event: {name}\n" if name else ""
+            await _write_chunk(writer, f"{prefix}data: {json.dumps(data)}\n\n".encode())
+
+        if api == "openai":
+            base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": request.get("model")}
+            for i, piece in enumerate(pieces):
+                text = piece if i == 0 else " " + piece
+                await event({**base, "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]})
+                await asyncio.sleep(delay)
+            await event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                await event({**base, "choices": [], "usage": _openai_usage(input_tokens, output_tokens)})
+            await _write_chunk(writer, b"data: [DONE]\n\n")
+        else:
+            message = _anthropic_message(request, "", False, input_tokens, 1)
+            message["content"] = []
+            await event({"type": "message_start", "message": message}, "message_start")
+            await event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                        "content_block_start")
+            for i, piece in enumerate(pieces):
+                text = piece if i == 0 else " " + piece
+                await event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}},
+                            "content_block_delta")
+                await asyncio.sleep(delay)
+            await event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            await event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                         "usage": {"output_tokens": output_tokens}}, "message_delta")
+            await event({"type": "message_stop"}, "message_stop")
+        await _write_chunk(writer, b"")
+
+    async def _send_json(self, writer, status: int, payload: Any, headers: Optional[List[Tuple[str, str]]] = None):
+        body = json.dumps(payload).encode()
+        await self._send_head(writer, status, "application/json", (headers or []) + [("content-length", str(len(body)))])
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_head(self, writer, status: int, content_type: str, headers: List[Tuple[str, str]]):
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"content-type: {content_type}",
+                 f"x-request-id: req_{uuid.uuid4().hex[:16]}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        await writer.drain()
+
+
+def _error(api: str, kind: str, message: str) -> Dict[str, Any]:
+    if api == "openai":
+        return {"error": {"message": message, "type": kind, "code": None}}
+    return {"type": "error", "error": {"type": kind, "message": message}}
+
+
+def _rate_limit_headers(api: str, limit: int, remaining: int, reset: float) -> List[Tuple[str, str]]:
+    if api == "openai":
+        return [("x-ratelimit-limit-requests", str(limit)), ("x-ratelimit-remaining-requests", str(remaining)),
+                ("x-ratelimit-reset-requests", f"{reset:.0f}s")]
+    reset_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + reset))
+    return [("anthropic-ratelimit-requests-limit", str(limit)),
+            ("anthropic-ratelimit-requests-remaining", str(remaining)),
+            ("anthropic-ratelimit-requests-reset", reset_at)]
+
+
+def _openai_usage(input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    return {"prompt_tokens": input_tokens, "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+def _openai_completion(request: Dict[str, Any], content: str, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content, "refusal": None},
+                     "finish_reason": "stop", "logprobs": None}],
+        "usage": _openai_usage(input_tokens, output_tokens),
+    }
+
+
+def _anthropic_message(request: Dict[str, Any], content: Any, structured: bool, input_tokens: int,
+                       output_tokens: int) -> Dict[str, Any]:
+    if structured:
+        blocks = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:24]}", **content}]
+    else:
+        blocks = [{"type": "text", "text": content}]
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model"),
+        "content": blocks,
+        "stop_reason": "tool_use" if structured else "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                  "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0},
+    }
+
+
+async def _write_chunk(writer, data: bytes):
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+    await writer.drain()
+
+
+@dataclass
+class LoadReport:
+    requests: int
+    errors: int
+    duration: float
+    throughput: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+    def __str__(self) -> str:
+        return (f"{self.requests} requests ({self.errors} errors) in {self.duration:.2f}s: "
+                f"{self.throughput:.1f} req/s, latency p50={self.p50 * 1000:.0f}ms "
+                f"p90={self.p90 * 1000:.0f}ms p99={self.p99 * 1000:.0f}ms max={self.max * 1000:.0f}ms")
+
+
+def run_load(call: Callable[[int], Any], requests: int = 1000, concurrency: int = 100,
+             is_error: Callable[[Any], bool] = lambda r: isinstance(r, str) and r.startswith(("Error", "Bad Request"))
+             ) -> LoadReport:
+    """Issue `requests` calls of `call(i)` from `concurrency` threads and report throughput and latency percentiles."""
+    latencies: List[float] = [0.0] * requests
+    failed: List[bool] = [False] * requests
+
+    def timed(i: int):
+        started = time.perf_counter()
+        try:
+            failed[i] = is_error(call(i))
+        except Exception as e:
+            logger.debug(f"Load request {i} raised: {e}")
+            failed[i] = True
+        latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="smartllm-load") as executor:
+        list(executor.map(timed, range(requests)))
+    duration = time.perf_counter() - started
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if requests else (0.0, 0.0, 0.0)
+    return LoadReport(requests=requests, errors=sum(failed), duration=duration,
+                      throughput=requests / duration if duration else 0.0,
+                      p50=float(p50), p90=float(p90), p99=float(p99), max=max(latencies, default=0.0))
+
+
+def _profile_from_args(args) -> EmulatorProfile:
+    return EmulatorProfile(
+        latency=LatencyProfile(args.latency, args.latency_mean, args.latency_spread),
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_429_rate=args.error_429_rate,
+        error_5xx_rate=args.error_5xx_rate,
+        requests_per_minute=args.rpm,
+        seed=args.seed,
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m smartllm.emulator",
+                                     description="Emulate the OpenAI and Anthropic APIs locally for load testing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    server = subparsers.add_parser("serve", help="Run the emulator until interrupted")
+    load = subparsers.add_parser("load", help="Drive a SmartLLM driver against an in-process emulator")
+    for sub in (server, load):
+        sub.add_argument("--latency", default="lognormal", choices=["constant", "uniform", "lognormal", "exponential"])
+        sub.add_argument("--latency-mean", type=float, default=0.3, help="Mean time to first token in seconds")
+        sub.add_argument("--latency-spread", type=float, default=0.5)
+        sub.add_argument("--tokens-per-second", type=float, default=100.0)
+        sub.add_argument("--output-tokens", type=int, default=50)
+        sub.add_argument("--error-429-rate", type=float, default=0.0)
+        sub.add_argument("--error-5xx-rate", type=float, default=0.0)
+        sub.add_argument("--rpm", type=int, default=None, help="Requests per minute before real 429s")
+        sub.add_argument("--seed", type=int, default=None)
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8088)
+    load.add_argument("--provider", default="openai", choices=["openai", "anthropic"])
+    load.add_argument("--model", default=None)
+    load.add_argument("--requests", type=int, default=1000)
+    load.add_argument("--concurrency", type=int, default=100)
+    load.add_argument("--stream", action="store_true", help="Use the streaming code path")
+    load.add_argument("--circuit-breaker", action="store_true",
+                      help="Keep the drivers' circuit breaker on; by default it is off so injected errors are measured")
+    args = parser.parse_args(argv)
+
+    emulator_profile = _profile_from_args(args)
+    if args.command == "serve":
+        emulator = ProviderEmulator(emulator_profile, args.host, args.port)
+        print(f"OPENAI_BASE_URL={emulator.openai_base_url} ANTHROPIC_BASE_URL={emulator.anthropic_base_url}")
+        asyncio.run(emulator.serve_forever())
+    elif args.command == "load":
+        from .context import call_context
+        from .driver_factory import DriverFactory
+
+        with ProviderEmulator(emulator_profile).running() as emulator:
+            os.environ.update({"OPENAI_BASE_URL": emulator.openai_base_url, "OPENAI_API_KEY": "emulator",
+                               "ANTHROPIC_BASE_URL": emulator.anthropic_base_url, "ANTHROPIC_API_KEY": "emulator"})
+            model = args.model or ("gpt-4o-mini" if args.provider == "openai" else "claude-3-5-haiku-20241022")
+            driver = DriverFactory.create(args.provider, model, circuit_breaker=args.circuit_breaker)
+
+            def call(i: int):
+                if args.stream:
+                    with call_context(on_delta=lambda text: None):
+                        return driver.generate(f"Request {i}")
+                return driver.generate(f"Request {i}")
+
+            report = run_load(call, args.requests, args.concurrency)
+        print(report)
+        print(f"Emulator: {asdict(emulator.stats)}")
+
+
+if __name__ == "__main__":
+    main()
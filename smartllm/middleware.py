@@ -0,0 +1,148 @@
+import inspect
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from .tools import ToolSet
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMRequest:
+    """A normalized driver call, as seen by every middleware stage."""
+    prompt: str
+    response_format: Any = None
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    function: Optional[str] = None
+    caller: Optional[str] = None
+    model: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.perf_counter)
+    # Stable context sent ahead of the prompt so providers can cache it
+    prefix: Optional[str] = None
+    # Driver-only keyword arguments, never passed on to the configured function
+    options: Dict[str, Any] = field(default_factory=dict)
+    # Earlier turns of the current session, sent as conversation history ahead of the prompt
+    messages: Optional[List[Dict[str, str]]] = None
+    # Local tools the model may call, kept apart from the prompt arguments so none of them can shadow it
+    tools: Optional["ToolSet"] = None
+
+    @property
+    def full_prompt(self) -> str:
+        return f"{self.prefix}\n\n{self.prompt}" if self.prefix else self.prompt
+
+
+class Middleware:
+    """A stage wrapped around every driver call.
+
+    Override `before` / `after` for logic that works on both the sync and async paths: returning
+    anything other than None from `before` short-circuits the call. Override `handle` / `ahandle`
+    to wrap the rest of the chain directly, e.g. for retries.
+    """
+
+    def before(self, request: LLMRequest) -> Any:
+        return None
+
+    def after(self, request: LLMRequest, result: Any) -> Any:
+        return result
+
+    def handle(self, request: LLMRequest, call_next: Callable[[LLMRequest], Any]) -> Any:
+        result = self.before(request)
+        if result is not None:
+            return result
+        return self.after(request, call_next(request))
+
+    async def ahandle(self, request: LLMRequest, call_next: Callable[[LLMRequest], Awaitable[Any]]) -> Any:
+        result = self.before(request)
+        if result is not None:
+            return result
+        return self.after(request, await call_next(request))
+
+
+class FunctionMiddleware(Middleware):
+    """Adapts a plain `fn(request, call_next)` (or `async def`) into a middleware stage."""
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.is_async = inspect.iscoroutinefunction(fn)
+
+    def handle(self, request, call_next):
+        if self.is_async:
+            raise TypeError(f"Async middleware {self.fn.__name__} cannot run on the sync call path")
+        return self.fn(request, call_next)
+
+    async def ahandle(self, request, call_next):
+        if self.is_async:
+            return await self.fn(request, call_next)
+        raise TypeError(f"Sync middleware {self.fn.__name__} cannot run on the async call path; subclass Middleware instead")
+
+
+def as_middleware(middleware: Any) -> Middleware:
+    if isinstance(middleware, Middleware):
+        return middleware
+    if callable(middleware):
+        return FunctionMiddleware(middleware)
+    raise TypeError(f"Not a middleware: {middleware!r}")
+
+
+class MiddlewarePipeline:
+    def __init__(self, middlewares: Sequence[Middleware]):
+        self.middlewares = list(middlewares)
+
+    def run(self, request: LLMRequest, terminal: Callable[[LLMRequest], Any]) -> Any:
+        middlewares = self.middlewares
+
+        def dispatch(index: int, req: LLMRequest) -> Any:
+            if index == len(middlewares):
+                return terminal(req)
+            return middlewares[index].handle(req, lambda r: dispatch(index + 1, r))
+
+        return dispatch(0, request)
+
+    async def arun(self, request: LLMRequest, terminal: Callable[[LLMRequest], Awaitable[Any]]) -> Any:
+        middlewares = self.middlewares
+
+        async def dispatch(index: int, req: LLMRequest) -> Any:
+            if index == len(middlewares):
+                return await terminal(req)
+            return await middlewares[index].ahandle(req, lambda r: dispatch(index + 1, r))
+
+        return await dispatch(0, request)
+
+
+class LoggingMiddleware(Middleware):
+    def __init__(self, level: int = logging.INFO):
+        self.level = level
+
+    def before(self, request):
+        logger.log(self.level, f"LLM call: function={request.function} caller={request.caller} model={request.model}")
+
+    def after(self, request, result):
+        elapsed = time.perf_counter() - request.created_at
+        logger.log(self.level, f"LLM call finished: function={request.function} in {elapsed:.2f}s")
+        return result
+
+
+class TimingMiddleware(Middleware):
+    """Records wall-clock latency of every call, grouped by configured function."""
+
+    def __init__(self):
+        self.timings: Dict[Optional[str], List[float]] = defaultdict(list)
+
+    def handle(self, request, call_next):
+        start = time.perf_counter()
+        try:
+            return call_next(request)
+        finally:
+            self.timings[request.function].append(time.perf_counter() - start)
+
+    async def ahandle(self, request, call_next):
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            self.timings[request.function].append(time.perf_counter() - start)
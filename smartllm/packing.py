@@ -0,0 +1,111 @@
+import functools
+import json
+import logging
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, Field, create_model
+
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PACK_INSTRUCTION = (
+    "Complete each of the following {count} independent tasks separately. "
+    "Return a JSON object with one result per task in `items`, with `index` set to the task number. "
+    "It must match this JSON schema: {schema}"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def packed_model(item_model: Type[BaseModel]) -> Type[BaseModel]:
+    """The response format of a packed request: a list of per-item results tagged with their task index."""
+    indexed = create_model(
+        f"Indexed{item_model.__name__}",
+        __base__=item_model,
+        index=(int, Field(description="Number of the task this result answers")),
+    )
+    return create_model(
+        f"Packed{item_model.__name__}",
+        items=(List[indexed], Field(description="One result per task")),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _packed_schema(item_model: Type[BaseModel]) -> str:
+    return json.dumps(packed_model(item_model).model_json_schema(), separators=(",", ":"))
+
+
+def build_packed_prompt(prompts: List[str], item_model: Type[BaseModel]) -> str:
+    tasks = "\n\n".join(f"### Task {i}\n{prompt}" for i, prompt in enumerate(prompts))
+    return f"{PACK_INSTRUCTION.format(count=len(prompts), schema=_packed_schema(item_model))}\n\n{tasks}"
+
+
+def options_key(options: Dict[str, Any]) -> str:
+    """Requests can only share a pack if this key, over their generation options, is the same."""
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+def split_packed_result(result: Any, item_model: Type[BaseModel], count: int) -> Dict[int, BaseModel]:
+    """Validate a packed response back into per-task results; tasks that are missing or invalid are left out."""
+    if isinstance(result, str) and "{" in result:
+        # Drivers without a JSON mode return the object embedded in text
+        try:
+            result = json.loads(result[result.find("{"):result.rfind("}") + 1], strict=False)
+        except json.JSONDecodeError:
+            pass
+    if not isinstance(result, dict) or not isinstance(result.get("items"), list):
+        logger.warning(f"Packed response has no items list: {str(result)[:200]}")
+        return {}
+    parsed = {}
+    for item in result["items"]:
+        if not isinstance(item, dict):
+            continue
+        data = dict(item)
+        index = data.pop("index", None)
+        if not isinstance(index, int) or not 0 <= index < count or index in parsed:
+            continue
+        try:
+            parsed[index] = item_model.model_validate(data)
+        except Exception as e:
+            logger.debug(f"Packed item {index} failed validation: {e}")
+    return parsed
+
+
+class PackPlanner:
+    """Groups prompts into packs that fit an input and output token budget.
+
+    Output size per item is learned from the results of earlier packs, so packs shrink for
+    verbose items and grow for terse ones.
+    """
+
+    def __init__(self, max_input_tokens: int = 8000, max_output_tokens: int = 4000, max_pack_size: int = 32,
+                 initial_output_tokens: int = 200):
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_pack_size = max_pack_size
+        self.output_tokens_per_item = float(initial_output_tokens)
+
+    def plan(self, prompts: List[str], prefix: Optional[str] = None) -> List[List[int]]:
+        # The shared prefix is sent with every pack, so it counts against each pack's input budget
+        overhead = estimate_tokens(PACK_INSTRUCTION) + (estimate_tokens(prefix) if prefix else 0)
+        packs, current, input_tokens = [], [], overhead
+        for i, prompt in enumerate(prompts):
+            tokens = estimate_tokens(prompt)
+            output_tokens = (len(current) + 1) * self.output_tokens_per_item
+            if current and (input_tokens + tokens > self.max_input_tokens
+                            or output_tokens > self.max_output_tokens
+                            or len(current) >= self.max_pack_size):
+                packs.append(current)
+                current, input_tokens = [], overhead
+            current.append(i)
+            input_tokens += tokens
+        if current:
+            packs.append(current)
+        return packs
+
+    def observe(self, results: List[BaseModel]):
+        if not results:
+            return
+        per_item = sum(estimate_tokens(json.dumps(r.model_dump(mode="json"))) for r in results) / len(results)
+        # Exponential moving average keeps the estimate responsive without overreacting to one pack
+        self.output_tokens_per_item = 0.7 * self.output_tokens_per_item + 0.3 * per_item
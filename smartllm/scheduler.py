@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from . import tracing
+from .context import call_context, get_call_context
+from .middleware import LLMRequest, Middleware
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PriorityClass:
+    """A class of traffic. Lower `rank` is served first; `max_concurrency` caps how many of its calls run at once."""
+    rank: int
+    max_concurrency: Optional[int] = None
+
+
+def default_classes(max_concurrency: int) -> Dict[str, PriorityClass]:
+    # Batch work never takes the last quarter of the slots, so interactive calls find one free
+    return {
+        "interactive": PriorityClass(rank=0),
+        "default": PriorityClass(rank=1),
+        "batch": PriorityClass(rank=2, max_concurrency=max(1, max_concurrency * 3 // 4)),
+    }
+
+
+@contextmanager
+def scheduling(priority: Optional[str] = None, tenant: Optional[str] = None):
+    """Tag the LLM calls made in the block with a priority class and a tenant for the scheduler."""
+    fields = {k: v for k, v in (("priority", priority), ("tenant", tenant)) if v is not None}
+    with call_context(**fields):
+        yield
+
+
+class _Ticket:
+    """A queued call waiting for a slot; granted from whichever thread releases one."""
+
+    def __init__(self, priority: str, tenant: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.tenant = tenant
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class _QueueStats:
+    def __init__(self, samples: int = 1000):
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent: Deque[float] = deque(maxlen=samples)
+
+    def add(self, wait: float):
+        self.completed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent.append(wait)
+
+    def as_dict(self) -> Dict[str, float]:
+        recent = sorted(self.recent)
+        return {
+            "completed": self.completed,
+            "mean_wait": self.total_wait / self.completed if self.completed else 0.0,
+            "p50_wait": recent[len(recent) // 2] if recent else 0.0,
+            "p95_wait": recent[int(len(recent) * 0.95)] if recent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class Scheduler(Middleware):
+    """Admits driver calls by priority class, then by weighted fair queuing across tenants.
+
+    At most `max_concurrency` calls run at once across everything the scheduler is attached to. A free
+    slot always goes to the highest-priority class that has waiting calls and is under its own cap.
+    Within a class, tenants share the slots in proportion to `tenant_weights`, measured in prompt
+    tokens, so one large job cannot starve the others. Priority and tenant come from the call context
+    (see `scheduling`); the tenant defaults to the current run, then to the caller.
+    """
+
+    def __init__(self, max_concurrency: int = 8, classes: Optional[Dict[str, PriorityClass]] = None,
+                 default_priority: str = "default", tenant_weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.classes = classes or default_classes(max_concurrency)
+        if default_priority not in self.classes:
+            raise ValueError(f"Default priority {default_priority} is not one of {list(self.classes)}")
+        self.default_priority = default_priority
+        self.tenant_weights = tenant_weights or {}
+        self.running: Dict[str, int] = defaultdict(int)
+        self.stats: Dict[str, _QueueStats] = defaultdict(_QueueStats)
+        # Per class: heap of (virtual finish time, sequence, ticket) plus each tenant's last finish time
+        self._queues: Dict[str, List[Tuple[float, int, _Ticket]]] = defaultdict(list)
+        self._finish: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._virtual_time: Dict[str, float] = defaultdict(float)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def handle(self, request: LLMRequest, call_next: Callable[[LLMRequest], Any]) -> Any:
+        ticket = self._enqueue(request, None)
+        if ticket is not None:
+            ticket.event.wait()
+        self._started(request)
+        try:
+            return call_next(request)
+        finally:
+            self._release(request.metadata["priority"])
+
+    async def ahandle(self, request: LLMRequest, call_next) -> Any:
+        ticket = self._enqueue(request, asyncio.get_running_loop())
+        if ticket is not None:
+            try:
+                await ticket.future
+            except asyncio.CancelledError:
+                self._cancel(ticket)
+                raise
+        self._started(request)
+        priority = request.metadata["priority"]
+        call = asyncio.ensure_future(call_next(request))
+        try:
+            result = await asyncio.shield(call)
+        except asyncio.CancelledError:
+            # Cancelling cannot stop the driver's worker thread, so the call keeps its slot until it returns
+            call.add_done_callback(lambda done: self._abandoned(done, priority))
+            raise
+        except BaseException:
+            self._release(priority)
+            raise
+        self._release(priority)
+        return result
+
+    def _abandoned(self, call: asyncio.Future, priority: str):
+        if not call.cancelled() and call.exception() is not None:
+            logger.debug(f"Abandoned call failed: {call.exception()!r}")
+        self._release(priority)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Running and queued calls plus queue-time statistics per priority class."""
+        with self._lock:
+            return {
+                name: {"running": self.running[name], "queued": len(self._queues[name]),
+                       **self.stats[name].as_dict()}
+                for name in self.classes
+            }
+
+    def _classify(self, request: LLMRequest) -> Tuple[str, str]:
+        context = get_call_context()
+        priority = context.get("priority") or self.default_priority
+        if priority not in self.classes:
+            logger.warning(f"Unknown priority class {priority}, using {self.default_priority}")
+            priority = self.default_priority
+        run = context.get("run")
+        tenant = context.get("tenant") or (run.run_id if run is not None else None) or request.caller or "default"
+        return priority, tenant
+
+    def _enqueue(self, request: LLMRequest, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Ticket]:
+        """Queue a ticket for the call; returns None if it was granted a slot straight away."""
+        priority, tenant = self._classify(request)
+        request.metadata.update(priority=priority, tenant=tenant, scheduled_at=time.perf_counter())
+        ticket = _Ticket(priority, tenant, loop)
+        with self._lock:
+            cost = estimate_tokens(request.full_prompt) / self.tenant_weights.get(tenant, 1.0)
+            start = max(self._virtual_time[priority], self._finish[priority].get(tenant, 0.0))
+            self._finish[priority][tenant] = start + cost
+            heapq.heappush(self._queues[priority], (start + cost, next(self._sequence), ticket))
+            self._dispatch()
+        if ticket.granted:
+            return None
+        logger.debug(f"Queued {request.function} for tenant {tenant} in class {priority}")
+        return ticket
+
+    def _has_slot(self, priority: str) -> bool:
+        cap = self.classes[priority].max_concurrency
+        return sum(self.running.values()) < self.max_concurrency and (cap is None or self.running[priority] < cap)
+
+    def _release(self, priority: str):
+        with self._lock:
+            self.running[priority] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to queued tickets, highest priority first. Called with the lock held."""
+        for name in sorted(self.classes, key=lambda n: self.classes[n].rank):
+            queue = self._queues[name]
+            while queue and self._has_slot(name):
+                finish, _, ticket = heapq.heappop(queue)
+                self._virtual_time[name] = max(self._virtual_time[name], finish)
+                # A tag at or behind virtual time no longer affects the next start, so drop it
+                if self._finish[name].get(ticket.tenant, 0.0) <= self._virtual_time[name]:
+                    self._finish[name].pop(ticket.tenant, None)
+                self.running[name] += 1
+                ticket.grant()
+
+    def _cancel(self, ticket: _Ticket):
+        with self._lock:
+            queue = self._queues[ticket.priority]
+            for i, (_, _, queued) in enumerate(queue):
+                if queued is ticket:
+                    queue.pop(i)
+                    heapq.heapify(queue)
+                    if not any(other.tenant == ticket.tenant for _, _, other in queue):
+                        # The tenant gave up its only queued call, so it is owed no later start
+                        self._finish[ticket.priority].pop(ticket.tenant, None)
+                    return
+            # Granted just as the caller gave up: hand the slot on
+            self.running[ticket.priority] -= 1
+            self._dispatch()
+
+    def _started(self, request: LLMRequest):
+        wait = time.perf_counter() - request.metadata["scheduled_at"]
+        with self._lock:
+            self.stats[request.metadata["priority"]].add(wait)
+        tracing.set_attribute("scheduler_wait", wait)
+        tracing.set_attribute("priority", request.metadata["priority"])
@@ -0,0 +1,103 @@
+import copy
+import functools
+import inspect
+import re
+from typing import Any, Callable, Dict, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+# Keywords OpenAI's strict mode rejects; Pydantic still enforces them when the response is validated
+_UNSUPPORTED_STRICT_KEYWORDS = {
+    "default", "format", "pattern", "minLength", "maxLength", "minimum", "maximum", "exclusiveMinimum",
+    "exclusiveMaximum", "multipleOf", "minItems", "maxItems", "minProperties", "maxProperties",
+    "patternProperties", "unevaluatedProperties",
+}
+
+
+def schema_name(model: Type[BaseModel]) -> str:
+    """A name valid for OpenAI schema names and Anthropic tool names."""
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", model.__name__)[:64]
+
+
+@functools.lru_cache(maxsize=None)
+def signature_model(fn: Callable, name: str, skip: int = 0) -> Type[BaseModel]:
+    """A model with one field per parameter of `fn`, after the first `skip` parameters."""
+    parameters = list(inspect.signature(fn).parameters.values())[skip:]
+    fields = {
+        p.name: (Any if p.annotation is inspect.Parameter.empty else p.annotation,
+                 ... if p.default is inspect.Parameter.empty else p.default)
+        for p in parameters
+        if p.kind not in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+    }
+    return create_model(name, **fields)
+
+
+def _make_strict(node: Any) -> bool:
+    """Rewrite a schema in place for strict mode. Returns False if it has free-form objects strict mode cannot express."""
+    if not isinstance(node, dict):
+        return True
+    strict = True
+    for keyword in _UNSUPPORTED_STRICT_KEYWORDS & node.keys():
+        del node[keyword]
+    if node.get("type") == "object" or "properties" in node:
+        additional = node.get("additionalProperties")
+        if "properties" not in node or isinstance(additional, dict) or additional is True:
+            # Dict[str, X] fields: keys are not known up front
+            strict = False
+        else:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+    children = [node.get("items"), node.get("additionalProperties")]
+    for key in ("properties", "$defs"):
+        children.extend(node.get(key, {}).values())
+    for key in ("anyOf", "allOf", "oneOf", "prefixItems"):
+        children.extend(node.get(key, []))
+    for child in children:
+        strict = _make_strict(child) and strict
+    return strict
+
+
+@functools.lru_cache(maxsize=None)
+def strict_json_schema(model: Type[BaseModel]) -> Tuple[Dict[str, Any], bool]:
+    """The model's JSON schema adapted for OpenAI structured outputs, and whether strict mode can be used."""
+    schema = copy.deepcopy(model.model_json_schema())
+    strict = _make_strict(schema)
+    if not strict:
+        schema = model.model_json_schema()
+    return schema, strict
+
+
+@functools.lru_cache(maxsize=None)
+def openai_response_format(model: Type[BaseModel]) -> Dict[str, Any]:
+    schema, strict = strict_json_schema(model)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema_name(model), "schema": schema, "strict": strict},
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def anthropic_tool(model: Type[BaseModel]) -> Dict[str, Any]:
+    """A tool whose input schema is the model, so forcing the tool call yields a response of that shape."""
+    description = (model.__doc__ or "").strip() or f"Record the response as a {model.__name__} object."
+    return {
+        "name": schema_name(model),
+        "description": description,
+        "input_schema": model.model_json_schema(),
+        "cache_control": {"type": "ephemeral"},
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def openai_function_tool(model: Type[BaseModel], name: str, description: str) -> Dict[str, Any]:
+    """A function tool for chat completions whose parameters are the fields of the model."""
+    schema, strict = strict_json_schema(model)
+    return {
+        "type": "function",
+        "function": {"name": name, "description": description, "parameters": schema, "strict": strict},
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def anthropic_function_tool(model: Type[BaseModel], name: str, description: str) -> Dict[str, Any]:
+    return {"name": name, "description": description, "input_schema": model.model_json_schema()}
@@ -0,0 +1,229 @@
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+from pydantic import BaseModel
+
+from .artifacts import ArtifactRef
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("json", "yaml", "tsv", "repr")
+
+_YAML_PLAIN_RE = re.compile(r"^[A-Za-z_][\w .,/()'-]*$")
+_YAML_RESERVED = {"true", "false", "yes", "no", "on", "off", "null", "none", "~"}
+
+
+def to_json(value: Any) -> str:
+    """Minified, key-sorted JSON: the most compact stable rendering."""
+    return json.dumps(value, separators=(",", ":"), sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _yaml_scalar(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    text = str(value)
+    if _YAML_PLAIN_RE.match(text) and text.lower() not in _YAML_RESERVED and text == text.strip():
+        return text
+    return json.dumps(text, ensure_ascii=False)
+
+
+def _yaml_lines(value: Any, indent: str) -> list:
+    lines = []
+    if isinstance(value, dict):
+        for key in sorted(value, key=str):
+            item = value[key]
+            if isinstance(item, (dict, list)) and item and not _is_flat_list(item):
+                lines.append(f"{indent}{_yaml_scalar(key)}:")
+                # Block sequences may sit at the key's own indentation
+                lines.extend(_yaml_lines(item, indent if isinstance(item, list) else indent + " "))
+            else:
+                lines.append(f"{indent}{_yaml_scalar(key)}: {_yaml_inline(item)}")
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)) and item and not _is_flat_list(item):
+                nested = _yaml_lines(item, indent + "  ")
+                # Hoist the first nested line onto the dash line
+                lines.append(f"{indent}- {nested[0].lstrip()}")
+                lines.extend(nested[1:])
+            else:
+                lines.append(f"{indent}- {_yaml_inline(item)}")
+    else:
+        lines.append(f"{indent}{_yaml_scalar(value)}")
+    return lines
+
+
+def _is_flat_list(value: Any) -> bool:
+    return isinstance(value, list) and all(not isinstance(v, (dict, list)) for v in value)
+
+
+def _yaml_inline(value: Any) -> str:
+    if isinstance(value, list):
+        return "[" + ", ".join(_yaml_scalar(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{}"
+    return _yaml_scalar(value)
+
+
+def to_yaml(value: Any) -> str:
+    """Compact block YAML with sorted keys, minimal indentation and flow-style scalar lists."""
+    return "\n".join(_yaml_lines(value, ""))
+
+
+def _tsv_cell(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        value = to_json(value)
+    elif value is None:
+        value = ""
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def to_tsv(value: Any) -> str:
+    """Tab-separated rendering for tables (lists of dicts), mappings and lists; other shapes fall back to JSON."""
+    if isinstance(value, list) and value and all(isinstance(row, dict) for row in value):
+        columns = sorted({key for row in value for key in row}, key=str)
+        lines = ["\t".join(_tsv_cell(c) for c in columns)]
+        lines.extend("\t".join(_tsv_cell(row.get(c)) for c in columns) for row in value)
+        return "\n".join(lines)
+    if isinstance(value, dict):
+        return "\n".join(f"{_tsv_cell(k)}\t{_tsv_cell(value[k])}" for k in sorted(value, key=str))
+    if isinstance(value, list):
+        return "\n".join(_tsv_cell(v) for v in value)
+    return to_json(value)
+
+
+_RENDERERS = {
+    "json": to_json,
+    "yaml": to_yaml,
+    "tsv": to_tsv,
+    "repr": str,
+}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize(v) for v in value), key=str)
+    return value
+
+
+# Leaves a snapshot can share with the argument, since they cannot change in place
+_IMMUTABLE = (str, int, float, bool, type(None), ArtifactRef)
+
+
+def _immutable_leaves(value: Any) -> bool:
+    if isinstance(value, dict):
+        return all(_immutable_leaves(v) for v in value.values())
+    if isinstance(value, list):
+        return all(_immutable_leaves(v) for v in value)
+    return isinstance(value, _IMMUTABLE)
+
+
+class RenderMemo:
+    """LRU memo of rendered arguments, keyed by object identity and validated against a snapshot.
+
+    The snapshot is the normalized value the rendering was made from: fresh containers that share the
+    argument's leaves, so taking it costs nothing beyond the rendering itself. Arguments with mutable
+    leaves are not memoized.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, value: Any, fmt: str) -> Optional[str]:
+        key = (id(value), fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            # Arguments like the chapters dict are mutated in place between calls,
+            # so identity alone is not enough to reuse a rendering
+            if entry is not None and entry[0] is type(value) and entry[1] == value:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, value: Any, fmt: str, text: str, snapshot: Any = None):
+        """Remember `text` as the rendering of `value`; pass `_normalize(value)` as `snapshot` if at hand."""
+        snapshot = _normalize(value) if snapshot is None else snapshot
+        if not _immutable_leaves(snapshot):
+            logger.debug(f"Not memoizing rendering of a {type(value).__name__} with mutable leaves")
+            return
+        with self._lock:
+            self._entries[(id(value), fmt)] = (type(value), snapshot, text)
+            self._entries.move_to_end((id(value), fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_shared_memo = RenderMemo()
+
+
+class ArgumentSerializer:
+    """Renders structured prompt arguments (dicts, lists, Pydantic models) into compact, stable text.
+
+    Strings and scalars are passed through untouched. `formats` overrides the default per parameter name.
+    """
+
+    def __init__(self, default: str = "json", formats: Optional[Dict[str, str]] = None,
+                 memo: Optional[RenderMemo] = None):
+        for fmt in [default, *(formats or {}).values()]:
+            if fmt not in FORMATS:
+                raise ValueError(f"Unknown argument format: {fmt}. Expected one of {FORMATS}")
+        self.default = default
+        self.formats = dict(formats or {})
+        self.memo = memo if memo is not None else _shared_memo
+
+    def render(self, name: str, value: Any) -> Any:
+        if not isinstance(value, (dict, list, tuple, set, frozenset, BaseModel)):
+            return value
+        fmt = self.formats.get(name, self.default)
+        if fmt == "repr":
+            return value
+        # A snapshot of anything else normalizes to a different type and could never match
+        memoize = isinstance(value, (dict, list))
+        if memoize:
+            cached = self.memo.get(value, fmt)
+            if cached is not None:
+                return cached
+        normalized = _normalize(value)
+        text = _RENDERERS[fmt](normalized)
+        if memoize:
+            self.memo.put(value, fmt, text, normalized)
+        return text
+
+    def render_all(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: self.render(name, value) for name, value in kwargs.items()}
+
+    @classmethod
+    def from_setting(cls, setting: Union[str, Dict[str, str], "ArgumentSerializer", None]) -> "ArgumentSerializer":
+        if isinstance(setting, ArgumentSerializer):
+            return setting
+        if setting is None:
+            return cls(default="repr")
+        if isinstance(setting, str):
+            return cls(default=setting)
+        if isinstance(setting, dict):
+            formats = dict(setting)
+            return cls(default=formats.pop("*", "json"), formats=formats)
+        raise ValueError(f"Invalid serialize setting: {setting!r}")
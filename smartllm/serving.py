@@ -0,0 +1,259 @@
+import asyncio
+import inspect
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from urllib.parse import parse_qs
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic_core import to_jsonable_python
+
+from .context import StreamCancelled, call_context
+from .core import _response_model
+from .drivers.circuit_breaker import CircuitOpenError
+from .schema import signature_model
+
+logger = logging.getLogger(__name__)
+
+
+class FunctionEndpoint:
+    """Request and response schemas of one configured function, derived from its signature."""
+
+    def __init__(self, name: str, fn: Callable):
+        self.name = name
+        self.fn = fn
+        # The first parameter receives the LLM response, the rest are the request arguments
+        self.request_model: Type[BaseModel] = signature_model(fn, f"{name}_request", skip=1)
+        self.response_format = _response_model(fn)
+        return_annotation = inspect.signature(fn).return_annotation
+        self.response_schema: Dict[str, Any] = {}
+        if return_annotation is not inspect.Signature.empty:
+            try:
+                self.response_schema = TypeAdapter(return_annotation).json_schema()
+            except Exception as e:
+                logger.debug(f"No JSON schema for the return type of {name}: {e}")
+
+    def schema(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": inspect.getdoc(self.fn),
+            "request": self.request_model.model_json_schema(),
+            "response": self.response_schema,
+            "response_format": self.response_format.model_json_schema() if self.response_format else None,
+        }
+
+    def parse(self, body: bytes) -> Dict[str, Any]:
+        arguments = self.request_model.model_validate_json(body or b"{}")
+        # Keep the validated values (e.g. nested models) rather than their JSON form
+        return {name: getattr(arguments, name) for name in self.request_model.model_fields}
+
+
+class SmartLLMApp:
+    """ASGI application exposing every configured function of a SmartLLM instance as a JSON endpoint.
+
+    Routes: `GET /functions` lists the functions with their schemas, `GET /functions/{name}` returns one,
+    and `POST /functions/{name}` calls it with the JSON body as keyword arguments. Add `?stream=true` (or
+    send `Accept: text/event-stream`) to receive text deltas and the result as server-sent events.
+
+    At most `max_concurrency` calls run at once and up to `max_queue` more wait for a slot; requests
+    beyond that are rejected with 429 so clients back off instead of piling up behind a slow provider.
+
+    Calls are scheduled with `default_priority`, or the scheduler's own default when it is None. The
+    `X-Priority` header is honoured only with `priority_header=True`, for servers whose clients are trusted
+    to pick their class; the `X-Tenant` header always sets the tenant.
+    """
+
+    def __init__(self, llm, max_concurrency: int = 8, max_queue: int = 64, retry_after: int = 1,
+                 default_priority: Optional[str] = None, priority_header: bool = False):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.default_priority = default_priority
+        self.priority_header = priority_header
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._endpoints: Dict[str, FunctionEndpoint] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/")
+        if path == "/health":
+            await _send_json(send, 200, {"status": "ok", "in_flight": self.in_flight, "queued": self.queued,
+                                         "rejected": self.rejected})
+        elif path == "/functions":
+            await _send_json(send, 200, {name: self._endpoint(name).schema() for name in self.llm.functions})
+        elif path.startswith("/functions/"):
+            name = path[len("/functions/"):]
+            if name not in self.llm.functions:
+                await _send_json(send, 404, {"error": f"Unknown function: {name}"})
+            elif method == "GET":
+                await _send_json(send, 200, self._endpoint(name).schema())
+            elif method == "POST":
+                await self._call(scope, receive, send, self._endpoint(name))
+            else:
+                await _send_json(send, 405, {"error": f"Method {method} not allowed"})
+        else:
+            await _send_json(send, 404, {"error": f"Not found: {path}"})
+
+    def _endpoint(self, name: str) -> FunctionEndpoint:
+        if name not in self._endpoints:
+            self._endpoints[name] = FunctionEndpoint(name, self.llm.functions[name])
+        return self._endpoints[name]
+
+    async def _call(self, scope, receive, send, endpoint: FunctionEndpoint):
+        try:
+            arguments = endpoint.parse(await _read_body(receive))
+        except ValidationError as e:
+            await _send_json(send, 422, {"error": "Invalid arguments", "detail": json.loads(e.json())})
+            return
+
+        if self.in_flight + self.queued >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Rejecting call to {endpoint.name}: {self.in_flight} running, {self.queued} queued")
+            await _send_json(send, 429, {"error": "Too many requests"},
+                             headers=[(b"retry-after", str(self.retry_after).encode())])
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            with call_context(**_scheduling_fields(scope, self.default_priority, self.priority_header)):
+                await self._respond(scope, send, endpoint, arguments)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _respond(self, scope, send, endpoint: FunctionEndpoint, arguments: Dict[str, Any]):
+        if _wants_stream(scope):
+            await self._stream(send, endpoint, arguments)
+            return
+        try:
+            output = await self._invoke(endpoint, arguments)
+        except CircuitOpenError as e:
+            retry_after = max(1, int(e.retry_at - time.time()))
+            await _send_json(send, 503, {"error": str(e)}, headers=[(b"retry-after", str(retry_after).encode())])
+            return
+        except Exception as e:
+            logger.exception(f"Call to {endpoint.name} failed")
+            await _send_json(send, 500, {"error": str(e)})
+            return
+        await _send_json(send, 200, {"result": to_jsonable_python(output, fallback=str)})
+
+    async def _invoke(self, endpoint: FunctionEndpoint, arguments: Dict[str, Any]) -> Any:
+        return await endpoint.fn.acall(_caller="http", response_format=endpoint.response_format, **arguments)
+
+    async def _stream(self, send, endpoint: FunctionEndpoint, arguments: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def on_delta(text: str):
+            # Drivers run on worker threads; raising here makes the driver close the provider stream
+            if stopped.is_set():
+                raise StreamCancelled(f"Client of {endpoint.name} disconnected")
+            loop.call_soon_threadsafe(deltas.put_nowait, text)
+
+        with call_context(on_delta=on_delta):
+            task = asyncio.create_task(self._invoke(endpoint, arguments))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+            while True:
+                next_delta = asyncio.ensure_future(deltas.get())
+                done, _ = await asyncio.wait({task, next_delta}, return_when=asyncio.FIRST_COMPLETED)
+                if next_delta not in done:
+                    next_delta.cancel()
+                    break
+                await _send_event(send, "delta", {"text": next_delta.result()})
+            while not deltas.empty():
+                await _send_event(send, "delta", {"text": deltas.get_nowait()})
+            try:
+                result = {"result": to_jsonable_python(task.result(), fallback=str)}
+            except Exception as e:
+                logger.exception(f"Streaming call to {endpoint.name} failed")
+                await _send_event(send, "error", {"error": str(e)}, more=False)
+            else:
+                await _send_event(send, "result", result, more=False)
+        finally:
+            # The client went away (send raised or this handler was cancelled): stop the call as well
+            if not task.done():
+                logger.debug(f"Client disconnected, cancelling streaming call to {endpoint.name}")
+                stopped.set()
+                task.cancel()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_app(llm, **options) -> SmartLLMApp:
+    return SmartLLMApp(llm, **options)
+
+
+def serve(llm, host: str = "127.0.0.1", port: int = 8000, **options):
+    """Run the app on uvicorn, which is an optional dependency."""
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise ImportError("Serving requires uvicorn: pip install uvicorn") from e
+    uvicorn.run(create_app(llm, **options), host=host, port=port)
+
+
+def _wants_stream(scope) -> bool:
+    query = parse_qs(scope.get("query_string", b"").decode())
+    if query.get("stream", ["false"])[-1].lower() in ("1", "true", "yes"):
+        return True
+    headers = dict(scope.get("headers") or [])
+    return b"text/event-stream" in headers.get(b"accept", b"")
+
+
+def _scheduling_fields(scope, default_priority: Optional[str], priority_header: bool) -> Dict[str, str]:
+    """Priority and tenant of an HTTP call; see smartllm.scheduler."""
+    headers = dict(scope.get("headers") or [])
+    fields = {"priority": default_priority} if default_priority else {}
+    if priority_header and b"x-priority" in headers:
+        fields["priority"] = headers[b"x-priority"].decode()
+    if b"x-tenant" in headers:
+        fields["tenant"] = headers[b"x-tenant"].decode()
+    return fields
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, payload: Any, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    body = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *(headers or [])]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_event(send, event: str, data: Any, more: bool = True):
+    await send({"type": "http.response.body", "body": f"event: {event}\ndata: {json.dumps(data)}\n\n".encode(),
+                "more_body": more})
@@ -0,0 +1,205 @@
+import contextvars
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .context import call_context, get_call_context
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_PROMPT = (
+    "Summarize the conversation below so it can replace the original turns as context for later requests. "
+    "Keep every decision, name, term, fact and open question that later turns may rely on; drop wording, "
+    "repetition and pleasantries. Reply with the summary only.\n\n"
+    "Summary of earlier turns:\n{summary}\n\nTurns:\n{turns}"
+)
+
+SUMMARY_MESSAGE = "Summary of our conversation so far:\n{summary}"
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    tokens: int
+
+    def as_message(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+def _as_text(result: Any) -> str:
+    if isinstance(result, BaseModel):
+        return result.model_dump_json()
+    if isinstance(result, (dict, list)):
+        return json.dumps(result, default=str)
+    return str(result)
+
+
+class Session:
+    """Message history shared by the LLM calls of one workflow, kept within a token budget.
+
+    Calls made inside `with session:` see the earlier turns as conversation history and are appended
+    to it. Once the history passes `max_tokens`, turns older than the last `keep_recent` exchanges are
+    summarized on a background thread and replaced by the summary. If the history reaches twice the
+    budget before that finishes, the next call waits for it, so input size per call stays bounded.
+    """
+
+    def __init__(self, llm, name: Optional[str] = None, max_tokens: int = 4000, keep_recent: int = 2,
+                 summarizer: Optional[Callable[[str, List[Dict[str, str]]], str]] = None):
+        self.llm = llm
+        self.name = name
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer or self._summarize_with_llm
+        self.summary = ""
+        self.turns: List[Turn] = []
+        self.compactions = 0
+        self._compaction: Optional[Future] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smartllm-session")
+        self._lock = threading.RLock()
+        # Entered contexts per thread, so one session can be used from several threads at once
+        self._entered = threading.local()
+
+    def __enter__(self) -> "Session":
+        context = call_context(session=self)
+        context.__enter__()
+        self._entered.__dict__.setdefault("stack", []).append(context)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._entered.stack.pop().__exit__(*exc_info)
+
+    @property
+    def tokens(self) -> int:
+        with self._lock:
+            summary_tokens = estimate_tokens(self.summary) if self.summary else 0
+            return summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """History to send ahead of the next prompt: the summary of compacted turns, then the recent turns."""
+        if self._compaction is not None and self.tokens > 2 * self.max_tokens:
+            logger.debug(f"Session {self.name} is over twice its budget, waiting for compaction")
+            self.wait()
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({"role": "user", "content": SUMMARY_MESSAGE.format(summary=self.summary)})
+                messages.append({"role": "assistant", "content": "Understood."})
+            return messages + [turn.as_message() for turn in self.turns]
+
+    def record(self, prompt: str, result: Any):
+        """Append one exchange, starting a compaction if the history is over budget."""
+        if isinstance(result, str) and result.startswith(("Error", "Bad Request Error")):
+            return
+        reply = _as_text(result)
+        with self._lock:
+            self.turns.append(Turn("user", prompt, estimate_tokens(prompt)))
+            self.turns.append(Turn("assistant", reply, estimate_tokens(reply)))
+        self._maybe_compact()
+
+    def generate(self, prompt: str, response_format=None, **kwargs) -> Any:
+        with self:
+            return self.llm.generate(prompt, response_format=response_format, **kwargs)
+
+    def compact(self, wait: bool = True):
+        """Summarize older turns now, regardless of the token budget."""
+        self._maybe_compact(force=True)
+        if wait:
+            self.wait()
+
+    def wait(self):
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.result()
+
+    def _maybe_compact(self, force: bool = False):
+        with self._lock:
+            if self._compaction is not None or (not force and self.tokens <= self.max_tokens):
+                return
+            # Cut on an exchange boundary so the remaining history still starts with a user turn
+            cut = len(self.turns) - 2 * self.keep_recent
+            if cut <= 0:
+                return
+            old_turns = [turn.as_message() for turn in self.turns[:cut]]
+            context = contextvars.copy_context()
+            self._compaction = self._executor.submit(context.run, self._compact, self.summary, old_turns, cut)
+
+    def _compact(self, summary: str, old_turns: List[Dict[str, str]], cut: int):
+        try:
+            # The summarizing call is not itself part of the session
+            with call_context(session=None):
+                new_summary = self.summarizer(summary, old_turns)
+            if not new_summary or new_summary.startswith(("Error", "Bad Request Error")):
+                raise ValueError(f"summarizer returned {str(new_summary)[:100]!r}")
+        except Exception as e:
+            logger.warning(f"Compaction of session {self.name} failed, keeping the full history: {e}")
+            with self._lock:
+                self._compaction = None
+            return
+        with self._lock:
+            before = self.tokens
+            self.summary = new_summary
+            del self.turns[:cut]
+            self.compactions += 1
+            self._compaction = None
+            logger.info(f"Compacted session {self.name}: {before} -> {self.tokens} tokens")
+
+    def _summarize_with_llm(self, summary: str, turns: List[Dict[str, str]]) -> str:
+        text = "\n\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return _as_text(self.llm.generate(COMPACTION_PROMPT.format(summary=summary or "(none)", turns=text)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.wait()
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_tokens": self.max_tokens,
+                "keep_recent": self.keep_recent,
+                "summary": self.summary,
+                "compactions": self.compactions,
+                "turns": [asdict(turn) for turn in self.turns],
+            }
+
+    @classmethod
+    def from_dict(cls, llm, data: Dict[str, Any], **options) -> "Session":
+        session = cls(llm, name=data.get("name"), max_tokens=data.get("max_tokens", 4000),
+                      keep_recent=data.get("keep_recent", 2), **options)
+        session.summary = data.get("summary", "")
+        session.compactions = data.get("compactions", 0)
+        session.turns = [Turn(**turn) for turn in data.get("turns", [])]
+        return session
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, llm, path: str, **options) -> "Session":
+        with open(path) as f:
+            return cls.from_dict(llm, json.load(f), **options)
+
+
+def current_session() -> Optional[Session]:
+    return get_call_context().get("session")
+
+
+def record_exchange(prompt: str, result: Any):
+    """Add one call's prompt and final result to the session of the current context, if any.
+
+    Speculative calls hold their exchanges back in `pending_exchanges`; the speculation adds them to
+    the session only if its result is used.
+    """
+    context = get_call_context()
+    pending = context.get("pending_exchanges")
+    if pending is not None:
+        pending.append((prompt, result))
+        return
+    session = context.get("session")
+    if session is not None:
+        session.record(prompt, result)
@@ -0,0 +1,167 @@
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional, Union
+
+import numpy as np
+
+from .cache import HashingEmbedder
+from .context import call_context
+from .session import current_session
+
+logger = logging.getLogger(__name__)
+
+_embedder = HashingEmbedder()
+
+
+def text_similarity(provisional: Any, actual: Any) -> float:
+    """Bag-of-words cosine similarity of two arguments; structured values are compared via their JSON."""
+    if provisional is actual or provisional == actual:
+        return 1.0
+    if not isinstance(provisional, str):
+        provisional = json.dumps(provisional, sort_keys=True, default=str)
+    if not isinstance(actual, str):
+        actual = json.dumps(actual, sort_keys=True, default=str)
+    return float(np.dot(_embedder.embed(provisional), _embedder.embed(actual)))
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    hits: int = 0
+    misses: int = 0
+    skipped: int = 0
+    wasted_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        resolved = self.hits + self.misses
+        return self.hits / resolved if resolved else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class Speculation:
+    """A downstream call started early on provisional inputs, validated against the real inputs in `resolve`."""
+
+    def __init__(self, speculator: "Speculator", fn: Callable, provisional: Dict[str, Any],
+                 future: Optional[Future], caller: Optional[str], exchanges: Optional[list] = None):
+        self.speculator = speculator
+        self.fn = fn
+        self.provisional = provisional
+        self.future = future
+        self.caller = caller
+        # How long the speculative call itself ran, set by the worker when it finishes
+        self.duration: Optional[float] = None
+        self.hit: Optional[bool] = None
+        # Session exchanges of the speculative call, added to the session only on a hit
+        self.exchanges = exchanges
+
+    def resolve(self, **actual: Any) -> Any:
+        """Return the speculative result if `actual` is close enough to the provisional inputs, else rerun."""
+        kwargs = {**self.provisional, **actual}
+        if self.future is None:
+            return self.speculator._run(self.fn, kwargs, self.caller)
+
+        if self.speculator._matches(self.provisional, kwargs):
+            try:
+                result = self.future.result()
+                self.hit = True
+                self.speculator._record(hit=True)
+                session = current_session()
+                if session is not None:
+                    for prompt, exchange_result in self.exchanges or ():
+                        session.record(prompt, exchange_result)
+                return result
+            except Exception as e:
+                logger.warning(f"Speculative call to {getattr(self.fn, '__name__', self.fn)} failed, rerunning: {e}")
+
+        self.hit = False
+        # cancel() only stops a call that is still queued; one already running is left to finish,
+        # and its own run time is counted as waste when it does
+        if not self.future.cancel():
+            self.future.add_done_callback(lambda _: self.speculator._record_waste(self.duration or 0.0))
+        self.speculator._record(hit=False)
+        return self.speculator._run(self.fn, kwargs, self.caller)
+
+
+class Speculator:
+    """Starts downstream workflow steps before their inputs are final and reuses the result when inputs barely change.
+
+    `threshold` is the minimum similarity per argument (a float, or a dict of argument name to float) for
+    a speculative result to be reused. Once `waste_budget` speculative calls have been thrown away, new
+    speculations run lazily at `resolve` time instead.
+    """
+
+    def __init__(self, threshold: Union[float, Dict[str, float]] = 0.9,
+                 similarity: Callable[[Any, Any], float] = text_similarity,
+                 waste_budget: Optional[int] = 10, max_workers: int = 4):
+        self.threshold = threshold
+        self.similarity = similarity
+        self.waste_budget = waste_budget
+        self.stats = SpeculationStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smartllm-speculation")
+        self._lock = threading.Lock()
+
+    def speculate(self, fn: Callable, **provisional: Any) -> Speculation:
+        caller = inspect.currentframe().f_back.f_code.co_name
+        if self.waste_budget is not None and self.stats.misses >= self.waste_budget:
+            with self._lock:
+                self.stats.skipped += 1
+            logger.debug("Speculation waste budget exhausted, deferring call until inputs are final")
+            return Speculation(self, fn, provisional, None, caller)
+
+        # Run in a copy of the current context so tracing spans and run budgets follow the call
+        context = contextvars.copy_context()
+        exchanges = [] if current_session() is not None else None
+        speculation = Speculation(self, fn, provisional, None, caller, exchanges)
+        speculation.future = self._executor.submit(context.run, self._run_speculative, speculation)
+        with self._lock:
+            self.stats.started += 1
+        return speculation
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run_speculative(self, speculation: Speculation) -> Any:
+        started = time.perf_counter()
+        try:
+            # Inside a session the call sees the history so far, but its exchanges wait for `resolve`
+            if speculation.exchanges is None:
+                return self._run(speculation.fn, dict(speculation.provisional), speculation.caller)
+            with call_context(pending_exchanges=speculation.exchanges):
+                return self._run(speculation.fn, dict(speculation.provisional), speculation.caller)
+        finally:
+            speculation.duration = time.perf_counter() - started
+
+    def _run(self, fn: Callable, kwargs: Dict[str, Any], caller: Optional[str]) -> Any:
+        # Configured functions otherwise see the worker thread as their caller
+        if hasattr(fn, "llm") and caller:
+            return fn(_caller=caller, **kwargs)
+        return fn(**kwargs)
+
+    def _matches(self, provisional: Dict[str, Any], actual: Dict[str, Any]) -> bool:
+        for name, value in provisional.items():
+            threshold = self.threshold.get(name, 1.0) if isinstance(self.threshold, dict) else self.threshold
+            score = self.similarity(value, actual.get(name))
+            if score < threshold:
+                logger.debug(f"Speculation miss on '{name}' (similarity={score:.3f} < {threshold})")
+                return False
+        return True
+
+    def _record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+
+    def _record_waste(self, seconds: float):
+        with self._lock:
+            self.stats.wasted_seconds += seconds
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
+
+from . import tracing
+from .schema import anthropic_function_tool, openai_function_tool, signature_model
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ToolCall:
+    """A tool call requested by the model; `arguments` is the JSON text or the parsed object."""
+    id: str
+    name: str
+    arguments: Any
+
+
+@dataclass
+class ToolResult:
+    call_id: str
+    content: str
+    is_error: bool = False
+
+
+@dataclass
+class ToolStats:
+    calls: int = 0
+    cache_hits: int = 0
+    errors: int = 0
+    timeouts: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Tool:
+    """A Python function the model may call. Its parameters schema is derived from the signature."""
+
+    def __init__(self, fn: Callable, name: Optional[str] = None, description: Optional[str] = None,
+                 timeout: float = 30.0, cache: bool = True):
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.description = description or inspect.getdoc(fn) or f"Call {self.name}."
+        self.timeout = timeout
+        self.cache = cache
+        self.parameters: Type[BaseModel] = signature_model(fn, f"{self.name}_arguments")
+
+    def openai_schema(self) -> Dict[str, Any]:
+        return openai_function_tool(self.parameters, self.name, self.description)
+
+    def anthropic_schema(self) -> Dict[str, Any]:
+        return anthropic_function_tool(self.parameters, self.name, self.description)
+
+    def __call__(self, arguments: Dict[str, Any]) -> Any:
+        parsed = self.parameters.model_validate(arguments)
+        # Keep the validated values (e.g. nested models) rather than their JSON form
+        result = self.fn(**{name: getattr(parsed, name) for name in self.parameters.model_fields})
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+        return result
+
+
+def _as_text(result: Any) -> str:
+    if isinstance(result, str):
+        return result
+    return json.dumps(to_jsonable_python(result), default=str)
+
+
+class ToolSet:
+    """The tools registered on a SmartLLM instance, and the pool their calls run on.
+
+    All the calls the model requests in one turn start at once, so the turn takes as long as the
+    slowest tool. A call that runs past its tool's `timeout` is reported to the model as an error; the
+    worker thread itself cannot be interrupted and finishes in the background. Successful results are
+    cached per tool and arguments.
+    """
+
+    def __init__(self, max_workers: int = 8, max_rounds: int = 8, cache_size: int = 256):
+        self.tools: Dict[str, Tool] = {}
+        self.max_rounds = max_rounds
+        self.cache_size = cache_size
+        self.stats = ToolStats()
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smartllm-tool")
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.tools)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tools
+
+    def register(self, fn: Callable, **options) -> Tool:
+        tool = Tool(fn, **options)
+        if tool.name in self.tools:
+            raise ValueError(f"Tool {tool.name} is already registered")
+        self.tools[tool.name] = tool
+        logger.debug(f"Registered tool {tool.name}")
+        return tool
+
+    def openai_tools(self) -> List[Dict[str, Any]]:
+        return [tool.openai_schema() for tool in self.tools.values()]
+
+    def anthropic_tools(self) -> List[Dict[str, Any]]:
+        return [tool.anthropic_schema() for tool in self.tools.values()]
+
+    def run(self, calls: List[ToolCall]) -> List[ToolResult]:
+        """Run the calls concurrently and return their results in the same order."""
+        started = time.perf_counter()
+        pending = []
+        for call in calls:
+            if call.name not in self.tools:
+                pending.append((call, None, self._error(call, f"Error: unknown tool {call.name}")))
+                continue
+            result = self._cached(call)
+            if result is not None:
+                pending.append((call, None, result))
+                continue
+            context = contextvars.copy_context()
+            pending.append((call, self._executor.submit(context.run, self._invoke, call), None))
+
+        results = []
+        for call, future, cached in pending:
+            if future is None:
+                results.append(cached)
+                continue
+            tool = self.tools[call.name]
+            remaining = tool.timeout - (time.perf_counter() - started)
+            try:
+                results.append(future.result(timeout=max(remaining, 0)))
+            except FutureTimeoutError:
+                logger.warning(f"Tool {call.name} timed out after {tool.timeout}s")
+                with self._lock:
+                    self.stats.timeouts += 1
+                results.append(ToolResult(call.id, f"Error: {call.name} timed out after {tool.timeout}s", True))
+        tracing.set_attribute("tool_time", time.perf_counter() - started)
+        return results
+
+    def _cached(self, call: ToolCall) -> Optional[ToolResult]:
+        key = self._key(call)
+        with self._lock:
+            self.stats.calls += 1
+            if key is None or key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            self.stats.cache_hits += 1
+            return ToolResult(call.id, self._cache[key])
+
+    def _key(self, call: ToolCall) -> Optional[Tuple[str, str]]:
+        tool = self.tools.get(call.name)
+        if tool is None or not tool.cache:
+            return None
+        try:
+            arguments = json.loads(call.arguments) if isinstance(call.arguments, str) else call.arguments
+            return call.name, json.dumps(arguments, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+
+    def _invoke(self, call: ToolCall) -> ToolResult:
+        tool = self.tools[call.name]
+        with tracing.span(f"tool {call.name}", kind="tool"):
+            try:
+                arguments = json.loads(call.arguments) if isinstance(call.arguments, str) else call.arguments
+                content = _as_text(tool(arguments or {}))
+            except Exception as e:
+                logger.warning(f"Tool {call.name} failed: {e}")
+                return self._error(call, f"Error: {call.name} failed: {e}")
+        key = self._key(call)
+        if key is not None:
+            with self._lock:
+                self._cache[key] = content
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return ToolResult(call.id, content)
+
+    def _error(self, call: ToolCall, message: str) -> ToolResult:
+        with self._lock:
+            self.stats.errors += 1
+        return ToolResult(call.id, message, True)
@@ -0,0 +1,317 @@
+import argparse
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .artifacts import ArtifactRef
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("smartllm_current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    start_time: float = 0.0
+    end_time: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or self.start_time) - self.start_time
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_to_attribute(self, key: str, value: float):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_otlp(self) -> dict:
+        """Render as an OTLP/JSON span (the body of resourceSpans[].scopeSpans[].spans[])."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 3 if self.kind == "client" else 1,
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or self.start_time) * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1},
+        }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+class InMemoryExporter:
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+
+class JSONLExporter:
+    """Appends one span per line to a local file, in SmartLLM's format or as OTLP/JSON."""
+
+    def __init__(self, path: str, otlp: bool = False, service_name: str = "smartllm"):
+        self.path = path
+        self.otlp = otlp
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self.otlp:
+            record = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "smartllm"}, "spans": [span.to_otlp()]}],
+            }]}
+        else:
+            record = span.to_dict()
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class Tracer:
+    def __init__(self):
+        self.exporters: List[Any] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def clear(self):
+        self.exporters.clear()
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        if not self.exporters:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            kind=kind,
+            start_time=time.time(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set_attribute("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.end_time = time.time()
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                try:
+                    exporter.export(span)
+                except Exception as e:
+                    logger.warning(f"Span exporter {type(exporter).__name__} failed: {e}")
+
+
+tracer = Tracer()
+
+
+def enable(exporter) -> Tracer:
+    """Start exporting spans from every SmartLLM call to `exporter` (e.g. JSONLExporter("trace.jsonl"))."""
+    tracer.add_exporter(exporter)
+    return tracer
+
+
+def span(name: str, kind: str = "internal", **attributes):
+    return tracer.span(name, kind=kind, **attributes)
+
+
+def traced(func: Callable) -> Callable:
+    """Decorator that wraps a workflow function (e.g. create_book) in a span, so its LLM calls nest under it."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.span(func.__name__, kind="workflow"):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any):
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+@contextmanager
+def timed(attribute: str):
+    """Add the elapsed seconds of the block to an attribute of the current span."""
+    current = _current_span.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add_to_attribute(attribute, time.perf_counter() - start)
+
+
+def digest(value: Any) -> str:
+    if isinstance(value, ArtifactRef):
+        # A ref stands for its text, so both must match the same consumer
+        value = value.text
+    if not isinstance(value, str):
+        if hasattr(value, "model_dump"):
+            value = value.model_dump(mode="json")
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def output_digests(value: Any) -> List[str]:
+    """Digests of a result and of its top-level fields, since callers often pass on a single field."""
+    digests = [digest(value)]
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(mode="json")
+    if isinstance(value, dict):
+        digests.extend(digest(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        digests.extend(digest(v) for v in value)
+    return digests
+
+
+# --- Offline analysis -------------------------------------------------------
+
+def load_spans(path: str) -> List[Span]:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "resourceSpans" in record:
+                raise ValueError("OTLP files cannot be analysed; export with JSONLExporter(path, otlp=False)")
+            spans.append(Span(**record))
+    return spans
+
+
+def critical_path(spans: Iterable[Span]) -> Dict[str, Any]:
+    """Longest chain of data-dependent function calls in one trace, and how much parallelism the workflow has.
+
+    A call depends on an earlier one when one of its inputs is (a field of) that call's output.
+    """
+    calls = sorted((s for s in spans if s.kind == "function"), key=lambda s: s.start_time)
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    producers: Dict[str, List[Span]] = defaultdict(list)
+    for call in calls:
+        best, best_parent = 0.0, None
+        for input_digest in call.attributes.get("input_digests", []):
+            for producer in producers.get(input_digest, []):
+                if producer.end_time <= call.start_time and finish[producer.span_id] > best:
+                    best, best_parent = finish[producer.span_id], producer.span_id
+        finish[call.span_id] = best + call.duration
+        previous[call.span_id] = best_parent
+        for output_digest in call.attributes.get("output_digests", []):
+            producers[output_digest].append(call)
+
+    if not calls:
+        return {"path": [], "length": 0.0, "work": 0.0, "wall_time": 0.0, "parallelism": 1.0}
+
+    by_id = {call.span_id: call for call in calls}
+    tail = max(finish, key=finish.get)
+    path = []
+    while tail is not None:
+        path.append(by_id[tail])
+        tail = previous[tail]
+    path.reverse()
+
+    length = finish[path[-1].span_id]
+    work = sum(call.duration for call in calls)
+    wall_time = max(c.end_time for c in calls) - calls[0].start_time
+    return {
+        "path": path,
+        "length": length,
+        "work": work,
+        "wall_time": wall_time,
+        "parallelism": work / length if length > 0 else 1.0,
+    }
+
+
+def format_report(spans: List[Span]) -> str:
+    lines = []
+    traces: Dict[str, List[Span]] = defaultdict(list)
+    for s in spans:
+        traces[s.trace_id].append(s)
+    for trace_id, trace_spans in traces.items():
+        result = critical_path(trace_spans)
+        roots = [s for s in trace_spans if s.parent_id is None]
+        title = roots[0].name if roots else trace_id
+        lines.append(f"Trace {trace_id[:8]} ({title})")
+        lines.append(f"  LLM calls:          {sum(1 for s in trace_spans if s.kind == 'function')}")
+        lines.append(f"  Wall time:          {result['wall_time']:.2f}s")
+        lines.append(f"  Total call time:    {result['work']:.2f}s")
+        lines.append(f"  Critical path:      {result['length']:.2f}s")
+        lines.append(f"  Available parallelism: {result['parallelism']:.2f}x")
+        lines.append("  Critical path steps:")
+        for step in result["path"]:
+            lines.append(f"    {step.duration:7.2f}s  {step.name}")
+        client_spans = [s for s in trace_spans if s.kind == "client"]
+        if client_spans:
+            lines.append("  Driver time breakdown:")
+            for key in ("queue_wait", "network_time", "parse_time"):
+                total = sum(s.attributes.get(key, 0) for s in client_spans)
+                lines.append(f"    {key:13s} {total:.2f}s")
+            tokens = sum(s.attributes.get("output_tokens", 0) for s in client_spans)
+            lines.append(f"    output tokens {tokens}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m smartllm.tracing", description="Analyse SmartLLM trace files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report = subparsers.add_parser("report", help="Show critical path and available parallelism per trace")
+    report.add_argument("path", help="JSONL file written by JSONLExporter")
+    args = parser.parse_args(argv)
+    if args.command == "report":
+        print(format_report(load_spans(args.path)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from .context import call_context, get_call_context
+from .drivers.base import Usage
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceededError(Exception):
+    """Raised before a call when the current run has already spent its budget."""
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """USD per million tokens."""
+    input: float
+    output: float
+    cached_input: Optional[float] = None
+    cache_write: Optional[float] = None
+
+
+# Matched by longest model-id prefix, so dated snapshots resolve to their family.
+PRICES: Dict[str, ModelPrice] = {
+    "gpt-4o-mini": ModelPrice(input=0.15, output=0.60, cached_input=0.075),
+    "gpt-4o": ModelPrice(input=2.50, output=10.00, cached_input=1.25),
+    "chatgpt-4o-latest": ModelPrice(input=5.00, output=15.00),
+    "gpt-4-turbo": ModelPrice(input=10.00, output=30.00),
+    "gpt-3.5-turbo": ModelPrice(input=0.50, output=1.50),
+    "claude-3-5-sonnet": ModelPrice(input=3.00, output=15.00, cached_input=0.30, cache_write=3.75),
+    "claude-3-5-haiku": ModelPrice(input=0.80, output=4.00, cached_input=0.08, cache_write=1.00),
+    "claude-3-opus": ModelPrice(input=15.00, output=75.00, cached_input=1.50, cache_write=18.75),
+    "claude-3-sonnet": ModelPrice(input=3.00, output=15.00, cached_input=0.30, cache_write=3.75),
+    "claude-3-haiku": ModelPrice(input=0.25, output=1.25, cached_input=0.03, cache_write=0.30),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for budgeting before a request is sent."""
+    return max(1, len(text) // 4)
+
+
+def price_for(model: str, prices: Optional[Dict[str, ModelPrice]] = None) -> Optional[ModelPrice]:
+    prices = PRICES if prices is None else prices
+    matches = [prefix for prefix in prices if model.startswith(prefix)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def cost_of(usage: Usage, prices: Optional[Dict[str, ModelPrice]] = None) -> float:
+    price = price_for(usage.model, prices)
+    if price is None:
+        return 0.0
+    cached_rate = price.input if price.cached_input is None else price.cached_input
+    write_rate = price.input if price.cache_write is None else price.cache_write
+    uncached = usage.input_tokens - usage.cached_tokens - usage.cache_write_tokens
+    return (uncached * price.input
+            + usage.cached_tokens * cached_rate
+            + usage.cache_write_tokens * write_rate
+            + usage.output_tokens * price.output) / 1_000_000
+
+
+class Run:
+    """A unit of work (e.g. one create_book call) that usage is attributed to and budgeted against."""
+
+    def __init__(self, run_id: Optional[str] = None, budget: Optional[float] = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.budget = budget
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, cost: float):
+        with self._lock:
+            self.spent += cost
+
+    def check_budget(self):
+        if self.budget is not None and self.spent >= self.budget:
+            raise BudgetExceededError(f"Run {self.run_id} spent ${self.spent:.4f} of its ${self.budget:.4f} budget")
+
+
+@contextmanager
+def track_run(run_id: Optional[str] = None, budget: Optional[float] = None):
+    """Attribute every LLM call in the block (across SmartLLM instances) to one run, optionally capping its cost."""
+    run = Run(run_id, budget)
+    with call_context(run=run):
+        yield run
+
+
+@dataclass
+class UsageRecord:
+    timestamp: float
+    model: str
+    function: Optional[str]
+    caller: Optional[str]
+    run: Optional[str]
+    input_tokens: int
+    output_tokens: int
+    cached_tokens: int
+    cache_write_tokens: int
+    cost: float
+
+
+# Run under which the totals of runs beyond `max_runs` are merged
+OLDER_RUNS = "(older runs)"
+
+
+def _empty_totals() -> Dict[str, float]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0,
+            "cost": 0.0}
+
+
+class UsageTracker:
+    """Collects per-call token usage and cost, attributed to the function, caller and run in the call context.
+
+    Totals are kept per (function, caller, run, model) for the life of the tracker, so `summary` and `total`
+    cover every call. Only the `max_runs` most recently active runs keep totals of their own; older ones are
+    merged under the run OLDER_RUNS. Only the last `max_records` individual records are kept for `query`
+    and `to_dicts`. Pass None for either to keep everything.
+    """
+
+    GROUP_BY = ("function", "caller", "run", "model")
+
+    def __init__(self, prices: Optional[Dict[str, ModelPrice]] = None, max_records: Optional[int] = 10_000,
+                 max_runs: Optional[int] = 1_000):
+        self.prices = prices
+        self.max_runs = max_runs
+        self.records: Deque[UsageRecord] = deque(maxlen=max_records)
+        self._totals: Dict[Tuple[Optional[str], ...], Dict[str, float]] = defaultdict(_empty_totals)
+        # Totals keys of each run, least recently active first
+        self._runs: "OrderedDict[str, Set[Tuple[Optional[str], ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unpriced = set()
+
+    def record(self, usage: Usage):
+        context = get_call_context()
+        run = context.get("run")
+        cost = cost_of(usage, self.prices)
+        if cost == 0.0 and price_for(usage.model, self.prices) is None and usage.model not in self._unpriced:
+            self._unpriced.add(usage.model)
+            logger.warning(f"No price configured for model {usage.model}, its cost is reported as 0")
+        if run is not None:
+            run.charge(cost)
+        record = UsageRecord(
+            timestamp=time.time(),
+            model=usage.model,
+            function=context.get("function"),
+            caller=context.get("caller"),
+            run=run.run_id if run is not None else None,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cached_tokens=usage.cached_tokens,
+            cache_write_tokens=usage.cache_write_tokens,
+            cost=cost,
+        )
+        with self._lock:
+            self.records.append(record)
+            key = tuple(getattr(record, name) for name in self.GROUP_BY)
+            totals = self._totals[key]
+            totals["calls"] += 1
+            totals["input_tokens"] += record.input_tokens
+            totals["output_tokens"] += record.output_tokens
+            totals["cached_tokens"] += record.cached_tokens
+            totals["cache_write_tokens"] += record.cache_write_tokens
+            totals["cost"] += record.cost
+            if record.run is not None:
+                self._track_run(record.run, key)
+
+    def _track_run(self, run: str, key: Tuple[Optional[str], ...]):
+        """Note the run as active and merge the least recently active runs beyond `max_runs`. Lock held."""
+        keys = self._runs.get(run)
+        if keys is None:
+            keys = self._runs[run] = set()
+        else:
+            self._runs.move_to_end(run)
+        keys.add(key)
+        while self.max_runs is not None and len(self._runs) > self.max_runs:
+            _, evicted = self._runs.popitem(last=False)
+            run_index = self.GROUP_BY.index("run")
+            for old_key in evicted:
+                merged = self._totals[old_key[:run_index] + (OLDER_RUNS,) + old_key[run_index + 1:]]
+                for name, value in self._totals.pop(old_key).items():
+                    merged[name] += value
+
+    def check_budget(self):
+        run = get_call_context().get("run")
+        if run is not None:
+            run.check_budget()
+
+    def query(self, function: Optional[str] = None, caller: Optional[str] = None, run: Optional[str] = None,
+              model: Optional[str] = None) -> List[UsageRecord]:
+        """The retained records (the most recent `max_records`) matching every given filter."""
+        filters = {"function": function, "caller": caller, "run": run, "model": model}
+        with self._lock:
+            records = list(self.records)
+        return [r for r in records if all(v is None or getattr(r, k) == v for k, v in filters.items())]
+
+    def summary(self, by: str = "function", **filters) -> Dict[Optional[str], Dict[str, float]]:
+        """Aggregate calls, tokens and cost grouped by function, caller, run or model."""
+        if by not in self.GROUP_BY:
+            raise ValueError(f"Cannot group usage by {by}. Expected one of {self.GROUP_BY}")
+        unknown = set(filters) - set(self.GROUP_BY)
+        if unknown:
+            raise TypeError(f"Unknown usage filters: {sorted(unknown)}")
+        groups: Dict[Optional[str], Dict[str, float]] = defaultdict(_empty_totals)
+        with self._lock:
+            totals = [(dict(zip(self.GROUP_BY, key)), dict(values)) for key, values in self._totals.items()]
+        for key, values in totals:
+            if any(v is not None and key[k] != v for k, v in filters.items()):
+                continue
+            group = groups[key[by]]
+            for name, value in values.items():
+                group[name] += value
+        for group in groups.values():
+            group["cache_hit_rate"] = group["cached_tokens"] / group["input_tokens"] if group["input_tokens"] else 0.0
+        return dict(groups)
+
+    def total(self, **filters) -> Dict[str, float]:
+        totals = _empty_totals()
+        for group in self.summary(by="model", **filters).values():
+            for key in totals:
+                totals[key] += group[key]
+        return totals
+
+    def cache_hit_rate(self, **filters) -> float:
+        """Share of input tokens served from the provider's prompt cache."""
+        totals = self.total(**filters)
+        return totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+
+    def to_dicts(self) -> List[dict]:
+        with self._lock:
+            return [asdict(r) for r in self.records]
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+            self._totals.clear()
+            self._runs.clear()
@@ -0,0 +1,62 @@
+import json
+from typing import Callable, List, Optional, Type, Union
+from pydantic import BaseModel
+from smartllm.context import get_call_context
+from smartllm.drivers.base import LLMDriver, Usage
+
+
+class FakeDriver(LLMDriver):
+    """Offline driver for tests: answers with a canned reply or a callable of the prompt."""
+
+    def __init__(self, model_id: str = "fake-model", reply: Union[str, dict, Callable, None] = None):
+        self.model_id = model_id
+        self.reply = reply
+        self.prompts: List[str] = []
+        self.prefixes: List[Optional[str]] = []
+        self.histories: List[List[dict]] = []
+        self.options: List[dict] = []
+
+    def generate(self, prompt: str, response_format: Union[Type[BaseModel], str, None] = None,
+                 prefix: Optional[str] = None, messages: Optional[List[dict]] = None, **kwargs):
+        self.prompts.append(prompt)
+        self.prefixes.append(prefix)
+        self.histories.append(list(messages or []))
+        self.options.append(kwargs)
+        reply = self.reply(prompt) if callable(self.reply) else self.reply
+        if reply is None:
+            reply = f"echo: {prompt}"
+        self._report_usage(Usage(model=self.model_id, input_tokens=len(prompt.split()),
+                                 output_tokens=len(str(reply).split())))
+        on_delta = get_call_context().get("on_delta")
+        if on_delta is not None and isinstance(reply, str) and response_format is None:
+            for i, word in enumerate(reply.split(" ")):
+                on_delta(word if i == 0 else " " + word)
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            if isinstance(reply, str):
+                reply = json.loads(reply)
+            return response_format(**reply)
+        return reply
+
+    @property
+    def calls(self) -> int:
+        return len(self.prompts)
+
+
+class RecordingClient:
+    """Stands in for an OpenAI or Anthropic SDK client; records request kwargs and returns canned responses.
+
+    Exception instances among the responses are raised instead of returned.
+    """
+
+    def __init__(self, *responses):
+        self.requests = []
+        self.responses = list(responses)
+        self.messages = self.completions = self
+        self.chat = self
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
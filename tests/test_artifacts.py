@@ -0,0 +1,122 @@
+import copy
+import os
+import tempfile
+import unittest
+from pydantic import BaseModel
+from smartllm import SmartLLM, tracing, track_run
+from smartllm.artifacts import ArtifactRef, ArtifactStore
+from smartllm.driver_factory import DriverFactory
+from smartllm.serialization import ArgumentSerializer
+from fake_driver import FakeDriver
+
+
+class ChapterContent(BaseModel):
+    content: str
+
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = ArtifactStore(self.tmp.name, memory_bytes=400)
+
+    def test_texts_are_stored_once_by_content(self):
+        first = self.store.put("chapter one " * 50)
+        second = self.store.put("chapter one " * 50)
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertNotEqual(first, "chapter one " * 50)
+        self.assertEqual(first.text, "chapter one " * 50)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "objects"))), 1)
+
+    def test_memory_holds_only_recent_small_texts(self):
+        self.store.inline_chars = 0
+        small, large = self.store.put("short"), self.store.put("x" * 1000)
+        self.assertIn(small.digest, self.store._memory)
+        self.assertNotIn(large.digest, self.store._memory)
+        self.assertEqual(large.text, "x" * 1000)
+        self.assertEqual(len(large), 1000)
+        refs = [self.store.put(f"{n:02d}" * 45) for n in range(10)]
+        self.assertLessEqual(self.store._memory_used, 400)
+        self.assertNotIn(small.digest, self.store._memory)
+        self.assertIn(refs[-1].digest, self.store._memory)
+        self.assertEqual(small.text, "short")
+
+    def test_short_texts_stay_inline_in_the_manifest(self):
+        with track_run("run-2"):
+            ref = self.store.record_call("title", {"topic": "owls"}, "Night Owls")
+        self.assertEqual(ref.text, "Night Owls")
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, "objects")), [])
+        reloaded = ArtifactStore(self.tmp.name)
+        records = reloaded.load_run("run-2")
+        self.assertEqual([r.load(reloaded) for r in records], ["owls", "Night Owls"])
+        self.assertEqual(reloaded.get(records[-1].digest).text, "Night Owls")
+
+    def test_refs_digest_like_their_text(self):
+        ref = self.store.put("Once upon a time")
+        self.assertEqual(tracing.digest(ref), tracing.digest("Once upon a time"))
+
+    def test_refs_render_lazily_in_prompts(self):
+        ref = self.store.put("Once upon a time")
+        self.assertEqual("Story: {story}".format(story=ref), "Story: Once upon a time")
+        self.assertEqual(f"{ref:>20}", "    Once upon a time")
+        rendered = ArgumentSerializer().render("chapters", {"One": {"content": ref}})
+        self.assertEqual(rendered, '{"One":{"content":"Once upon a time"}}')
+        self.assertIs(copy.deepcopy(ref), ref)
+
+    def test_run_manifest_reloads_in_another_store(self):
+        with track_run("run-1"):
+            self.store.record_call("write_chapter", {"chapter": "Intro", "points": ["a"]}, "Hello " * 40)
+        reloaded = ArtifactStore(self.tmp.name)
+        records = reloaded.load_run("run-1")
+        self.assertEqual([(r.kind, r.name) for r in records],
+                         [("input", "chapter"), ("input", "points"), ("output", "result")])
+        self.assertEqual(records[1].load(reloaded), ["a"])
+        self.assertEqual(reloaded.outputs("write_chapter", "run-1")[0].text, "Hello " * 40)
+        self.assertIn("run-1", reloaded.runs())
+
+
+class TestConfiguredArtifacts(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ArtifactStore(tmp.name, memory_bytes=40)
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+
+        @self.llm.configure("Write about {topic}", artifacts=self.store)
+        def write(llm_response: ChapterContent, topic: str) -> str:
+            return llm_response.content
+
+        @self.llm.configure("Rewrite: {text}", edit_param="text", artifacts=self.store)
+        def rewrite(llm_response: ChapterContent, text: str) -> str:
+            return llm_response.content
+
+        self.write, self.rewrite = write, rewrite
+
+    def test_string_results_come_back_as_refs_and_feed_later_prompts(self):
+        self.llm.driver.reply = lambda prompt: {"content": "a long chapter about owls"}
+        chapter = self.write(topic="owls", response_format=ChapterContent)
+        self.assertIsInstance(chapter, ArtifactRef)
+        self.llm.driver.reply = lambda prompt: {"edits": [{"search": "long", "replace": "short"}]}
+        rewritten = self.rewrite(text=chapter, response_format=ChapterContent)
+        self.assertTrue(self.llm.driver.prompts[-1].startswith("Rewrite: a long chapter about owls"))
+        self.assertEqual(rewritten.text, "a short chapter about owls")
+        outputs = self.store.outputs("rewrite")
+        self.assertEqual([ref.text for ref in outputs], ["a short chapter about owls"])
+
+    def test_positional_arguments_are_recorded(self):
+        @self.llm.configure("Write about {topic}", artifacts=self.store)
+        def draft(llm_response: str, label: str, topic: str) -> str:
+            return f"{label}: {llm_response}"
+
+        self.llm.driver.reply = "owls"
+        draft("v1", topic="owls")
+        records = self.store.load_run()
+        self.assertEqual([(r.kind, r.name) for r in records],
+                         [("input", "label"), ("input", "topic"), ("output", "result")])
+        self.assertEqual(records[0].load(self.store), "v1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from typing import List
+from pydantic import BaseModel
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import CascadeDriver
+from fake_driver import FakeDriver
+
+
+class Titles(BaseModel):
+    titles: List[str]
+
+
+class TestCascadeDriver(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("cascade", "fake:small,fake:large", min_samples=2, reprobe_every=0)
+        self.small, self.large = (driver for _, driver in self.llm.driver.tiers)
+        self.small.reply = {"titles": ["Cheap"]}
+        self.large.reply = {"titles": ["Strong"]}
+
+        @self.llm.configure("Titles for {topic}", validators=[lambda r: len(r.titles) > 0])
+        def generate_titles(titles: Titles, topic: str) -> List[str]:
+            return titles.titles
+
+        self.generate_titles = generate_titles
+
+    def test_cheapest_tier_answers_when_valid(self):
+        self.assertEqual(self.generate_titles(topic="AI", response_format=Titles), ["Cheap"])
+        self.assertEqual((self.small.calls, self.large.calls), (1, 0))
+
+    def test_escalates_when_validation_fails(self):
+        self.small.reply = {"titles": []}
+        self.assertEqual(self.generate_titles(topic="AI", response_format=Titles), ["Strong"])
+        self.assertEqual((self.small.calls, self.large.calls), (1, 1))
+
+    def test_escalates_when_response_does_not_match_model(self):
+        self.small.reply = "Error: rate limited"
+        self.assertEqual(self.generate_titles(topic="AI", response_format=Titles), ["Strong"])
+
+    def test_repeated_failures_move_start_tier_up(self):
+        self.small.reply = {"titles": []}
+        for _ in range(4):
+            self.generate_titles(topic="AI", response_format=Titles)
+        # Two samples at the small tier were enough to skip it afterwards
+        self.assertEqual(self.small.calls, 2)
+        self.assertEqual(self.large.calls, 4)
+        stats = self.llm.driver.stats("generate_titles")
+        self.assertEqual(stats["start_tier"], 1)
+        self.assertEqual(stats["tiers"][0]["success_rate"], 0.0)
+
+    def test_stats_are_kept_per_function(self):
+        @self.llm.configure("Outline {topic}")
+        def create_outline(titles: Titles, topic: str) -> List[str]:
+            return titles.titles
+
+        self.small.reply = {"titles": []}
+        for _ in range(3):
+            self.generate_titles(topic="AI", response_format=Titles)
+        self.assertEqual(self.llm.driver.start_tier("create_outline"), 0)
+
+    def test_old_failures_decay_once_the_cheap_tier_recovers(self):
+        cascade = CascadeDriver("fake:small,fake:large", min_samples=2, reprobe_every=0, window=4)
+        for accepted in [False] * 4 + [True] * 3:
+            cascade._record("titles", 0, accepted)
+        self.assertEqual(cascade.stats("titles")["tiers"][0]["attempts"], 3)
+        self.assertEqual(cascade.start_tier("titles"), 0)
+
+    def test_reprobe_starts_from_cheapest_tier(self):
+        cascade = CascadeDriver("fake:small,fake:large", min_samples=1, reprobe_every=3)
+        cascade.tiers[0][1].reply = "Error: bad"
+        cascade.tiers[1][1].reply = "ok"
+        for _ in range(3):
+            cascade.generate("prompt")
+        self.assertEqual(cascade.tiers[0][1].calls, 2)
+
+    def test_usage_is_reported_per_tier_model(self):
+        self.small.reply = {"titles": []}
+        self.generate_titles(topic="AI", response_format=Titles)
+        self.assertEqual(set(self.llm.usage.summary(by="model")), {"small", "large"})
+
+    def test_invalid_tier_spec(self):
+        with self.assertRaises(ValueError):
+            CascadeDriver("gpt-4o-mini")
+
+
+if __name__ == '__main__':
+    unittest.main()
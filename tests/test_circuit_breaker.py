@@ -0,0 +1,171 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from smartllm import CircuitOpenError, SmartLLM, circuit_breakers
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import CircuitBreaker, OpenAIDriver
+from fake_driver import FakeDriver, RecordingClient
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def openai_response(content):
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+class GuardedFakeDriver(FakeDriver):
+    def __init__(self, model_id: str, **kwargs):
+        super().__init__(model_id, **kwargs)
+        self._use_circuit_breaker("fake", model_id, True)
+
+    def generate(self, prompt, **kwargs):
+        with self._guarded():
+            return super().generate(prompt, **kwargs)
+
+
+def call(breaker, error=None):
+    with breaker.guard():
+        if error:
+            raise error
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker("openai:gpt-4o-mini", min_calls=4, failure_rate=0.5, open_seconds=0.05,
+                                      close_after=2)
+
+    def fail(self, times, status=503):
+        for _ in range(times):
+            with self.assertRaises(ProviderError):
+                call(self.breaker, ProviderError(status))
+
+    def test_opens_on_failure_rate(self):
+        call(self.breaker)
+        self.fail(3)
+        self.assertEqual(self.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            call(self.breaker)
+        self.assertEqual(self.breaker.snapshot()["rejected"], 1)
+
+    def test_client_errors_do_not_count(self):
+        self.fail(4, status=400)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_only_transport_errors_count_without_a_status(self):
+        for _ in range(4):
+            with self.assertRaises(ValueError):
+                call(self.breaker, ValueError("could not parse the reply"))
+        self.assertEqual(self.breaker.state, "closed")
+        for _ in range(4):
+            with self.assertRaises(ConnectionError):
+                call(self.breaker, ConnectionError("connection reset"))
+        self.assertEqual(self.breaker.state, "open")
+
+    def test_slow_calls_open_the_circuit(self):
+        breaker = CircuitBreaker("slow", min_calls=2, slow_call_seconds=0.01, slow_rate=0.5)
+        for _ in range(2):
+            with breaker.guard():
+                time.sleep(0.02)
+        self.assertEqual(breaker.state, "open")
+
+    def test_half_open_probe_closes_after_successes(self):
+        self.fail(4)
+        time.sleep(0.06)
+        call(self.breaker)
+        self.assertEqual(self.breaker.state, "half_open")
+        call(self.breaker)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_half_open_admits_one_probe_at_a_time(self):
+        self.fail(4)
+        time.sleep(0.06)
+        with self.breaker.guard():
+            with self.assertRaises(CircuitOpenError):
+                call(self.breaker)
+
+    def test_interrupted_probe_frees_its_slot(self):
+        self.fail(4)
+        time.sleep(0.06)
+        with self.assertRaises(KeyboardInterrupt):
+            call(self.breaker, KeyboardInterrupt())
+        self.assertEqual(self.breaker.state, "half_open")
+        call(self.breaker)
+
+    def test_cancelled_async_probe_is_recorded_when_the_thread_finishes(self):
+        self.fail(4)
+        time.sleep(0.06)
+        release = threading.Event()
+        driver = GuardedFakeDriver("fake-model", reply=lambda prompt: release.wait(5) and "ok")
+        driver.circuit_breaker = self.breaker
+
+        async def main():
+            probe = asyncio.ensure_future(driver.agenerate("Hi"))
+            await asyncio.sleep(0.02)
+            probe.cancel()
+            with self.assertRaises(CircuitOpenError):
+                call(self.breaker)
+            release.set()
+            await asyncio.sleep(0.05)
+            call(self.breaker)
+
+        asyncio.run(main())
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        self.fail(4)
+        time.sleep(0.06)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.trips, 2)
+
+
+class TestDriverCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        circuit_breakers.reset()
+        circuit_breakers.configure(min_calls=2, open_seconds=60)
+        self.addCleanup(circuit_breakers.reset)
+        self.addCleanup(setattr, circuit_breakers, "defaults", {})
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            self.driver = OpenAIDriver("gpt-4o-mini")
+
+    def test_open_circuit_raises_instead_of_error_string(self):
+        self.driver.client = RecordingClient(ProviderError(500))
+        self.assertTrue(self.driver.generate("Hi").startswith("Error"))
+        self.assertTrue(self.driver.generate("Hi").startswith("Error"))
+        with self.assertRaises(CircuitOpenError):
+            self.driver.generate("Hi")
+        self.assertEqual(len(self.driver.client.requests), 2)
+
+    def test_breaker_is_shared_per_provider_model(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            other = OpenAIDriver("gpt-4o-mini")
+            unguarded = OpenAIDriver("gpt-4o-mini", circuit_breaker=False)
+        self.assertIs(other.circuit_breaker, self.driver.circuit_breaker)
+        self.assertIsNone(unguarded.circuit_breaker)
+        self.driver.client = RecordingClient(openai_response("ok"))
+        self.driver.generate("Hi")
+        self.assertEqual([(s["name"], s["state"], s["calls"]) for s in circuit_breakers.snapshot()],
+                         [("openai:gpt-4o-mini", "closed", 1)])
+
+    def test_cascade_escalates_past_open_circuit(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        DriverFactory.register_driver("guarded", GuardedFakeDriver)
+        llm = SmartLLM("cascade", "guarded:small,fake:large")
+        small, large = (driver for _, driver in llm.driver.tiers)
+        large.reply = "from large"
+        small.circuit_breaker._open(time.time(), "test")
+        self.assertEqual(llm.generate("Hi"), "from large")
+        self.assertEqual(small.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from pydantic import BaseModel
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.editing import Edit, EditError, apply_edits
+from fake_driver import FakeDriver
+
+CHAPTER = ("Artificial intelligence is changing medicine. Doctors use models to read scans. "
+           "Regulators are still catching up. ") * 5 + "The end."
+
+
+class ChapterContent(BaseModel):
+    content: str
+
+
+class TestApplyEdits(unittest.TestCase):
+    def test_edits_apply_in_order(self):
+        edits = [Edit(search="The end.", replace="The end, for now."), Edit(search="for now", replace="for today")]
+        self.assertTrue(apply_edits(CHAPTER, edits).endswith("The end, for today."))
+
+    def test_ambiguous_and_missing_anchors_fail(self):
+        with self.assertRaises(EditError):
+            apply_edits(CHAPTER, [Edit(search="Doctors use models", replace="x")])
+        with self.assertRaises(EditError):
+            apply_edits(CHAPTER, [Edit(search="not in the text", replace="x")])
+
+
+class TestEditMode(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+
+        @self.llm.configure("Rewrite based on the review: {original_chapter}\n\nReview: {review}",
+                            edit_param="original_chapter")
+        def rewrite_chapter(llm_response: ChapterContent, original_chapter: str, review: str) -> str:
+            return llm_response.content
+
+        self.rewrite_chapter = rewrite_chapter
+
+    def reply_with(self, edits, rewrite="Full rewrite."):
+        self.llm.driver.reply = lambda prompt: {"edits": edits} if "list of edits" in prompt else {"content": rewrite}
+
+    def test_edits_are_applied_locally(self):
+        self.reply_with([{"search": "The end.", "replace": "The end, with a stronger conclusion."}])
+        result = self.rewrite_chapter(original_chapter=CHAPTER, review="Weak ending", response_format=ChapterContent)
+        self.assertTrue(result.endswith("stronger conclusion."))
+        self.assertTrue(result.startswith("Artificial intelligence"))
+        self.assertEqual(self.llm.driver.calls, 1)
+        stats = self.rewrite_chapter.edit_stats
+        self.assertEqual((stats.applied, stats.fallbacks), (1, 0))
+        self.assertGreater(stats.output_tokens_saved, 0)
+
+    def test_batch_applies_edits_per_item(self):
+        self.reply_with([{"search": "The end.", "replace": "Fin."}])
+        results = self.rewrite_chapter.batch([{"original_chapter": CHAPTER, "review": "French ending"}] * 2)
+        self.assertEqual([r[-4:] for r in results], ["Fin."] * 2)
+        self.assertEqual(self.rewrite_chapter.edit_stats.applied, 2)
+
+    def test_failed_edits_fall_back_to_full_rewrite(self):
+        self.reply_with([{"search": "Doctors use models", "replace": "Doctors rely on models"}])
+        result = self.rewrite_chapter(original_chapter=CHAPTER, review="Vary wording", response_format=ChapterContent)
+        self.assertEqual(result, "Full rewrite.")
+        self.assertEqual(self.llm.driver.calls, 2)
+        stats = self.rewrite_chapter.edit_stats
+        self.assertEqual((stats.applied, stats.fallbacks), (0, 1))
+        self.assertLess(stats.output_tokens_saved, 0)
+
+    def test_plain_text_response(self):
+        self.llm.driver.reply = lambda prompt: {"edits": [{"search": "The end.", "replace": "Fin."}]}
+
+        @self.llm.configure("Polish: {text}", edit_param="text")
+        def polish(llm_response: str, text: str) -> str:
+            return llm_response
+
+        self.assertTrue(polish(text=CHAPTER).endswith("Fin."))
+
+    def test_unsupported_response_format_uses_full_rewrite(self):
+        class Review(BaseModel):
+            review: str
+            rating: int
+
+        self.llm.driver.reply = {"review": "ok", "rating": 7}
+
+        @self.llm.configure("Review: {chapter}", edit_param="chapter")
+        def review_chapter(llm_response: Review, chapter: str) -> int:
+            return llm_response.rating
+
+        self.assertEqual(review_chapter(chapter=CHAPTER, response_format=Review), 7)
+        self.assertNotIn("list of edits", self.llm.driver.prompts[0])
+
+    def test_edit_param_must_be_a_parameter(self):
+        with self.assertRaises(ValueError):
+            @self.llm.configure("Polish: {text}", edit_param="missing")
+            def polish(llm_response: str, text: str) -> str:
+                return llm_response
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import http.client
+import json
+import os
+import socket
+import unittest
+from typing import List
+from unittest import mock
+from pydantic import BaseModel
+from smartllm.context import call_context
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import AnthropicDriver, OpenAIDriver
+from smartllm.emulator import (EmulatorProfile, LatencyProfile, ProviderEmulator, main, run_load,
+                               sample_from_schema)
+
+
+class Outline(BaseModel):
+    title: str
+    chapters: List[str]
+
+
+def fast_profile() -> EmulatorProfile:
+    return EmulatorProfile(latency=LatencyProfile("constant", 0.0), tokens_per_second=0, output_tokens=5, seed=1)
+
+
+class TestProviderEmulator(unittest.TestCase):
+    def setUp(self):
+        self.emulator = ProviderEmulator(fast_profile())
+        self.running = self.emulator.running()
+        self.running.__enter__()
+        self.env = mock.patch.dict(os.environ, {
+            "OPENAI_BASE_URL": self.emulator.openai_base_url, "OPENAI_API_KEY": "test",
+            "ANTHROPIC_BASE_URL": self.emulator.anthropic_base_url, "ANTHROPIC_API_KEY": "test"})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.running.__exit__(None, None, None)
+
+    def post(self, path: str, body):
+        connection = http.client.HTTPConnection(self.emulator.host, self.emulator.port)
+        body = body if isinstance(body, bytes) else json.dumps(body)
+        connection.request("POST", path, body, {"content-type": "application/json"})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+    def test_openai_driver_text_and_usage(self):
+        driver = OpenAIDriver("gpt-4o-mini")
+        usage = []
+        driver.add_usage_listener(usage.append)
+        self.assertEqual(len(driver.generate("Hello").split()), 5)
+        self.assertEqual(usage[0].output_tokens, 5)
+        self.assertGreater(usage[0].input_tokens, 0)
+
+    def test_openai_native_structured_output(self):
+        driver = OpenAIDriver("gpt-4o-mini", structured_output="native")
+        self.assertIsInstance(driver.generate("Outline", Outline), Outline)
+
+    def test_anthropic_driver_streaming_and_tool_use(self):
+        driver = AnthropicDriver("claude-3-5-haiku-latest", structured_output="native")
+        deltas, usage = [], []
+        driver.add_usage_listener(usage.append)
+        with call_context(on_delta=deltas.append):
+            text = driver.generate("Hello")
+        self.assertEqual("".join(deltas), text)
+        self.assertEqual(usage[0].output_tokens, 5)
+        self.assertIsInstance(driver.generate("Outline", Outline), Outline)
+
+    def test_openai_streaming(self):
+        deltas = []
+        with call_context(on_delta=deltas.append):
+            text = OpenAIDriver("gpt-4o-mini").generate("Hello")
+        self.assertEqual("".join(deltas).strip(), text)
+        self.assertEqual(self.emulator.stats.streamed, 1)
+
+    def test_injected_429_carries_rate_limit_headers(self):
+        self.emulator.profile.error_429_rate = 1.0
+        status, headers, _ = self.post("/v1/chat/completions", {"model": "m", "messages": []})
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["retry-after"], "1")
+        self.assertIn("x-ratelimit-remaining-requests", headers)
+        status, headers, body = self.post("/v1/messages", {"model": "m", "messages": []})
+        self.assertEqual(json.loads(body)["error"]["type"], "rate_limit_error")
+        self.assertIn("anthropic-ratelimit-requests-remaining", headers)
+
+    def test_requests_per_minute_limit(self):
+        self.emulator._limiter.limit = 2
+        statuses = [self.post("/v1/chat/completions", {"model": "m", "messages": []})[0] for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(self.emulator.stats.rate_limited, 1)
+
+    def test_malformed_requests_get_400(self):
+        self.assertEqual(self.post("/v1/messages", b"not json")[0], 400)
+        self.assertEqual(self.post("/v1/messages", [1, 2])[0], 400)
+        forced = {"model": "m", "messages": [], "tool_choice": {"type": "tool", "name": "Outline"}, "tools": []}
+        status, _, body = self.post("/v1/messages", forced)
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)["error"]["type"], "invalid_request_error")
+        no_schema = {"model": "m", "messages": [], "response_format": {"type": "json_schema"}}
+        self.assertEqual(self.post("/v1/chat/completions", no_schema)[0], 400)
+
+        with socket.create_connection((self.emulator.host, self.emulator.port)) as sock:
+            sock.sendall(b"GARBAGE\r\n\r\n")
+            self.assertTrue(sock.recv(1024).startswith(b"HTTP/1.1 400"))
+        # The server is still up
+        self.assertEqual(self.post("/v1/chat/completions", {"model": "m", "messages": []})[0], 200)
+
+    def test_load_command_turns_the_circuit_breaker_off(self):
+        with mock.patch("smartllm.driver_factory.DriverFactory.create", wraps=DriverFactory.create) as create, \
+                mock.patch("builtins.print"):
+            main(["load", "--requests", "2", "--concurrency", "2", "--latency", "constant", "--latency-mean", "0",
+                  "--tokens-per-second", "0", "--output-tokens", "5"])
+        self.assertIs(create.call_args.kwargs["circuit_breaker"], False)
+
+    def test_load_report(self):
+        driver = OpenAIDriver("gpt-4o-mini")
+        report = run_load(lambda i: driver.generate(f"Request {i}"), requests=40, concurrency=8)
+        self.assertEqual((report.requests, report.errors), (40, 0))
+        self.assertLessEqual(report.p50, report.p90)
+        self.assertLessEqual(report.p90, report.p99)
+        self.assertGreater(report.throughput, 0)
+
+
+class TestSampleFromSchema(unittest.TestCase):
+    def test_sample_validates_against_model(self):
+        Outline.model_validate(sample_from_schema(Outline.model_json_schema()))
+
+
+if __name__ == '__main__':
+    unittest.main()
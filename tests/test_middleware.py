@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.middleware import Middleware, TimingMiddleware
+from fake_driver import FakeDriver
+
+
+class Canned(Middleware):
+    def before(self, request):
+        if "cached" in request.prompt:
+            return "from middleware"
+
+
+class Shout(Middleware):
+    def after(self, request, result):
+        return result.upper()
+
+
+class TestMiddleware(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = "hello"
+
+        @self.llm.configure("Say {word}")
+        def say(llm_response: str, word: str) -> str:
+            return llm_response
+
+        self.say = say
+
+    def tearDown(self):
+        DriverFactory.clear_middlewares()
+
+    def test_stages_run_in_order_and_can_short_circuit(self):
+        self.llm.use(Canned()).use(Shout())
+        self.assertEqual(self.say(word="hi"), "HELLO")
+        self.assertEqual(self.say(word="cached"), "from middleware")
+        self.assertEqual(self.llm.driver.calls, 1)
+
+    def test_function_middleware_sees_normalized_request(self):
+        seen = []
+
+        def record(request, call_next):
+            seen.append((request.function, request.caller, request.model, request.prompt))
+            request.prompt = request.prompt + "!"
+            return call_next(request)
+
+        self.llm.use(record)
+        self.say(word="hi")
+        self.assertEqual(seen, [("say", "test_function_middleware_sees_normalized_request", "fake-model", "Say hi")])
+        self.assertEqual(self.llm.driver.prompts, ["Say hi!"])
+
+    def test_global_middleware_wraps_async_calls(self):
+        timing = TimingMiddleware()
+        DriverFactory.use(timing)
+        self.llm.use(Shout())
+
+        async def main():
+            return await self.say.acall(word="hi"), await self.llm.agenerate("Say hi")
+
+        self.assertEqual(asyncio.run(main()), ("HELLO", "HELLO"))
+        self.assertEqual(len(timing.timings["say"]), 1)
+        self.assertEqual(len(timing.timings["generate"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
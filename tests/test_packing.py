@@ -0,0 +1,84 @@
+import re
+import unittest
+from pydantic import BaseModel, Field
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.packing import PackPlanner, packed_model
+from fake_driver import FakeDriver
+
+
+class SlideContent(BaseModel):
+    content: str = Field(description="Content of the slide")
+
+
+def reply(prompt):
+    if prompt.startswith("Complete each of the following"):
+        titles = re.findall(r"### Task (\d+)\nSlide about (.+)", prompt)
+        # The model drops the content of the task about 'broken'
+        return {"items": [{"index": int(i), "content": f"about {t}"} if t != "broken" else {"index": int(i)}
+                          for i, t in titles]}
+    return {"content": "single " + prompt.split("Slide about ")[1]}
+
+
+class TestPacking(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = reply
+
+        @self.llm.configure("Slide about {slide_title}")
+        def generate_slide_content(llm_response: SlideContent, slide_title: str) -> str:
+            return llm_response.content
+
+        self.generate_slide_content = generate_slide_content
+
+    def test_batch_uses_one_round_trip(self):
+        titles = ["tokens", "BPE", "WordPiece", "SentencePiece"]
+        contents = self.generate_slide_content.batch([{"slide_title": t} for t in titles])
+        self.assertEqual(contents, [f"about {t}" for t in titles])
+        self.assertEqual(self.llm.driver.calls, 1)
+        self.assertEqual(self.llm.function_calls["test_batch_uses_one_round_trip"], ["generate_slide_content"] * 4)
+
+    def test_failed_items_are_reissued(self):
+        contents = self.generate_slide_content.batch([{"slide_title": t} for t in ["tokens", "broken", "BPE"]])
+        self.assertEqual(contents, ["about tokens", "single broken", "about BPE"])
+        self.assertEqual(self.llm.driver.calls, 2)
+
+    def test_batch_in_session_calls_items_one_by_one(self):
+        with self.llm.session() as session:
+            contents = self.generate_slide_content.batch([{"slide_title": t} for t in ["tokens", "BPE"]])
+        self.assertEqual(contents, ["single tokens", "single BPE"])
+        self.assertEqual(len(session.turns), 4)
+        self.assertEqual(len(self.llm.driver.histories[1]), 2)
+
+    def test_single_calls_infer_response_format_like_batch(self):
+        self.assertEqual(self.generate_slide_content(slide_title="tokens"), "single tokens")
+
+    def test_packed_request_keeps_generation_options(self):
+        @self.llm.configure("Slide about {slide_title}", temperature=0.2, validators=[bool])
+        def warm_slide(llm_response: SlideContent, slide_title: str) -> str:
+            return llm_response.content
+
+        warm_slide.batch([{"slide_title": t} for t in ["tokens", "BPE"]])
+        self.assertEqual(self.llm.driver.calls, 1)
+        self.assertEqual(self.llm.driver.options[0], {"temperature": 0.2})
+
+    def test_prefix_counts_against_the_pack_budget(self):
+        planner = PackPlanner(max_input_tokens=400, max_output_tokens=10_000)
+        self.assertEqual(len(planner.plan(["short prompt"] * 6)), 1)
+        self.assertEqual(planner.plan(["short prompt"] * 6, prefix="word " * 1000), [[0], [1], [2], [3], [4], [5]])
+
+    def test_pack_size_adapts_to_token_budget(self):
+        planner = PackPlanner(max_input_tokens=1000, max_output_tokens=1000, initial_output_tokens=300)
+        self.assertEqual(planner.plan(["short prompt"] * 7), [[0, 1, 2], [3, 4, 5], [6]])
+        planner.observe([SlideContent(content="ok")] * 3)
+        self.assertLess(planner.output_tokens_per_item, 300)
+        self.assertEqual(PackPlanner(max_input_tokens=20).plan(["x" * 40] * 3), [[0], [1], [2]])
+
+    def test_packed_model_is_cached(self):
+        self.assertIs(packed_model(SlideContent), packed_model(SlideContent))
+        self.assertIn("index", packed_model(SlideContent).model_json_schema()["$defs"]["IndexedSlideContent"]["properties"])
+
+
+if __name__ == '__main__':
+    unittest.main()
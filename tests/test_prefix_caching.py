@@ -0,0 +1,83 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from pydantic import BaseModel, Field
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import AnthropicDriver, OpenAIDriver
+from fake_driver import FakeDriver, RecordingClient
+
+
+class ChapterContent(BaseModel):
+    content: str = Field(description="Content of the chapter")
+
+
+class TestPrefixCaching(unittest.TestCase):
+    def test_prefix_params_move_stable_context_ahead_of_prompt(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        llm = SmartLLM("fake", "fake-model")
+
+        @llm.configure("Write '{chapter}'. Follow the style guide: {style_guide}", prefix_params=["style_guide"])
+        def write_chapter(llm_response: str, chapter: str, style_guide: str) -> str:
+            return llm_response
+
+        write_chapter(chapter="Intro", style_guide="Be concise.")
+        self.assertEqual(llm.driver.prompts, ["Write 'Intro'. Follow the style guide: (see style_guide above)"])
+        self.assertEqual(llm.driver.prefixes, ["## style_guide\nBe concise."])
+
+    def test_prompt_arguments_named_like_driver_keywords_stay_in_the_prompt(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        llm = SmartLLM("fake", "fake-model")
+        seen = []
+        generate = llm.driver.generate
+        llm.driver.generate = lambda prompt, **kwargs: seen.append(kwargs) or generate(prompt, **kwargs)
+
+        @llm.configure("Continue '{prefix}' in {structured_output} form")
+        def continue_text(llm_response: str, prefix: str, structured_output: str) -> str:
+            return llm_response
+
+        continue_text(prefix="Once upon", structured_output="native")
+        self.assertEqual(llm.driver.prompts, ["Continue 'Once upon' in native form"])
+        self.assertEqual(llm.driver.prefixes, [None])
+        self.assertNotIn("structured_output", seen[0])
+
+    def test_openai_orders_prefix_before_per_call_content(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o")
+        usage = SimpleNamespace(prompt_tokens=2000, completion_tokens=10,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=1536))
+        message = SimpleNamespace(content="done")
+        driver.client = RecordingClient(SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage))
+        reported = []
+        driver.add_usage_listener(reported.append)
+
+        driver.generate("Write chapter 2", prefix="long shared context")
+        messages = driver.client.requests[0]["messages"]
+        self.assertEqual([m["role"] for m in messages], ["system", "system", "user"])
+        self.assertEqual(messages[1]["content"], "long shared context")
+        self.assertTrue(messages[2]["content"].startswith("Write chapter 2"))
+        self.assertEqual(reported[0].cached_tokens, 1536)
+
+    def test_anthropic_marks_prefix_and_schema_as_cacheable(self):
+        with mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test"}):
+            driver = AnthropicDriver("claude-3-5-sonnet-20240620")
+        usage = SimpleNamespace(input_tokens=50, output_tokens=20, cache_read_input_tokens=1500,
+                                cache_creation_input_tokens=0)
+        text = SimpleNamespace(text='Here: {"content": "done"}')
+        driver.client = RecordingClient(SimpleNamespace(content=[text], usage=usage))
+        reported = []
+        driver.add_usage_listener(reported.append)
+
+        result = driver.generate("Write chapter 2", response_format=ChapterContent, prefix="long shared context")
+        request = driver.client.requests[0]
+        self.assertEqual(result, {"content": "done"})
+        self.assertIn('"content"', request["system"][0]["text"])
+        self.assertEqual(request["system"][1]["text"], "long shared context")
+        self.assertTrue(all(block["cache_control"] == {"type": "ephemeral"} for block in request["system"]))
+        self.assertNotIn("schema", request["messages"][0]["content"])
+        self.assertEqual((reported[0].input_tokens, reported[0].cached_tokens), (1550, 1500))
+
+
+if __name__ == '__main__':
+    unittest.main()
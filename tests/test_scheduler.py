@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import unittest
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.scheduler import PriorityClass, Scheduler, scheduling
+from fake_driver import FakeDriver
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.release = threading.Event()
+        self.order = []
+
+        def reply(prompt):
+            if prompt == "blocker":
+                self.release.wait(5)
+            self.order.append(prompt)
+            return "ok"
+
+        self.llm.driver.reply = reply
+        self.threads = []
+
+    def start(self, scheduler, prompt, priority=None, tenant=None, queued=None):
+        """Issue a call on a thread and wait until the scheduler has it running or queued."""
+        def run():
+            with scheduling(priority, tenant):
+                self.llm.generate(prompt)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        deadline = time.time() + 5
+        while sum(m["queued"] + m["running"] for m in scheduler.metrics().values()) < queued and time.time() < deadline:
+            time.sleep(0.005)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_interactive_calls_jump_the_queue(self):
+        scheduler = Scheduler(max_concurrency=1)
+        self.llm.use(scheduler)
+        self.start(scheduler, "blocker", queued=1)
+        self.start(scheduler, "book chapter", priority="batch", queued=2)
+        self.start(scheduler, "user question", priority="interactive", queued=3)
+        self.finish()
+        self.assertEqual(self.order, ["blocker", "user question", "book chapter"])
+
+    def test_tenants_share_a_class_fairly(self):
+        scheduler = Scheduler(max_concurrency=1)
+        self.llm.use(scheduler)
+        self.start(scheduler, "blocker", queued=1)
+        for i in range(3):
+            self.start(scheduler, f"big {i}", tenant="big-job", queued=2 + i)
+        self.start(scheduler, "small 0", tenant="small-job", queued=5)
+        self.start(scheduler, "small 1", tenant="small-job", queued=6)
+        self.finish()
+        self.assertEqual(self.order, ["blocker", "big 0", "small 0", "big 1", "small 1", "big 2"])
+        # Once every call is dispatched, no tenant keeps a finish tag
+        self.assertEqual(dict(scheduler._finish["default"]), {})
+
+    def test_class_cap_leaves_room_for_other_classes(self):
+        scheduler = Scheduler(max_concurrency=2, classes={"interactive": PriorityClass(0),
+                                                          "batch": PriorityClass(1, max_concurrency=1)},
+                              default_priority="batch")
+        self.llm.use(scheduler)
+        self.start(scheduler, "blocker", queued=1)
+        self.start(scheduler, "batch 2", queued=2)
+        self.assertEqual(scheduler.metrics()["batch"]["queued"], 1)
+        # The interactive call runs in the free slot while the batch call is still queued
+        with scheduling(priority="interactive"):
+            self.llm.generate("user question")
+        self.assertEqual(self.order, ["user question"])
+        self.finish()
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics["batch"]["completed"], 2)
+        self.assertGreater(metrics["batch"]["max_wait"], 0)
+
+    def test_async_path(self):
+        scheduler = Scheduler(max_concurrency=2)
+        self.llm.use(scheduler)
+        self.release.set()
+
+        async def main():
+            with scheduling(priority="interactive"):
+                return await asyncio.gather(*(self.llm.agenerate(f"q{i}") for i in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ["ok"] * 5)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics["interactive"]["completed"], 5)
+        self.assertEqual(sum(m["running"] for m in metrics.values()), 0)
+
+    def test_cancelled_call_keeps_its_slot_until_the_driver_returns(self):
+        scheduler = Scheduler(max_concurrency=1)
+        self.llm.use(scheduler)
+
+        def running():
+            return scheduler.metrics()["interactive"]["running"]
+
+        async def main():
+            with scheduling(priority="interactive"):
+                call = asyncio.ensure_future(self.llm.agenerate("blocker"))
+            while running() == 0:
+                await asyncio.sleep(0.005)
+            call.cancel()
+            await asyncio.sleep(0.05)
+            # The worker thread is still inside the driver, so the slot is still taken
+            held = running()
+            self.release.set()
+            for _ in range(200):
+                if running() == 0:
+                    break
+                await asyncio.sleep(0.01)
+            return held, running()
+
+        self.assertEqual(asyncio.run(main()), (1, 0))
+
+    def test_unknown_default_priority(self):
+        with self.assertRaises(ValueError):
+            Scheduler(default_priority="urgent")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pydantic import BaseModel, Field
+from smartllm import SmartLLM
+from smartllm.cache import HashingEmbedder, SemanticCache, VectorIndex
+from smartllm.driver_factory import DriverFactory
+from fake_driver import FakeDriver
+
+
+class TitleList(BaseModel):
+    titles: list[str] = Field(description="List of catchy titles")
+
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = {"titles": ["A", "B", "C"]}
+
+    def test_near_duplicate_prompt_hits_cache(self):
+        @self.llm.configure("Generate 3 catchy, business-oriented titles for a blog post about {topic}", semantic_cache=0.9)
+        def generate_titles(llm_response: TitleList, topic: str) -> list:
+            return llm_response.titles
+
+        first = generate_titles(topic="AI in drug discovery", response_format=TitleList)
+        second = generate_titles(topic="AI in drug discovery!", response_format=TitleList)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.llm.driver.calls, 1)
+        self.assertEqual(generate_titles.semantic_cache.hits, 1)
+
+    def test_different_prompt_misses_cache(self):
+        @self.llm.configure("Generate 3 catchy, business-oriented titles for a blog post about {topic}", semantic_cache=True)
+        def generate_titles(llm_response: TitleList, topic: str) -> list:
+            return llm_response.titles
+
+        generate_titles(topic="AI in drug discovery", response_format=TitleList)
+        generate_titles(topic="sustainable supply chains for retailers", response_format=TitleList)
+        self.assertEqual(self.llm.driver.calls, 2)
+
+    def test_close_but_different_topics_miss_cache(self):
+        @self.llm.configure("Write the {section} section of a report about {topic}", semantic_cache=0.9)
+        def write_section(llm_response: str, section: str, topic: str) -> str:
+            return llm_response
+
+        self.llm.driver.reply = "text"
+        write_section(section="Introduction", topic="AI in healthcare")
+        write_section(section="Conclusion", topic="AI in healthcare")
+        write_section(section="Introduction", topic="AI in finance")
+        self.assertEqual(self.llm.driver.calls, 3)
+        self.assertEqual(write_section.semantic_cache.hits, 0)
+
+    def test_entries_only_match_within_their_scope(self):
+        cache = SemanticCache()
+        cache.store("topic: owls", "owl titles", scope="Titles about {topic}")
+        self.assertIsNone(cache.lookup("topic: owls", scope="Essay about {topic}"))
+        self.assertEqual(cache.lookup("topic: owls", scope="Titles about {topic}"), "owl titles")
+
+    def test_error_strings_are_not_cached(self):
+        cache = SemanticCache()
+        cache.store("prompt", "Error: timed out", TitleList)
+        cache.store("prompt", "Error: timed out")
+        self.assertEqual(len(cache.index), 0)
+
+    def test_index_evicts_least_recently_used(self):
+        embedder = HashingEmbedder(dim=64)
+        index = VectorIndex(64, capacity=2)
+        a, b, c = (embedder.embed(t) for t in ("alpha beta", "gamma delta", "epsilon zeta"))
+        slot_a = index.add(a, "a")
+        index.add(b, "b")
+        index.get(slot_a)
+        index.add(c, "c")
+        self.assertEqual(sorted(v for v in index.values if v), ["a", "c"])
+
+    def test_cache_persists_to_memory_mapped_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "titles.cache")
+            cache = SemanticCache(max_entries=8, path=path)
+            cache.store("titles about AI in drug discovery", TitleList(titles=["X"]))
+            cache.close()
+
+            reloaded = SemanticCache(max_entries=8, path=path)
+            result = reloaded.lookup("titles about AI in drug discovery", TitleList)
+            self.assertEqual(result, TitleList(titles=["X"]))
+
+    def test_persisted_cache_flushes_in_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SemanticCache(max_entries=8, path=os.path.join(tmp, "titles.cache"), flush_every=3)
+            with mock.patch.object(cache.index, "flush", wraps=cache.index.flush) as flush:
+                for i in range(4):
+                    cache.store(f"titles about topic {i}", f"title {i}")
+                self.assertEqual(flush.call_count, 1)
+                cache.close()
+                self.assertEqual(flush.call_count, 2)
+
+    def test_persisted_cache_skips_values_json_cannot_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SemanticCache(max_entries=8, path=os.path.join(tmp, "titles.cache"), flush_every=1)
+            cache.store("titles about sets", {"a", "b"})
+            cache.store("titles about lists", ["a", "b"])
+            self.assertEqual(len(cache.index), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from pydantic import BaseModel
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.serialization import ArgumentSerializer, RenderMemo, to_json, to_tsv, to_yaml
+from fake_driver import FakeDriver
+
+
+class Chapter(BaseModel):
+    title: str
+    points: list[str]
+
+
+class TestArgumentSerialization(unittest.TestCase):
+    def test_json_is_minified_and_key_sorted(self):
+        self.assertEqual(to_json({"b": 1, "a": [1, 2]}), '{"a":[1,2],"b":1}')
+        self.assertEqual(to_json({"b": 1, "a": 2}), to_json({"a": 2, "b": 1}))
+
+    def test_yaml_is_compact(self):
+        structure = {"title": "AI Ethics", "chapters": [{"title": "Intro", "points": ["bias", "fairness"]}]}
+        self.assertEqual(to_yaml(structure), "chapters:\n- points: [bias, fairness]\n  title: Intro\ntitle: AI Ethics")
+
+    def test_tsv_renders_tables(self):
+        rows = [{"title": "Intro", "pages": 1}, {"title": "Bias\tand fairness", "pages": 2}]
+        self.assertEqual(to_tsv(rows), "pages\ttitle\n1\tIntro\n2\tBias\\tand fairness")
+
+    def test_per_parameter_formats(self):
+        serializer = ArgumentSerializer.from_setting({"*": "json", "glossary": "tsv", "raw": "repr"})
+        rendered = serializer.render_all({
+            "topic": "AI",
+            "structure": Chapter(title="Intro", points=["a"]),
+            "glossary": {"LLM": "large language model"},
+            "raw": {"x": 1},
+        })
+        self.assertEqual(rendered["topic"], "AI")
+        self.assertEqual(rendered["structure"], '{"points":["a"],"title":"Intro"}')
+        self.assertEqual(rendered["glossary"], "LLM\tlarge language model")
+        self.assertEqual(rendered["raw"], {"x": 1})
+
+    def test_memo_reuses_rendering_until_argument_changes(self):
+        serializer = ArgumentSerializer(memo=RenderMemo())
+        chapters = {"Intro": {"content": "text " * 100}}
+        first = serializer.render("chapters", chapters)
+        self.assertIs(serializer.render("chapters", chapters), first)
+        self.assertEqual(serializer.memo.hits, 1)
+
+        chapters["Intro"]["content"] = "rewritten"
+        self.assertEqual(serializer.render("chapters", chapters), '{"Intro":{"content":"rewritten"}}')
+
+    def test_memo_snapshot_shares_leaves_and_skips_mutable_ones(self):
+        memo = RenderMemo()
+        serializer = ArgumentSerializer(memo=memo)
+        content = "text " * 100
+        chapters = {"Intro": {"content": content}}
+        serializer.render("chapters", chapters)
+        _, snapshot, _ = next(iter(memo._entries.values()))
+        self.assertIsNot(snapshot["Intro"], chapters["Intro"])
+        self.assertIs(snapshot["Intro"]["content"], content)
+
+        class Note:
+            def __str__(self):
+                return "note"
+
+        serializer.render("notes", {"a": Note()})
+        self.assertEqual(len(memo._entries), 1)
+
+    def test_configure_renders_structured_arguments(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        llm = SmartLLM("fake", "fake-model")
+
+        @llm.configure("Refine this structure: {structure}")
+        def improve_structure(llm_response: str, structure: dict) -> str:
+            return llm_response
+
+        improve_structure(structure={"title": "AI", "chapters": ["a", "b"]})
+        self.assertEqual(llm.driver.prompts[-1], 'Refine this structure: {"chapters":["a","b"],"title":"AI"}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+from pydantic import BaseModel
+from smartllm import SmartLLM
+from smartllm.context import get_call_context
+from smartllm.driver_factory import DriverFactory
+from smartllm.middleware import Middleware
+from smartllm.serving import create_app
+from fake_driver import FakeDriver, RecordingClient
+
+
+class Titles(BaseModel):
+    titles: List[str]
+
+
+async def request(app, method: str, path: str, body=None, query: bytes = b"", headers=()):
+    """Drive the ASGI app directly and collect the status, headers and body it sends."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers)}
+    await app(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    return sent[0]["status"], headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+class EndlessStream:
+    """An OpenAI chunk stream that keeps producing text until it is closed."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.closed = False
+
+    def __iter__(self):
+        while not self.closed and self.chunks < 500:
+            self.chunks += 1
+            time.sleep(0.005)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="word "))], usage=None)
+
+    def close(self):
+        self.closed = True
+
+
+async def disconnecting_stream(app, path: str, body, messages: int = 0):
+    """Start a streaming call whose client goes away after receiving `messages` ASGI messages."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode()}
+
+    async def send(message):
+        if len(sent) == messages:
+            raise OSError("client disconnected")
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"stream=true", "headers": []}
+    await app(scope, receive, send)
+
+
+class TestServing(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = lambda prompt: {"titles": ["A", "B"]} if "Titles" in prompt else "once upon a time"
+
+        @self.llm.configure("Titles about {topic}")
+        def generate_titles(titles: Titles, topic: str, count: int = 2) -> List[str]:
+            """Suggest titles for a topic."""
+            return titles.titles[:count]
+
+        @self.llm.configure("Write a story about {topic}")
+        def write_story(story: str, topic: str) -> str:
+            return story
+
+        self.app = create_app(self.llm, max_concurrency=1, max_queue=0)
+
+    def test_function_call_returns_json(self):
+        status, headers, body = asyncio.run(request(self.app, "POST", "/functions/generate_titles", {"topic": "AI"}))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"application/json")
+        self.assertEqual(json.loads(body), {"result": ["A", "B"]})
+
+    def test_schema_is_derived_from_signature(self):
+        status, _, body = asyncio.run(request(self.app, "GET", "/functions/generate_titles"))
+        schema = json.loads(body)
+        self.assertEqual(status, 200)
+        self.assertEqual(schema["request"]["required"], ["topic"])
+        self.assertEqual(schema["request"]["properties"]["count"]["default"], 2)
+        self.assertEqual(schema["response"]["type"], "array")
+        self.assertIn("titles", schema["response_format"]["properties"])
+        self.assertEqual(schema["description"], "Suggest titles for a topic.")
+
+    def test_invalid_arguments_are_rejected(self):
+        status, _, body = asyncio.run(request(self.app, "POST", "/functions/generate_titles", {"count": "many"}))
+        self.assertEqual(status, 422)
+        self.assertEqual({e["loc"][0] for e in json.loads(body)["detail"]}, {"topic", "count"})
+
+    def test_unknown_function(self):
+        status, _, _ = asyncio.run(request(self.app, "POST", "/functions/missing", {}))
+        self.assertEqual(status, 404)
+
+    def test_full_queue_returns_429(self):
+        release = threading.Event()
+        self.llm.driver.reply = lambda prompt: release.wait(5) and "done"
+
+        async def main():
+            first = asyncio.create_task(request(self.app, "POST", "/functions/write_story", {"topic": "a"}))
+            while self.app.in_flight == 0:
+                await asyncio.sleep(0.01)
+            rejected = await request(self.app, "POST", "/functions/write_story", {"topic": "b"})
+            release.set()
+            return rejected, await first
+
+        (status, headers, _), (first_status, _, _) = asyncio.run(main())
+        self.assertEqual(status, 429)
+        self.assertEqual(headers[b"retry-after"], b"1")
+        self.assertEqual(first_status, 200)
+        self.assertEqual(self.app.rejected, 1)
+
+    def test_priority_header_is_honoured_only_when_enabled(self):
+        seen = []
+
+        class Recorder(Middleware):
+            def before(self, request):
+                seen.append(get_call_context().get("priority"))
+
+        self.llm.use(Recorder())
+        header = [(b"x-priority", b"interactive")]
+        asyncio.run(request(self.app, "POST", "/functions/write_story", {"topic": "a"}, headers=header))
+        trusted = create_app(self.llm, default_priority="batch", priority_header=True)
+        asyncio.run(request(trusted, "POST", "/functions/write_story", {"topic": "a"}))
+        asyncio.run(request(trusted, "POST", "/functions/write_story", {"topic": "a"}, headers=header))
+        self.assertEqual(seen, [None, "batch", "interactive"])
+
+    def test_client_disconnect_cancels_streaming_call(self):
+        release = threading.Event()
+        self.llm.driver.reply = lambda prompt: release.wait(5) and "too late"
+
+        async def main():
+            with self.assertRaises(OSError):
+                await disconnecting_stream(self.app, "/functions/write_story", {"topic": "a"})
+            await asyncio.sleep(0.05)
+            # Checked inside the loop, since asyncio.run cancels leftover tasks on the way out
+            pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            release.set()
+            return pending
+
+        self.assertEqual(asyncio.run(main()), [])
+        self.assertEqual(self.app.in_flight, 0)
+
+    def test_client_disconnect_closes_provider_stream(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            llm = SmartLLM("openai", "gpt-4o-mini", circuit_breaker=False)
+        stream = EndlessStream()
+        llm.driver.client = RecordingClient(stream)
+
+        @llm.configure("Write a story about {topic}")
+        def write_story(story: str, topic: str) -> str:
+            return story
+
+        app = create_app(llm)
+
+        async def main():
+            with self.assertRaises(OSError):
+                # The response start and the first delta get through
+                await disconnecting_stream(app, "/functions/write_story", {"topic": "a"}, messages=2)
+            for _ in range(200):
+                if stream.closed:
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        self.assertTrue(stream.closed)
+        self.assertLess(stream.chunks, 500)
+
+    def test_streams_deltas_as_server_sent_events(self):
+        status, headers, body = asyncio.run(
+            request(self.app, "POST", "/functions/write_story", {"topic": "dragons"}, query=b"stream=true"))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"text/event-stream")
+        events = [chunk.split("\n") for chunk in body.decode().strip().split("\n\n")]
+        deltas = [json.loads(data[6:])["text"] for event, data in events if event == "event: delta"]
+        self.assertEqual("".join(deltas), "once upon a time")
+        self.assertEqual(events[-1][0], "event: result")
+        self.assertEqual(json.loads(events[-1][1][6:]), {"result": "once upon a time"})
+
+
+if __name__ == '__main__':
+    unittest.main()
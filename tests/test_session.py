@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import OpenAIDriver
+from smartllm.session import Session
+from fake_driver import FakeDriver, RecordingClient
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = lambda prompt: f"reply to {prompt}"
+
+        @self.llm.configure("Write chapter {number}")
+        def write_chapter(content: str, number: int) -> str:
+            return content
+
+        self.write_chapter = write_chapter
+
+    def test_calls_in_session_share_history(self):
+        with self.llm.session() as session:
+            self.write_chapter(number=1)
+            self.write_chapter(number=2)
+        self.write_chapter(number=3)
+        self.assertEqual(self.llm.driver.histories[0], [])
+        self.assertEqual(self.llm.driver.histories[1], [
+            {"role": "user", "content": "Write chapter 1"},
+            {"role": "assistant", "content": "reply to Write chapter 1"},
+        ])
+        self.assertEqual(self.llm.driver.histories[2], [])
+        self.assertEqual(len(session.turns), 4)
+
+    def test_errors_are_not_recorded(self):
+        self.llm.driver.reply = "Error: provider unavailable"
+        session = self.llm.session()
+        session.generate("Hello")
+        self.assertEqual(session.turns, [])
+
+    def test_compacts_older_turns_in_background(self):
+        summaries = []
+
+        def summarizer(summary, turns):
+            summaries.append([turn["content"] for turn in turns])
+            return "chapters 1-2 written"
+
+        session = self.llm.session(max_tokens=100, keep_recent=1, summarizer=summarizer)
+        for number in range(1, 4):
+            session.generate(f"Write chapter {number} " + "word " * 10)
+        session.wait()
+        self.assertEqual(session.compactions, 1)
+        self.assertEqual(len(summaries[0]), 4)
+        self.assertEqual(len(session.turns), 2)
+        history = session.messages()
+        self.assertIn("chapters 1-2 written", history[0]["content"])
+        self.assertTrue(history[2]["content"].startswith("Write chapter 3"))
+
+    def test_failed_compaction_keeps_history(self):
+        session = self.llm.session(max_tokens=1, summarizer=lambda summary, turns: "Error: rate limited")
+        for number in range(3):
+            session.generate(f"Question {number}")
+        session.wait()
+        self.assertEqual(session.compactions, 0)
+        self.assertEqual(len(session.turns), 6)
+
+    def test_summarizer_call_is_not_part_of_session(self):
+        self.llm.driver.reply = lambda prompt: "short summary" if prompt.startswith("Summarize") else "answer"
+        session = self.llm.session(keep_recent=1)
+        session.generate("First question")
+        session.generate("Second question")
+        session.compact()
+        self.assertEqual(session.summary, "short summary")
+        self.assertEqual([turn.content for turn in session.turns], ["Second question", "answer"])
+
+    def test_session_round_trips_through_file(self):
+        session = self.llm.session(name="book", keep_recent=1, summarizer=lambda summary, turns: "so far")
+        session.generate("First question")
+        session.generate("Second question")
+        session.compact()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.json")
+            session.save(path)
+            restored = Session.load(self.llm, path)
+        self.assertEqual(restored.name, "book")
+        self.assertEqual(restored.messages(), session.messages())
+        self.assertEqual(restored.tokens, session.tokens)
+
+    def test_edit_mode_call_records_one_exchange_with_final_text(self):
+        @self.llm.configure("Revise: {text}", edit_param="text")
+        def revise(revised: str, text: str) -> str:
+            return revised
+
+        replies = iter([{"edits": [{"search": "owl", "replace": "hawk"}]}])
+        self.llm.driver.reply = lambda prompt: next(replies)
+        with self.llm.session() as session:
+            revise(text="an owl story")
+        self.assertEqual([turn.content for turn in session.turns], ["Revise: an owl story", "an hawk story"])
+
+    def test_prompt_argument_named_messages_is_not_history(self):
+        @self.llm.configure("Summarize these messages: {messages}")
+        def summarize(llm_response: str, messages: list) -> str:
+            return llm_response
+
+        argument = [{"role": "user", "content": "injected"}]
+        summarize(messages=argument)
+        with self.llm.session():
+            self.write_chapter(number=1)
+            summarize(messages=argument)
+        self.assertEqual(self.llm.driver.histories[0], [])
+        self.assertEqual(self.llm.driver.histories[2], [
+            {"role": "user", "content": "Write chapter 1"},
+            {"role": "assistant", "content": "reply to Write chapter 1"},
+        ])
+        self.assertIn("injected", self.llm.driver.prompts[2])
+
+    def test_session_is_shared_across_threads(self):
+        session = self.llm.session()
+
+        def call(number):
+            with session:
+                self.write_chapter(number=number)
+
+        threads = [threading.Thread(target=call, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(session.turns), 8)
+
+
+class TestDriverHistory(unittest.TestCase):
+    def test_openai_sends_history_before_prompt(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o-mini", circuit_breaker=False)
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+        driver.client = RecordingClient(SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=usage))
+        history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+        driver.generate("Next", messages=history)
+        messages = driver.client.requests[0]["messages"]
+        self.assertEqual(messages[1:3], history)
+        self.assertEqual(messages[-1]["role"], "user")
+        self.assertTrue(messages[-1]["content"].startswith("Next"))
+
+
+if __name__ == '__main__':
+    unittest.main()
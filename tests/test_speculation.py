@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.speculation import Speculator, text_similarity
+from fake_driver import FakeDriver
+
+
+class TestSpeculation(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = lambda prompt: f"outline after: {prompt}"
+
+        @self.llm.configure("Update the global outline with the new chapter: {new_chapter}")
+        def update_global_outline(llm_response: str, new_chapter: str) -> str:
+            return llm_response
+
+        self.update_global_outline = update_global_outline
+        self.speculator = Speculator(threshold=0.8)
+
+    def tearDown(self):
+        self.speculator.shutdown()
+
+    def test_similar_input_reuses_speculative_result(self):
+        draft = "Chapter one explains how bias enters machine learning systems through training data and labels."
+        final = "Chapter one explains how bias enters machine learning systems through the training data and labels."
+        speculation = self.speculator.speculate(self.update_global_outline, new_chapter=draft)
+        result = speculation.resolve(new_chapter=final)
+
+        self.assertTrue(speculation.hit)
+        self.assertIn(draft, result)
+        self.assertEqual(self.llm.driver.calls, 1)
+        self.assertEqual(self.speculator.stats.hit_rate, 1.0)
+        self.assertEqual(self.llm.function_calls, {"test_similar_input_reuses_speculative_result": ["update_global_outline"]})
+
+    def test_changed_input_reruns(self):
+        speculation = self.speculator.speculate(self.update_global_outline, new_chapter="bias in training data")
+        result = speculation.resolve(new_chapter="a completely different chapter about regulation")
+
+        self.assertFalse(speculation.hit)
+        self.assertIn("regulation", result)
+        self.assertEqual(self.llm.driver.calls, 2)
+        self.assertEqual(self.speculator.stats.misses, 1)
+
+    def test_waste_is_the_speculative_call_own_run_time(self):
+        speculator = Speculator(threshold=0.99)
+        fn = lambda text: time.sleep(0.05) or text
+        speculation = speculator.speculate(fn, text="a b c")
+        time.sleep(0.3)
+        speculation.resolve(text="x y z")
+        speculator.shutdown()
+        self.assertGreaterEqual(speculator.stats.wasted_seconds, 0.05)
+        self.assertLess(speculator.stats.wasted_seconds, 0.2)
+
+    def test_session_keeps_only_the_exchange_resolve_returns(self):
+        with self.llm.session() as session:
+            miss = self.speculator.speculate(self.update_global_outline, new_chapter="bias in training data")
+            miss.resolve(new_chapter="a completely different chapter about regulation")
+            hit = self.speculator.speculate(self.update_global_outline, new_chapter="privacy by design")
+            hit.resolve(new_chapter="privacy by design")
+        prompts = [turn.content for turn in session.turns if turn.role == "user"]
+        self.assertEqual(prompts, [
+            "Update the global outline with the new chapter: a completely different chapter about regulation",
+            "Update the global outline with the new chapter: privacy by design",
+        ])
+        self.assertEqual(self.llm.driver.histories[-1][0]["content"], prompts[0])
+
+    def test_waste_budget_disables_speculation(self):
+        speculator = Speculator(threshold=0.99, waste_budget=1)
+        calls = []
+        fn = lambda text: calls.append(threading.current_thread().name) or text
+        speculator.speculate(fn, text="a b c").resolve(text="x y z")
+        deferred = speculator.speculate(fn, text="a b c")
+        self.assertIsNone(deferred.future)
+        self.assertEqual(deferred.resolve(text="d e f"), "d e f")
+        self.assertEqual(speculator.stats.skipped, 1)
+        self.assertEqual(calls[-1], threading.current_thread().name)
+        speculator.shutdown()
+
+    def test_text_similarity(self):
+        self.assertEqual(text_similarity({"a": 1}, {"a": 1}), 1.0)
+        self.assertLess(text_similarity("alpha beta", "gamma delta"), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
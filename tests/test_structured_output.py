@@ -0,0 +1,89 @@
+import os
+import unittest
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import mock
+from pydantic import BaseModel, Field
+from smartllm.drivers import AnthropicDriver, OpenAIDriver
+from smartllm.schema import anthropic_tool, openai_response_format, strict_json_schema
+from fake_driver import RecordingClient
+
+
+class Section(BaseModel):
+    heading: str = Field(max_length=80)
+    format: Optional[str] = None
+
+
+class BlogOutline(BaseModel):
+    """Outline of a blog post."""
+    title: str = Field(description="Blog post title")
+    sections: List[Section]
+
+
+class TerminologyGlossary(BaseModel):
+    glossary: Dict[str, str]
+
+
+def openai_response(content, refusal=None):
+    message = SimpleNamespace(content=content, refusal=refusal)
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class TestSchemaTranslation(unittest.TestCase):
+    def test_strict_schema_closes_objects_and_drops_unsupported_keywords(self):
+        schema, strict = strict_json_schema(BlogOutline)
+        section = schema["$defs"]["Section"]
+        self.assertTrue(strict)
+        self.assertEqual(section["required"], ["heading", "format"])
+        self.assertFalse(section["additionalProperties"])
+        self.assertNotIn("maxLength", section["properties"]["heading"])
+        self.assertIn("format", section["properties"])
+
+    def test_free_form_dicts_fall_back_to_non_strict(self):
+        self.assertFalse(openai_response_format(TerminologyGlossary)["json_schema"]["strict"])
+
+    def test_translations_are_cached(self):
+        self.assertIs(openai_response_format(BlogOutline), openai_response_format(BlogOutline))
+        self.assertEqual(anthropic_tool(BlogOutline)["description"], "Outline of a blog post.")
+
+
+class TestNativeStructuredOutput(unittest.TestCase):
+    def test_openai_sends_json_schema_without_prompt_instructions(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o", structured_output="native")
+        driver.client = RecordingClient(openai_response('{"title": "AI", "sections": [{"heading": "Intro", "format": null}]}'))
+
+        result = driver.generate("Outline a post about AI", response_format=BlogOutline)
+        request = driver.client.requests[0]
+        self.assertEqual(result, BlogOutline(title="AI", sections=[Section(heading="Intro")]))
+        self.assertEqual(request["response_format"]["type"], "json_schema")
+        self.assertEqual(request["messages"][-1]["content"], "Outline a post about AI")
+
+    def test_openai_refusal_is_reported_as_error(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o", structured_output="native")
+        driver.client = RecordingClient(openai_response(None, refusal="I can't help with that"))
+        self.assertTrue(driver.generate("x", response_format=BlogOutline).startswith("Error"))
+
+    def test_anthropic_forces_tool_call_and_returns_model(self):
+        with mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test"}):
+            driver = AnthropicDriver("claude-3-5-sonnet-20240620")
+        tool_use = SimpleNamespace(type="tool_use", input={"title": "AI", "sections": []})
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        driver.client = RecordingClient(SimpleNamespace(content=[tool_use], usage=usage))
+
+        result = driver.generate("Outline a post about AI", response_format=BlogOutline, structured_output="native")
+        request = driver.client.requests[0]
+        self.assertEqual(result, BlogOutline(title="AI", sections=[]))
+        self.assertEqual(request["tool_choice"], {"type": "tool", "name": "BlogOutline"})
+        self.assertEqual(request["messages"], [{"role": "user", "content": "Outline a post about AI"}])
+
+    def test_unknown_mode_is_rejected(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            with self.assertRaises(ValueError):
+                OpenAIDriver("gpt-4o", structured_output="magic")
+
+
+if __name__ == '__main__':
+    unittest.main()
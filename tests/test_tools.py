@@ -0,0 +1,154 @@
+import json
+import os
+import time
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+from smartllm import SmartLLM
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers import AnthropicDriver, OpenAIDriver
+from smartllm.tools import ToolCall, ToolSet
+from fake_driver import FakeDriver, RecordingClient
+
+
+def openai_response(content=None, tool_calls=None):
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def openai_tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def anthropic_response(*blocks):
+    usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+    return SimpleNamespace(content=list(blocks), usage=usage)
+
+
+class TestToolSet(unittest.TestCase):
+    def setUp(self):
+        self.tools = ToolSet()
+        self.lookups = []
+
+        def lookup_term(term: str, limit: int = 3) -> List[str]:
+            """Look up a glossary term."""
+            self.lookups.append(term)
+            time.sleep(0.2)
+            return [term.upper()] * limit
+
+        self.lookup = self.tools.register(lookup_term)
+
+    def test_schema_is_derived_from_signature_and_cached(self):
+        schema = self.lookup.openai_schema()["function"]
+        self.assertEqual(schema["name"], "lookup_term")
+        self.assertEqual(schema["description"], "Look up a glossary term.")
+        self.assertEqual(set(schema["parameters"]["properties"]), {"term", "limit"})
+        self.assertIs(self.tools.openai_tools()[0], self.tools.openai_tools()[0])
+        self.assertEqual(self.lookup.anthropic_schema()["input_schema"]["required"], ["term"])
+
+    def test_calls_in_one_turn_run_concurrently(self):
+        calls = [ToolCall(str(i), "lookup_term", json.dumps({"term": f"t{i}", "limit": 1})) for i in range(4)]
+        started = time.perf_counter()
+        results = self.tools.run(calls)
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual([r.content for r in results], ['["T0"]', '["T1"]', '["T2"]', '["T3"]'])
+        self.assertEqual([r.call_id for r in results], ["0", "1", "2", "3"])
+
+    def test_results_are_cached_per_arguments(self):
+        self.tools.run([ToolCall("1", "lookup_term", {"term": "a", "limit": 1})])
+        result = self.tools.run([ToolCall("2", "lookup_term", '{"limit": 1, "term": "a"}')])[0]
+        self.assertEqual((result.call_id, result.content), ("2", '["A"]'))
+        self.assertEqual(self.lookups, ["a"])
+        self.assertEqual(self.tools.stats.cache_hits, 1)
+
+    def test_timeouts_and_errors_are_reported_to_the_model(self):
+        self.lookup.timeout = 0.05
+        timed_out, invalid, unknown = self.tools.run([
+            ToolCall("1", "lookup_term", {"term": "slow"}),
+            ToolCall("2", "lookup_term", {"limit": 2}),
+            ToolCall("3", "missing", {}),
+        ])
+        self.assertTrue(timed_out.is_error and "timed out" in timed_out.content)
+        self.assertTrue(invalid.is_error and "term" in invalid.content)
+        self.assertTrue(unknown.is_error)
+        self.assertEqual((self.tools.stats.timeouts, self.tools.stats.errors), (1, 2))
+
+
+class TestToolCalling(unittest.TestCase):
+    def setUp(self):
+        self.tools = ToolSet()
+        self.tools.register(lambda city: f"sunny in {city}", name="weather", description="Current weather")
+        self.tools.register(lambda city: f"12:00 in {city}", name="local_time", description="Current time")
+
+    def test_openai_runs_tool_calls_then_answers(self):
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o-mini", circuit_breaker=False)
+        driver.client = RecordingClient(
+            openai_response(tool_calls=[openai_tool_call("a", "weather", city="Rome"),
+                                        openai_tool_call("b", "local_time", city="Rome")]),
+            openai_response(content="Sunny, noon."),
+        )
+        self.assertEqual(driver.generate("Weather and time in Rome?", tools=self.tools), "Sunny, noon.")
+        first, second = driver.client.requests
+        self.assertEqual([t["function"]["name"] for t in first["tools"]], ["weather", "local_time"])
+        self.assertEqual([m["role"] for m in second["messages"][-3:]], ["assistant", "tool", "tool"])
+        self.assertEqual(second["messages"][-2], {"role": "tool", "tool_call_id": "a", "content": "sunny in Rome"})
+
+    def test_openai_stops_calling_tools_after_max_rounds(self):
+        self.tools.max_rounds = 1
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            driver = OpenAIDriver("gpt-4o-mini", circuit_breaker=False)
+        driver.client = RecordingClient(openai_response(tool_calls=[openai_tool_call("a", "weather", city="Rome")]),
+                                        openai_response(content="done"))
+        driver.generate("Weather?", tools=self.tools)
+        self.assertEqual(driver.client.requests[-1]["tool_choice"], "none")
+
+    def test_anthropic_native_output_after_tool_calls(self):
+        from pydantic import BaseModel
+
+        class Forecast(BaseModel):
+            summary: str
+
+        with mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test"}):
+            driver = AnthropicDriver("claude-3-5-haiku-latest", structured_output="native", circuit_breaker=False)
+        driver.client = RecordingClient(
+            anthropic_response(SimpleNamespace(type="tool_use", id="t1", name="weather", input={"city": "Oslo"})),
+            anthropic_response(SimpleNamespace(type="tool_use", id="t2", name="Forecast", input={"summary": "sunny"})),
+        )
+        result = driver.generate("Forecast for Oslo", response_format=Forecast, tools=self.tools)
+        self.assertEqual(result, Forecast(summary="sunny"))
+        first, second = driver.client.requests
+        self.assertEqual(first["tool_choice"], {"type": "any"})
+        self.assertEqual([t["name"] for t in first["tools"]], ["weather", "local_time", "Forecast"])
+        tool_result = second["messages"][-1]["content"][0]
+        self.assertEqual((tool_result["tool_use_id"], tool_result["content"]), ("t1", "sunny in Oslo"))
+
+    def test_registered_tools_reach_the_driver(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        llm = SmartLLM("fake", "fake-model")
+        seen = []
+        llm.driver.generate = lambda prompt, **kwargs: seen.append(kwargs.get("tools")) or "ok"
+        llm.generate("No tools yet")
+
+        @llm.tool(timeout=5)
+        def glossary(term: str) -> str:
+            """Definition of a term."""
+            return term
+
+        llm.generate("Define a term")
+        self.assertIsNone(seen[0])
+        self.assertIs(seen[1], llm.tools)
+        self.assertEqual(glossary.tool.timeout, 5)
+
+        @llm.configure("Pick the best of {tools}")
+        def pick(llm_response: str, tools: List[str]) -> str:
+            return llm_response
+
+        pick(tools=["hammer", "saw"])
+        self.assertIs(seen[2], llm.tools)
+
+
+if __name__ == '__main__':
+    unittest.main()
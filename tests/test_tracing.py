@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import unittest
+from smartllm import SmartLLM, tracing
+from smartllm.driver_factory import DriverFactory
+from smartllm.tracing import InMemoryExporter, JSONLExporter, critical_path, format_report, load_spans
+from fake_driver import FakeDriver
+
+
+def slow_reply(prompt):
+    time.sleep(0.01)
+    return f"text for {prompt}"
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "fake-model")
+        self.llm.driver.reply = slow_reply
+        self.exporter = InMemoryExporter()
+        tracing.enable(self.exporter)
+
+        @self.llm.configure("Write chapter {title}")
+        def write_chapter(llm_response: str, title: str) -> str:
+            return llm_response
+
+        @self.llm.configure("Review {chapter}")
+        def review_chapter(llm_response: str, chapter: str) -> str:
+            return llm_response
+
+        @tracing.traced
+        def create_book():
+            first = write_chapter(title="one")
+            second = write_chapter(title="two")
+            review_chapter(chapter=first)
+            review_chapter(chapter=second)
+
+        self.create_book = create_book
+
+    def tearDown(self):
+        tracing.tracer.clear()
+
+    def test_spans_nest_under_caller(self):
+        self.create_book()
+        by_kind = {}
+        for span in self.exporter.spans:
+            by_kind.setdefault(span.kind, []).append(span)
+        workflow = by_kind["workflow"][0]
+        self.assertEqual(len(by_kind["function"]), 4)
+        self.assertTrue(all(s.parent_id == workflow.span_id for s in by_kind["function"]))
+        functions = {s.span_id for s in by_kind["function"]}
+        client = by_kind["client"][0]
+        self.assertIn(client.parent_id, functions)
+        self.assertEqual(client.attributes["model"], "fake-model")
+        self.assertGreater(client.attributes["output_tokens"], 0)
+        self.assertIn("queue_wait", client.attributes)
+
+    def test_critical_path_follows_data_dependencies(self):
+        self.create_book()
+        result = critical_path(self.exporter.spans)
+        self.assertEqual([s.name for s in result["path"]], ["write_chapter", "review_chapter"])
+        self.assertGreater(result["parallelism"], 1.5)
+
+    def test_jsonl_round_trip_and_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            tracing.enable(JSONLExporter(path))
+            self.create_book()
+            spans = load_spans(path)
+            self.assertEqual(len(spans), len(self.exporter.spans))
+            report = format_report(spans)
+            self.assertIn("create_book", report)
+            self.assertIn("Available parallelism", report)
+
+    def test_otlp_format(self):
+        self.create_book()
+        otlp = self.exporter.spans[0].to_otlp()
+        self.assertEqual(len(otlp["traceId"]), 32)
+        self.assertTrue(otlp["startTimeUnixNano"].isdigit())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from smartllm import SmartLLM, BudgetExceededError, track_run
+from smartllm.driver_factory import DriverFactory
+from smartllm.drivers.base import Usage
+from smartllm.usage import OLDER_RUNS, ModelPrice, UsageTracker, cost_of, price_for
+from fake_driver import FakeDriver
+
+
+class TestUsageAccounting(unittest.TestCase):
+    def setUp(self):
+        DriverFactory.register_driver("fake", FakeDriver)
+        self.llm = SmartLLM("fake", "gpt-4o-mini")
+        self.llm.driver.reply = "one two three four"
+
+        @self.llm.configure("Write about {topic}")
+        def write(llm_response: str, topic: str) -> str:
+            return llm_response
+
+        @self.llm.configure("Review {text}")
+        def review(llm_response: str, text: str) -> str:
+            return llm_response
+
+        self.write, self.review = write, review
+
+    def test_prices_match_by_longest_prefix(self):
+        self.assertEqual(price_for("gpt-4o-mini-2024-07-18").input, 0.15)
+        self.assertEqual(price_for("gpt-4o-2024-08-06").input, 2.50)
+        self.assertIsNone(price_for("unknown-model"))
+
+    def test_cached_tokens_are_discounted(self):
+        prices = {"m": ModelPrice(input=10.0, output=20.0, cached_input=1.0)}
+        usage = Usage(model="m", input_tokens=1_000_000, output_tokens=500_000, cached_tokens=400_000)
+        self.assertAlmostEqual(cost_of(usage, prices), 6.0 + 0.4 + 10.0)
+
+    def test_usage_is_attributed_to_function_caller_and_run(self):
+        with track_run("book-1") as run:
+            self.write(topic="AI")
+            self.write(topic="ethics")
+            self.review(text="draft")
+
+        by_function = self.llm.usage.summary(by="function")
+        self.assertEqual(by_function["write"]["calls"], 2)
+        self.assertEqual(by_function["review"]["output_tokens"], 4)
+        self.assertEqual(set(self.llm.usage.summary(by="caller")), {"test_usage_is_attributed_to_function_caller_and_run"})
+        self.assertEqual(self.llm.usage.total(run="book-1")["calls"], 3)
+        self.assertAlmostEqual(run.spent, self.llm.usage.total()["cost"])
+
+    def test_totals_outlive_the_retained_records(self):
+        tracker = UsageTracker(max_records=2)
+        for _ in range(3):
+            tracker.record(Usage(model="gpt-4o-mini", input_tokens=10, output_tokens=5))
+        self.assertEqual(len(tracker.query()), 2)
+        self.assertEqual(tracker.total()["calls"], 3)
+        self.assertEqual(tracker.summary(by="model", model="gpt-4o-mini")["gpt-4o-mini"]["input_tokens"], 30)
+
+    def test_old_runs_are_merged_beyond_max_runs(self):
+        tracker = UsageTracker(max_runs=2)
+        for run_id in ("a", "b", "a", "c"):
+            with track_run(run_id):
+                tracker.record(Usage(model="gpt-4o-mini", input_tokens=10, output_tokens=5))
+        by_run = tracker.summary(by="run")
+        self.assertEqual(set(by_run), {"a", "c", OLDER_RUNS})
+        self.assertEqual(by_run["a"]["calls"], 2)
+        self.assertEqual(tracker.total()["calls"], 4)
+
+    def test_cache_writes_are_totalled(self):
+        tracker = UsageTracker()
+        tracker.record(Usage(model="claude-3-5-haiku", input_tokens=100, cache_write_tokens=80))
+        tracker.record(Usage(model="claude-3-5-haiku", input_tokens=100, cached_tokens=80))
+        self.assertEqual(tracker.total()["cache_write_tokens"], 80)
+        self.assertEqual(tracker.summary(by="model")["claude-3-5-haiku"]["cache_write_tokens"], 80)
+
+    def test_budget_stops_further_calls(self):
+        with track_run(budget=1e-9):
+            self.write(topic="AI")
+            with self.assertRaises(BudgetExceededError):
+                self.write(topic="more AI")
+        self.assertEqual(self.llm.driver.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()